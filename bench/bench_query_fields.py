@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2020 James Boyden <jboy@jboy.me>. All rights reserved.
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Benchmark `query_fields` for typical `oomps` invocations, at scale.
+
+A synthetic proc-filesystem of N fake processes is generated in a temporary
+directory (with the per-process files that `psquery` reads, plus the system-
+wide files for the header info), and `psquery` is pointed at it by
+`api.set_procfs_path`.  So the results don't depend upon the processes that
+happen to be running on the host, and the number of processes can be much
+larger than on any real host.
+
+The fake processes are generated from a fixed random seed, so that the same
+tree is generated for each run (& each commit) of this benchmark.
+
+The results are printed as JSON (to stdout, or to the file of `--output`),
+including the git commit of this repo, so that the results can be compared
+across commits.
+
+Usage:
+    python3 bench/bench_query_fields.py [-r NUM_REPEATS] [-o OUTPUT] [NUM_PROCS ...]
+
+The default NUM_PROCS are 10000, 50000 & 100000.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+from glob import glob
+from time import perf_counter, time
+
+# Allow this script to be run from anywhere, without installing `psquery`.
+_REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _REPO_DIR)
+
+from psquery import api
+
+
+_DEFAULT_NUM_PROCS = (10000, 50000, 100000)
+_DEFAULT_NUM_REPEATS = 3
+_RANDOM_SEED = 20200101
+
+# The default fields of `oomps`.
+_DEFAULT_FIELDS = "user pid ppid start dtime vszh adj ooms cmds".split()
+
+# The fake processes are started in the 2 days since the (fake) boot-time.
+_UPTIME_SECS = 2 * 86400
+_MEM_TOTAL_KiB = 16 << 20
+_SWAP_TOTAL_KiB = 4 << 20
+
+
+## Generate a synthetic proc-filesystem.
+
+def _get_host_tty_nrs():
+    """Return the device numbers of (some of) the terminals of this host.
+
+    The terminal of a process is looked-up in the real "/dev", so the fake
+    processes must use device numbers that exist in the real "/dev".
+    """
+    tty_nrs = []
+    for name in sorted(glob("/dev/pts/*")) + sorted(glob("/dev/tty[0-9]*")):
+        try:
+            tty_nrs.append(os.stat(name).st_rdev)
+        except OSError:
+            pass
+    return tty_nrs[:8]
+
+
+def _write_file(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _write_system_files(procfs_path):
+    os.makedirs(os.path.join(procfs_path, "sys", "vm"))
+    os.makedirs(os.path.join(procfs_path, "self"))
+    _write_file(os.path.join(procfs_path, "stat"),
+            b"cpu  0 0 0 0 0 0 0 0 0 0\nbtime %d\n" % (int(time()) - _UPTIME_SECS))
+    _write_file(os.path.join(procfs_path, "meminfo"), b"".join(
+            b"%-16s%8d kB\n" % (key + b":", value) for key, value in (
+                (b"MemTotal", _MEM_TOTAL_KiB),
+                (b"MemFree", _MEM_TOTAL_KiB // 4),
+                (b"MemAvailable", _MEM_TOTAL_KiB // 2),
+                (b"Buffers", _MEM_TOTAL_KiB // 64),
+                (b"Cached", _MEM_TOTAL_KiB // 8),
+                (b"SwapCached", 0),
+                (b"Active", _MEM_TOTAL_KiB // 4),
+                (b"Inactive", _MEM_TOTAL_KiB // 8),
+                (b"Active(file)", _MEM_TOTAL_KiB // 16),
+                (b"Inactive(file)", _MEM_TOTAL_KiB // 16),
+                (b"SwapTotal", _SWAP_TOTAL_KiB),
+                (b"SwapFree", _SWAP_TOTAL_KiB // 2),
+                (b"Shmem", _MEM_TOTAL_KiB // 64),
+                (b"Slab", _MEM_TOTAL_KiB // 64),
+                (b"SReclaimable", _MEM_TOTAL_KiB // 128))))
+    _write_file(os.path.join(procfs_path, "vmstat"), b"pswpin 0\npswpout 0\n")
+    _write_file(os.path.join(procfs_path, "sys", "vm", "overcommit_memory"), b"0\n")
+    _write_file(os.path.join(procfs_path, "sys", "vm", "overcommit_ratio"), b"50\n")
+    # No cgroup2 mount, so no cgroup files will be read.
+    _write_file(os.path.join(procfs_path, "self", "mounts"), b"proc /proc proc rw 0 0\n")
+
+
+def _write_process_files(procfs_path, pid, ppid, uid, tty_nr, is_kernel_thread, rng):
+    dir_path = os.path.join(procfs_path, str(pid))
+    os.mkdir(dir_path)
+
+    if is_kernel_thread:
+        comm = b"kworker/%d:%d" % (pid % 64, pid % 3)
+        cmdline = b""
+        (size, resident, shared) = (0, 0, 0)
+        oom_score_adj = 0
+    else:
+        comm = rng.choice((b"bash", b"python3", b"chrome", b"sshd", b"postgres",
+                b"systemd", b"java-long-exe-name"))[:15]
+        cmdline = b"/usr/bin/%s\0--worker=%d\0" % (comm, pid)
+        size = rng.randrange(1000, 2000000)
+        resident = rng.randrange(100, max(size // 4, 101))
+        shared = rng.randrange(0, resident)
+        oom_score_adj = rng.choice((0, 0, 0, 0, 100, 200, 300, -500, -1000))
+        os.symlink("/usr/bin/%s" % os.fsdecode(comm), os.path.join(dir_path, "exe"))
+        os.symlink("/", os.path.join(dir_path, "cwd"))
+
+    start_ticks = rng.randrange(0, _UPTIME_SECS * os.sysconf("SC_CLK_TCK"))
+    utime = rng.randrange(0, 100000)
+    stime = rng.randrange(0, 10000)
+    #  $ man 5 proc  # then search for "/proc/[pid]/stat"
+    stat_fields = [b"S", ppid, pid, pid, tty_nr, -1, 0, 0, 0, 0, 0, utime, stime,
+            0, 0, 20, 0, 1, 0, start_ticks, size * 4096, resident] + [0] * 30
+    _write_file(os.path.join(dir_path, "stat"), b"%d (%s) %s\n" %
+            (pid, comm, b" ".join(v if isinstance(v, bytes) else b"%d" % v
+                for v in stat_fields)))
+    _write_file(os.path.join(dir_path, "statm"), b"%d %d %d %d 0 %d 0\n" %
+            (size, resident, shared, min(size, 100), size // 2))
+    status = [(b"Name", comm), (b"State", b"S (sleeping)"),
+            (b"PPid", b"%d" % ppid), (b"Uid", b"%d\t%d\t%d\t%d" % ((uid,) * 4)),
+            (b"Gid", b"%d\t%d\t%d\t%d" % ((uid,) * 4))]
+    if not is_kernel_thread:
+        status += [(b"VmSize", b"%8d kB" % (size * 4)),
+                (b"VmRSS", b"%8d kB" % (resident * 4)),
+                (b"RssAnon", b"%8d kB" % ((resident - shared) * 4)),
+                (b"VmPTE", b"%8d kB" % (size // 256)),
+                (b"VmSwap", b"%8d kB" % rng.choice((0, 0, 0, size // 8)))]
+    status.append((b"Threads", b"1"))
+    _write_file(os.path.join(dir_path, "status"),
+            b"".join(b"%s:\t%s\n" % kv for kv in status))
+    _write_file(os.path.join(dir_path, "cmdline"), cmdline)
+    _write_file(os.path.join(dir_path, "comm"), comm + b"\n")
+    _write_file(os.path.join(dir_path, "cgroup"), b"0::/\n")
+    _write_file(os.path.join(dir_path, "oom_score_adj"), b"%d\n" % oom_score_adj)
+    _write_file(os.path.join(dir_path, "oom_adj"), b"%d\n" % (oom_score_adj * 17 // 1000))
+    oom_score = 0 if (is_kernel_thread or oom_score_adj == -1000) else \
+            (1000 + resident * 1000 // (_MEM_TOTAL_KiB // 4)) * 2 // 3
+    _write_file(os.path.join(dir_path, "oom_score"), b"%d\n" % oom_score)
+
+
+def make_synthetic_procfs(procfs_path, num_procs, seed=_RANDOM_SEED):
+    """Generate a synthetic proc-filesystem of `num_procs` fake processes.
+
+    PID 1 is the init process & PID 2 is the parent of the kernel threads;
+    every other process is either a kernel thread, or a child of a random
+    earlier (user-space) process.
+    """
+    rng = random.Random(seed)
+    uids = (0, 0, os.getuid(), 1000, 1001, 65534)
+    tty_nrs = _get_host_tty_nrs()
+    _write_system_files(procfs_path)
+
+    user_pids = []
+    for pid in range(1, num_procs + 1):
+        if pid <= 2:
+            (ppid, uid, is_kernel_thread) = (0, 0, (pid == 2))
+        elif rng.random() < 0.1:
+            (ppid, uid, is_kernel_thread) = (2, 0, True)
+        else:
+            (ppid, uid, is_kernel_thread) = (rng.choice(user_pids), rng.choice(uids), False)
+        tty_nr = 0
+        if tty_nrs and not is_kernel_thread and rng.random() < 0.05:
+            tty_nr = rng.choice(tty_nrs)
+        if not is_kernel_thread:
+            user_pids.append(pid)
+        _write_process_files(procfs_path, pid, ppid, uid, tty_nr, is_kernel_thread, rng)
+
+
+## The typical `oomps` invocations, as the arguments of `query_fields`.
+
+def _get_invocations():
+    this_uid_criterion = api.ProcessUidEquals(os.getuid())
+    return (
+        ("oomps", dict(fields_to_query=_DEFAULT_FIELDS,
+                selection_criteria=(this_uid_criterion,))),
+        ("oomps %%", dict(fields_to_query=_DEFAULT_FIELDS)),
+        ("oomps -a", dict(fields_to_query=_DEFAULT_FIELDS,
+                selection_criteria=(api.ProcessHasTty(),))),
+        ("oomps -o", dict(fields_to_query=_DEFAULT_FIELDS,
+                selection_criteria=(this_uid_criterion,),
+                sort_by_fields=(api.SortByField("ooms"),))),
+        ("oomps -vA", dict(fields_to_query=_DEFAULT_FIELDS,
+                sort_by_fields=(api.SortByField("vszk"),))),
+        ("oomps -OA --top 10", dict(fields_to_query=_DEFAULT_FIELDS,
+                sort_by_fields=(api.SortByField("ooms", reverse=True),), limit=10)),
+        ("oomps -A --tree", dict(fields_to_query=_DEFAULT_FIELDS,
+                return_process_tree=True)),
+        ("oomps %% ==pid,vszh", dict(fields_to_query=["pid", "vszh"])),
+    )
+
+
+def _time_invocation(query_kwargs, num_repeats):
+    """Return `(list of secs per repeat, QueryStats of the last repeat)`."""
+    all_secs = []
+    for i in range(num_repeats):
+        time_start = perf_counter()
+        result = api.query_fields(return_field_types=True, return_header_info=True,
+                return_query_stats=True, **query_kwargs)
+        all_secs.append(perf_counter() - time_start)
+    return (all_secs, result[-1])
+
+
+def _get_git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=_REPO_DIR,
+                capture_output=True, check=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(all_num_procs=_DEFAULT_NUM_PROCS, num_repeats=_DEFAULT_NUM_REPEATS, output=None):
+    results = []
+    for num_procs in all_num_procs:
+        with tempfile.TemporaryDirectory(prefix="bench_procfs_") as procfs_path:
+            print("generating %d fake processes ..." % num_procs, file=sys.stderr)
+            time_start = perf_counter()
+            make_synthetic_procfs(procfs_path, num_procs)
+            print("generated in %.1f secs" % (perf_counter() - time_start), file=sys.stderr)
+
+            api.set_procfs_path(procfs_path)
+            try:
+                for name, query_kwargs in _get_invocations():
+                    (all_secs, query_stats) = _time_invocation(query_kwargs, num_repeats)
+                    best_secs = min(all_secs)
+                    print("%7d %-22s %8.3f secs  %6.2f us/process" % (num_procs, name,
+                            best_secs, best_secs * 1e6 / num_procs), file=sys.stderr)
+                    results.append(dict(
+                            num_procs=num_procs,
+                            invocation=name,
+                            best_secs=best_secs,
+                            all_secs=all_secs,
+                            us_per_process=(best_secs * 1e6 / num_procs),
+                            num_processes_selected=query_stats.num_processes_selected,
+                            num_files_opened=query_stats.num_files_opened,
+                            select_secs=query_stats.select_secs,
+                            extract_secs=query_stats.extract_secs))
+            finally:
+                api.set_procfs_path("/proc")
+
+    report = dict(
+            benchmark="query_fields",
+            git_commit=_get_git_commit(),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            num_repeats=num_repeats,
+            results=results)
+    if output is None:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+            description="Benchmark `query_fields` with a synthetic proc-filesystem.")
+    parser.add_argument("num_procs", metavar="NUM_PROCS", type=int, nargs="*",
+            default=list(_DEFAULT_NUM_PROCS),
+            help="the numbers of fake processes (default: 10000 50000 100000)")
+    parser.add_argument("-r", "--repeats", type=int, default=_DEFAULT_NUM_REPEATS,
+            help="the number of repeats of each query (default: %d)" % _DEFAULT_NUM_REPEATS)
+    parser.add_argument("-o", "--output", metavar="FILE",
+            help="write the JSON results to FILE (default: stdout)")
+    args = parser.parse_args()
+    main(args.num_procs, args.repeats, args.output)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2020 James Boyden <jboy@jboy.me>. All rights reserved.
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Micro-benchmark the per-process cost of building the rows of a query.
+
+Compare the generic accessor interpreter (`_get_field_value`, called for each
+field) against the row-builder function generated per-query by
+`_compile_row_builder`.
+
+The process attributes are read from "/proc" just once, before timing, so
+that only the cost of building the rows is measured.
+
+Usage:
+    python3 bench/bench_row_builder.py [NUM_REPEATS]
+"""
+
+import os
+import sys
+from time import perf_counter
+
+# Allow this script to be run from anywhere, without installing `psquery`.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from psquery import api
+from psquery._fields import get_post_proc_settings
+from psquery._procio import ProcReader
+
+
+# The default fields of `oomps`.
+_FIELDS = "user pid ppid start dtime vszh adj ooms cmds".split()
+
+
+def _build_rows_interpreted(compiled_query, attr_dicts, pps):
+    AllFields = compiled_query.AllFields
+    field_accessors = compiled_query.field_accessors
+    field_values = [None for field in field_accessors]
+    rows = []
+    for pid, attr_dict in attr_dicts:
+        for field_idx, field_accessor in enumerate(field_accessors):
+            field_values[field_idx] = \
+                    api._get_field_value(field_accessor, attr_dict, pid, pps)
+        rows.append(AllFields(*field_values))
+    return rows
+
+
+def _build_rows_compiled(compiled_query, attr_dicts, pps):
+    build_all_fields = compiled_query.build_all_fields
+    return [build_all_fields(attr_dict, pid, pps, None)
+            for pid, attr_dict in attr_dicts]
+
+
+def _time_per_process(build_rows, compiled_query, attr_dicts, pps, num_repeats):
+    best_secs = None
+    for i in range(num_repeats):
+        time_start = perf_counter()
+        build_rows(compiled_query, attr_dicts, pps)
+        secs = perf_counter() - time_start
+        if best_secs is None or secs < best_secs:
+            best_secs = secs
+    return best_secs / len(attr_dicts)
+
+
+def main(num_repeats=200):
+    compiled_query = api._CompiledQuery(_FIELDS, (), ())
+    (attr_names, oom_attr_names) = compiled_query.extract_attr_names
+    pps = get_post_proc_settings()
+
+    reader = ProcReader()
+    attr_dicts = []
+    for pid in reader.list_pids():
+        try:
+            attr_dicts.append((pid,
+                    reader.snapshot(pid).get_attrs(attr_names, oom_attr_names)))
+        except ProcessLookupError:
+            continue
+
+    # Both must build exactly the same rows.
+    assert (_build_rows_interpreted(compiled_query, attr_dicts, pps) ==
+            _build_rows_compiled(compiled_query, attr_dicts, pps))
+
+    print("fields: %s" % ",".join(_FIELDS))
+    print("processes: %d, repeats: %d" % (len(attr_dicts), num_repeats))
+    results = []
+    for name, build_rows in (
+            ("interpreted", _build_rows_interpreted),
+            ("compiled", _build_rows_compiled)):
+        secs = _time_per_process(build_rows, compiled_query, attr_dicts, pps, num_repeats)
+        results.append(secs)
+        print("%-12s %8.2f us/process" % (name, secs * 1e6))
+    print("speed-up:    %8.2fx" % (results[0] / results[1]))
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
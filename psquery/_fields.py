@@ -9,9 +9,6 @@ from collections import namedtuple
 from time import localtime, strftime
 from time import time as utc_time_now
 
-# Use `_procio` to augment the capabilities of `psutil`.
-from ._procio import read_int_from_proc_pid
-
 
 ## Settings for the post-processing functions: named-tuple `PostProcSettings`
 
@@ -41,7 +38,13 @@ PostProcSettings = namedtuple("PostProcSettings", (
         "this_yday", "this_year",
         # Floating-point seconds since the epoch, in UTC, of right now.
         # Calculated and stored, when func `get_post_proc_settings` is called.
-        "utc_now"))
+        "utc_now",
+        # The memo caches of the formatting functions (a new `FormatCaches`
+        # for each `PostProcSettings`, because the formatted values depend
+        # upon the other settings, eg, `this_yday`).  This is the only mutable
+        # member, and the caches are NOT thread-safe:  each thread (or worker
+        # process) must use its own copy, from `with_new_format_caches`.
+        "format_caches"))
 
 
 def _get_human_size_units(use_base10_human_size=False):
@@ -59,6 +62,64 @@ def _get_human_size_units(use_base10_human_size=False):
     return (scale, denom, units, final)
 
 
+class FormatCache(object):
+    """A bounded memo cache for a single formatting function.
+
+    The cached formatting function `func` is called with the (truncated) key,
+    rather than with the original value; so the key must be truncated to the
+    resolution of the formatted value (eg, whole seconds for a date/time).
+
+    When the cache is full, it's emptied (rather than evicting entries one at
+    a time), which is cheap, and good enough for values that are clustered
+    (eg, thousands of processes started in the same second at boot).
+    """
+    __slots__ = ("func", "max_size", "num_hits", "num_misses", "_values")
+
+    def __init__(self, func, max_size):
+        self.func = func
+        self.max_size = max_size
+        self.num_hits = 0
+        self.num_misses = 0
+        self._values = {}
+
+    def get(self, key, pid, post_proc_settings):
+        """Return the formatted value for `key`, calling `func` on a cache miss."""
+        values = self._values
+        try:
+            value = values[key]
+        except KeyError:
+            pass
+        else:
+            self.num_hits += 1
+            return value
+
+        self.num_misses += 1
+        value = self.func(key, pid, post_proc_settings)
+        if len(values) >= self.max_size:
+            values.clear()
+        values[key] = value
+        return value
+
+
+class FormatCaches(object):
+    """The `FormatCache` memo caches of the formatting functions.
+
+    Only the date/time formatting functions are cached, because their keys
+    (whole seconds) are shared by many processes.  (Sizes in bytes are almost
+    never equal between processes, so a cache of them would almost never hit.)
+    """
+    __slots__ = ("date_time", "time_delta")
+
+    def __init__(self, max_size=4096):
+        self.date_time = FormatCache(_format_date_time_uncached, max_size)
+        self.time_delta = FormatCache(_format_time_delta_uncached, max_size)
+
+    def get_hits_and_misses(self):
+        """Return the total `(num_hits, num_misses)` of all the caches."""
+        caches = (self.date_time, self.time_delta)
+        return (sum(c.num_hits for c in caches), sum(c.num_misses for c in caches))
+
+
 def get_post_proc_settings(
         cmdline_sep=" ",
         use_base10_human_size=False):
@@ -76,17 +137,21 @@ def get_post_proc_settings(
             cmdline_sep,
             human_scale, human_denom, human_units, human_final,
             curr_date.tm_yday, curr_date.tm_year,
-            utc_now)
+            utc_now,
+            FormatCaches())
 
 
-## Field-accessor functions & post-processing functions:
-##  func(value, pid, post_proc_settings) -> value
+def with_new_format_caches(post_proc_settings):
+    """Return a copy of `post_proc_settings` with its own (empty) `FormatCaches`.
 
-def _read_int_from_proc(fname, default_int=None):
-    assert (default_int is None) or isinstance(default_int, int)
-    return read_int_from_proc_pid(fname, default_int)
+    The other settings are unchanged, so the formatted values are the same.
+    """
+    return post_proc_settings._replace(format_caches=FormatCaches())
 
 
+## Field-accessor functions & post-processing functions:
+##  func(value, pid, post_proc_settings) -> value
+
 def _bytes_to_kiB(num_bytes, pid, post_proc_settings):
     """Convert a number of bytes to the corresp number of "kibibytes" (kiB).
 
@@ -98,6 +163,33 @@ def _bytes_to_kiB(num_bytes, pid, post_proc_settings):
     return (num_bytes >> 10)
 
 
+def _bytes_to_kiB_or_none(num_bytes, pid, post_proc_settings):
+    """Convert bytes to kiB like `_bytes_to_kiB`, or `None` if not read (`None`)."""
+    if num_bytes is None:
+        return None
+    return (num_bytes >> 10)
+
+
+def _get_cgroup_current(cgroup_memory, pid, post_proc_settings):
+    return cgroup_memory.current
+
+
+def _get_cgroup_max(cgroup_memory, pid, post_proc_settings):
+    return cgroup_memory.max
+
+
+def _get_cgroup_oom(cgroup_memory, pid, post_proc_settings):
+    return cgroup_memory.oom
+
+
+def _get_cgroup_oom_kill(cgroup_memory, pid, post_proc_settings):
+    return cgroup_memory.oom_kill
+
+
+def _get_cgroup_pressure(cgroup_memory, pid, post_proc_settings):
+    return cgroup_memory.pressure
+
+
 def _calc_desk_time(float_creation_time, pid, post_proc_settings):
     return (post_proc_settings.utc_now - float_creation_time)
 
@@ -110,6 +202,15 @@ def _float_to_int(float_val, pid, post_proc_settings):
 def _format_date_time(float_date_time, pid, post_proc_settings):
     """Format the date/time into a human-readable representation string.
 
+    The formatted values are memoized by whole second, per `PostProcSettings`.
+    """
+    return post_proc_settings.format_caches.date_time.get(
+            int(float_date_time), pid, post_proc_settings)
+
+
+def _format_date_time_uncached(float_date_time, pid, post_proc_settings):
+    """Format the date/time into a human-readable representation string.
+
     This human-readable format was designed to make it easy to differentiate
     the "orders of magnitude" of date/time on a quick scan down a left-aligned
     column.
@@ -133,6 +234,7 @@ def _format_date_time(float_date_time, pid, post_proc_settings):
 
 
 def _format_human_size(num_bytes, pid, post_proc_settings):
+    """Format the size into a human-readable representation string."""
     # Based upon https://stackoverflow.com/a/1094933
     scale = post_proc_settings.human_scale
     denom = post_proc_settings.human_denom
@@ -147,9 +249,32 @@ def _format_human_size(num_bytes, pid, post_proc_settings):
     return "%.1f %s" % (num, final)
 
 
+def _format_human_size_or_max(num_bytes, pid, post_proc_settings):
+    """Format the size like `_format_human_size`, or "max" if unlimited (-1)."""
+    if num_bytes < 0:
+        return "max"
+    return _format_human_size(num_bytes, pid, post_proc_settings)
+
+
+def _format_human_size_or_none(num_bytes, pid, post_proc_settings):
+    """Format the size like `_format_human_size`, or `None` if not read (`None`)."""
+    if num_bytes is None:
+        return None
+    return _format_human_size(num_bytes, pid, post_proc_settings)
+
+
 def _format_time_delta(float_time_delta, pid, post_proc_settings):
     """Format the time-delta into a human-readable representation string.
 
+    The formatted values are memoized by whole second, per `PostProcSettings`.
+    """
+    return post_proc_settings.format_caches.time_delta.get(
+            int(float_time_delta), pid, post_proc_settings)
+
+
+def _format_time_delta_uncached(float_time_delta, pid, post_proc_settings):
+    """Format the time-delta into a human-readable representation string.
+
     This representation "floats" (in the same sense as floating-point numbers):
     it offers 5 different "orders of magnitude" of time-delta:
      - years (y)
@@ -216,6 +341,55 @@ def _get_rsz(memory_info_tuple, pid, post_proc_settings):
     return memory_info_tuple.rss
 
 
+def _get_pages_data(statm_pages_tuple, pid, post_proc_settings):
+    return statm_pages_tuple.data
+
+
+def _get_pages_private(statm_pages_tuple, pid, post_proc_settings):
+    # The resident pages that are not shared (ie, not backed by a file or
+    # shared memory).  This is "RssAnon" in "/proc/${pid}/status".
+    return statm_pages_tuple.resident - statm_pages_tuple.shared
+
+
+def _get_pages_resident(statm_pages_tuple, pid, post_proc_settings):
+    return statm_pages_tuple.resident
+
+
+def _get_pages_shared(statm_pages_tuple, pid, post_proc_settings):
+    return statm_pages_tuple.shared
+
+
+def _get_pages_size(statm_pages_tuple, pid, post_proc_settings):
+    return statm_pages_tuple.size
+
+
+def _get_pages_text(statm_pages_tuple, pid, post_proc_settings):
+    return statm_pages_tuple.text
+
+
+def _get_pss(memory_full_info_tuple, pid, post_proc_settings):
+    # If `smaps_rollup` could not be read (due to permissions), the value will
+    # be `None` (just like any other attribute that can't be read), rather than
+    # a 0 that would be indistinguishable from a real 0.
+    return memory_full_info_tuple.pss if memory_full_info_tuple is not None else None
+
+
+def _get_status_pte(memory_status_tuple, pid, post_proc_settings):
+    return memory_status_tuple.pte
+
+
+def _get_status_swap(memory_status_tuple, pid, post_proc_settings):
+    return memory_status_tuple.swap
+
+
+def _get_swap(memory_full_info_tuple, pid, post_proc_settings):
+    return memory_full_info_tuple.swap if memory_full_info_tuple is not None else None
+
+
+def _get_uss(memory_full_info_tuple, pid, post_proc_settings):
+    return memory_full_info_tuple.uss if memory_full_info_tuple is not None else None
+
+
 def _get_uid(uids_tuple, pid, post_proc_settings):
     # "The real, effective and saved user ids of this process as a named tuple.
     # This is the same as os.getresuid but can be used for any process PID."
@@ -254,7 +428,41 @@ def _sum_cpu_times(cpu_times_tuple, pid, post_proc_settings):
     return cpu_times_tuple.user + cpu_times_tuple.system
 
 
+# The post-processing functions that only format a value for display (into a
+# human-readable string).  When one of these is the last function in the
+# accessor functions of a field, it may be deferred until the field value is
+# returned to the caller (so that the un-formatted value is used for sorting,
+# and processes that are not returned are never formatted).
+_FORMAT_FUNCS = frozenset((_format_date_time, _format_human_size, _format_human_size_or_max,
+        _format_time_delta))
+
+
+def split_format_func(acc_funcs):
+    """Split `acc_funcs` into 2 parts: (tuple of other funcs, format func or `None`).
+
+    Parameter `acc_funcs` is a single function or a tuple of functions (as in
+    the `acc_funcs` of `FieldInfo`).  If the last function is a formatting
+    function, it will be returned separately; otherwise, `None` is returned.
+    """
+    if hasattr(acc_funcs, "__call__"):
+        acc_funcs = (acc_funcs,)
+    if acc_funcs and acc_funcs[-1] in _FORMAT_FUNCS:
+        return (acc_funcs[:-1], acc_funcs[-1])
+    else:
+        return (acc_funcs, None)
+
+
 ## Field types
+
+# The value is read from a file that the kernel can produce cheaply (eg, the
+# "/proc/${pid}/stat" file, or a cgroup file that is shared by many processes).
+COST_CHEAP = "cheap"
+# The kernel must walk all the memory mappings (& page tables) of the process
+# to produce the value (eg, the "/proc/${pid}/smaps_rollup" file), which may
+# take milliseconds for a large process, and also contends with the process
+# for its memory-map lock.
+COST_EXPENSIVE = "expensive"
+
 FieldType = namedtuple("FieldType", (
         # The FieldType name as a string.
         "name",
@@ -326,34 +534,60 @@ FieldType = namedtuple("FieldType", (
         # right-aligned.
         "alignment",
 
+        # The cost class of reading the values of this FieldType: `COST_CHEAP`
+        # or `COST_EXPENSIVE`.  This is provided so that callers can warn (or
+        # parallelize the query) when an expensive field is requested for many
+        # processes.
+        "cost",
+
         # A human-readable description of the FieldType (like help).
         "descr"))
 
 
+# eg, "/system.slice/sshd.service" or "/user.slice/user-1000.slice/session-2.scope"
+# or even "/" (the root cgroup), or "" if the process has no cgroup v2 path.
+# These recommended & likely max-lengths are complete guesses.
+CgroupPathType = FieldType("CgroupPath",        str,    40,     80,     None,   'L',   COST_CHEAP,
+        "Cgroup (v2) path of process")
+
+# The hard limit of a cgroup might be unlimited (-1); otherwise, like
+# `MemSizeKType`, assume that it's < 1 TB.
+CgroupMemMaxKType = FieldType("CgroupMemMaxK",  int,    9,      9,      None,   'R',   COST_CHEAP,
+        "Cgroup memory limit in KB or KiB, or -1 if unlimited")
+
+# eg, "123.9 Mi" or "max".
+CgroupMemMaxHumanType = FieldType("CgroupMemMaxHuman",  str,    9,  9,  None,   'R',   COST_CHEAP,
+        "Human-readable cgroup memory limit, or \"max\" if unlimited")
+
+# A count of events (eg, OOM kills) since the cgroup was created.
+# Assume that there are < 1 million OOM events (6 chars) in a single cgroup.
+EventCountType = FieldType("EventCount",        int,    6,      6,      20,     'R',   COST_CHEAP,
+        "Count of events (integer)")
+
 # These recommended & likely max-lengths are complete guesses,
 # because I'm trying to provide ANY useful guidance here.
 # These are double the corresponding exe-name-with-path numbers.
-CmdlineArrayType = FieldType("CmdlineArray",    tuple,  100,    160,    None,   'L',
+CmdlineArrayType = FieldType("CmdlineArray",    tuple,  100,    160,    None,   'L',   COST_CHEAP,
         "Command-line (invoked command & args) as an array of strings")
 
 # These recommended & likely max-lengths are complete guesses,
 # because I'm trying to provide ANY useful guidance here.
 # These are double the corresponding exe-name-with-path numbers.
-CmdlineStringType = FieldType("CmdlineString",  str,    100,    160,    None,   'L',
+CmdlineStringType = FieldType("CmdlineString",  str,    100,    160,    None,   'L',   COST_CHEAP,
         "Command-line (invoked command & args) joined as a single string")
 
 # On my system, with 3466 installed executables, there are only 14 executables
 # (0.4%) with names longer than 30 characters.  (The longest is 47 characters.)
-ExeNameType = FieldType("ExeName",              str,    20,     30,     None,   'L',
+ExeNameType = FieldType("ExeName",              str,    20,     30,     None,   'L',   COST_CHEAP,
         "Executable name (without path)")
 
 # On my system, the longest exe-name-with-path I can find is 81 characters.
 # The longest for a currently-running process is 42 characters.
-ExePathNameType = FieldType("ExePathName",      str,    50,     80,     None,   'L',
+ExePathNameType = FieldType("ExePathName",      str,    50,     80,     None,   'L',   COST_CHEAP,
         "Executable name (with absolute path)")
 
 # eg, "123.9 Mi" or "5.4 G" or even "1021.4 Mi" (because 1021.4 < 1024.0).
-MemSizeHumanType = FieldType("MemSizeHuman",    str,    9,      9,      None,   'R',
+MemSizeHumanType = FieldType("MemSizeHuman",    str,    9,      9,      None,   'R',   COST_CHEAP,
         "Human-readable memory size")
 
 # Assume that no single process will use 1 TB of memory or more
@@ -372,22 +606,41 @@ MemSizeHumanType = FieldType("MemSizeHuman",    str,    9,      9,      None,
 #
 # So 1 TB is the lowest amount of memory that requires 10 decimal digits to
 # represent the number of KB.  I'm saying we won't need >= 10 decimal digits.
-MemSizeKType = FieldType("MemSizeK",            int,    9,      9,      None,   'R',
+MemSizeKType = FieldType("MemSizeK",            int,    9,      9,      None,   'R',   COST_CHEAP,
         "Memory size in KB or KiB")
 
+# A number of memory pages (usually 4 KiB each).  Like `MemSizeKType`, assume
+# that no single process will use 1 TB of memory or more, which is less than
+# 10 ** 9 pages of 4 KiB.
+PageCountType = FieldType("PageCount",          int,    9,      9,      None,   'R',   COST_CHEAP,
+        "Number of memory pages")
+
+# Pressure Stall Information (PSI) percentage values in range [0.0, 100.0],
+# eg, "12.34" (6 chars).
+PressurePercentType = FieldType("PressurePercent",  float,  6,  6,  6,  'R',   COST_CHEAP,
+        "Percentage of time stalled: [0.0, 100.0]")
+
+# The same as `MemSizeHumanType` & `MemSizeKType`, but read from the file
+# "/proc/${pid}/smaps_rollup", which is expensive.
+SmapsMemSizeHumanType = FieldType("SmapsMemSizeHuman",  str,    9,  9,  None,   'R',   COST_EXPENSIVE,
+        "Human-readable memory size (from smaps_rollup)")
+
+SmapsMemSizeKType = FieldType("SmapsMemSizeK",          int,    9,  9,  None,   'R',   COST_EXPENSIVE,
+        "Memory size in KB or KiB (from smaps_rollup)")
+
 # OOM Adjustment values in range [-17, +15] (3 chars).
-OomAdjType = FieldType("OomAdj",            int,    3,  3,  3,  'R',
+OomAdjType = FieldType("OomAdj",            int,    3,  3,  3,  'R',   COST_CHEAP,
         "OOM Adjustment (pre-Linux 2.6.36; now deprecated): [-17, +15]")
 
 # OOM Score values in range [0, 1000] (4 chars).
-OomScoreType = FieldType("OomScore",        int,    4,  4,  4,  'R',
+OomScoreType = FieldType("OomScore",        int,    4,  4,  4,  'R',   COST_CHEAP,
         "OOM Score: [0, 1000]")
 
 # OOM Score Adjustment values in range [-1000, 1000] (5 chars).
-OomScoreAdjType = FieldType("OomScoreAdj",  int,    5,  5,  5,  'R',
+OomScoreAdjType = FieldType("OomScoreAdj",  int,    5,  5,  5,  'R',   COST_CHEAP,
         "OOM Score Adjustment (Linux 2.6.36 and later): [-1000, 1000]")
 
-PIDType = FieldType("PID",  int,    5,  7,  7,  'R',
+PIDType = FieldType("PID",  int,    5,  7,  7,  'R',   COST_CHEAP,
         "Process ID (integer)")
 
 # This start-time limit of 12 characters will be valid until 10000 AD.
@@ -397,7 +650,7 @@ PIDType = FieldType("PID",  int,    5,  7,  7,  'R',
 #
 # (The start-time is returned to us as a Python `float`, so there's not even
 # really a convenient upper limit due to integer size.)
-StartTimeHumanType = FieldType("StartTimeHuman",    str,    12, 12, None,   'L',
+StartTimeHumanType = FieldType("StartTimeHuman",    str,    12, 12, None,   'L',   COST_CHEAP,
         "Human-readable start-time")
 
 # A start-time, in seconds since the UNIX epoch (Jan 1, 1970, 00:00:00 (UTC)),
@@ -409,7 +662,7 @@ StartTimeHumanType = FieldType("StartTimeHuman",    str,    12, 12, None,   'L',
 #
 # For sanity, because we're returning the start-time in seconds in an integer,
 # let's assume the start-time must fit within a 64-bit integer (20 chars).
-StartTimeSecsType = FieldType("StartTimeSecs",      int,    10, 11, 20, 'R',
+StartTimeSecsType = FieldType("StartTimeSecs",      int,    10, 11, 20, 'R',   COST_CHEAP,
         "Start-time in seconds since UNIX epoch")
 
 # Human-readable time-delta will be <=10 chars for a time-delta of <1000 years.
@@ -419,28 +672,28 @@ StartTimeSecsType = FieldType("StartTimeSecs",      int,    10, 11, 20, 'R',
 #
 # (The start-time & CPU-time are each returned to us as a Python `float`,
 # so there's not even really a convenient upper limit due to integer size.)
-TimeDeltaHumanType = FieldType("TimeDeltaHuman",    str,    10, 10, None,   'L',
+TimeDeltaHumanType = FieldType("TimeDeltaHuman",    str,    10, 10, None,   'L',   COST_CHEAP,
         "Human-readable time-delta")
 
 # Assume a time-delta in seconds will fit within a 64-bit integer (20 chars).
 # But in 300 years, there are (300 * 365 * 24 * 60 * 60) seconds (10 chars).
 # 300 years is not bad for the real-world lifetime of a single process...
-TimeDeltaSecsType = FieldType("TimeDeltaSecs",      int,    10, 10, 20, 'R',
+TimeDeltaSecsType = FieldType("TimeDeltaSecs",      int,    10, 10, 20, 'R',   COST_CHEAP,
         "Time-delta in integer seconds")
 
 # eg, "/dev/pts/18" or `None`
-TtyType = FieldType("Tty",  (str, type(None)),    12, 16, None,   'L',
+TtyType = FieldType("Tty",  (str, type(None)),    12, 16, None,   'L',   COST_CHEAP,
         "Terminal associated with the process")
 
-UIDType = FieldType("UID",  int,    5,  10, 10, 'R',
+UIDType = FieldType("UID",  int,    5,  10, 10, 'R',   COST_CHEAP,
         "User ID or Group ID (integer)")
 
-UsernameType = FieldType("Username",    str,    10, 20, 32, 'L',
+UsernameType = FieldType("Username",    str,    10, 20, 32, 'L',   COST_CHEAP,
         "Username (string)")
 
 # These recommended & likely max-lengths are complete guesses,
 # because I'm trying to provide ANY useful guidance here.
-WorkingDirType = FieldType("WorkingDir",    str,    30, 60, None,   'L',
+WorkingDirType = FieldType("WorkingDir",    str,    30, 60, None,   'L',   COST_CHEAP,
         "Current working directory (absolute path) of process")
 
 
@@ -455,7 +708,9 @@ Fi = namedtuple("FieldInfo", (
         "field_type",
 
         # A tuple of `psutil` attribute names that must be queried for this field.
-        # May be the empty tuple if this field value is not available from `psutil`.
+        # These may also be the extra attribute names that only `_procio` can
+        # provide (eg, the OOM attributes in `_procio.OOM_ATTR_NAMES`).
+        # May be the empty tuple if this field value is not an attribute at all.
         # To increase readability and decrease boilerplate, if there's just
         # a single tuple element, the surrounding tuple can be elided.
         "attr_names",
@@ -476,18 +731,66 @@ _ALL_FIELD_DEFS = dict(
         # NAME  Fi( CODE    FIELD_TYPE
         adj=    Fi( 'a',    OomScoreAdjType,
                         # ATTR_NAMES
-                        (),
+                        "oom_score_adj",
                         # ACCESSOR / POST-PROCESSING FUNCS
-                        _read_int_from_proc("oom_score_adj", 0),
+                        (),
                         "OOM Score Adjustment (Linux 2.6.36 and later): [-1000, 1000]"
                 ),
 
         adjd=   Fi( 'A',    OomAdjType,
+                        "oom_adj",
                         (),
-                        _read_int_from_proc("oom_adj", 0),
                         "OOM Adjustment (pre-Linux 2.6.36; now deprecated): [-17, +15]"
                 ),
 
+        cgmaxh= Fi( 'l',    CgroupMemMaxHumanType,
+                        "cgroup_memory",
+                        (_get_cgroup_max, _format_human_size_or_max),
+                        "Cgroup (v2) memory limit (\"memory.max\"), in human-readable format"
+                ),
+
+        cgmaxk= Fi( 'L',    CgroupMemMaxKType,
+                        "cgroup_memory",
+                        (_get_cgroup_max, _bytes_to_kiB),
+                        "Cgroup (v2) memory limit (\"memory.max\"), in KB or KiB; -1 if unlimited"
+                ),
+
+        cgmemh= Fi( 'm',    MemSizeHumanType,
+                        "cgroup_memory",
+                        (_get_cgroup_current, _format_human_size),
+                        "Cgroup (v2) memory usage (\"memory.current\"), in human-readable format"
+                ),
+
+        cgmemk= Fi( 'M',    MemSizeKType,
+                        "cgroup_memory",
+                        (_get_cgroup_current, _bytes_to_kiB),
+                        "Cgroup (v2) memory usage (\"memory.current\"), in KB or KiB"
+                ),
+
+        cgoom=  Fi( None,   EventCountType,
+                        "cgroup_memory",
+                        _get_cgroup_oom,
+                        "Cgroup (v2) count of OOM events (\"oom\" in \"memory.events\")"
+                ),
+
+        cgoomk= Fi( 'k',    EventCountType,
+                        "cgroup_memory",
+                        _get_cgroup_oom_kill,
+                        "Cgroup (v2) count of OOM kills (\"oom_kill\" in \"memory.events\")"
+                ),
+
+        cgpsi=  Fi( None,   PressurePercentType,
+                        "cgroup_memory",
+                        _get_cgroup_pressure,
+                        "Cgroup (v2) memory pressure, % of time fully stalled in last 10s"
+                ),
+
+        cgrp=   Fi( 'K',    CgroupPathType,
+                        "cgroup",
+                        (),
+                        "Cgroup (v2) path of process"
+                ),
+
         cmda=   Fi( 'C',    CmdlineArrayType,
                         "cmdline",
                         # Return the "command-line as an array" as a `tuple`
@@ -542,12 +845,49 @@ _ALL_FIELD_DEFS = dict(
                 ),
 
         #gid=    Fi( 'g',  "proc.gids()"
-        #npgv=   Fi( 'n',  ???
-        #npgr=   Fi( 'n',  ???
+
+        # The page counts are all read from "/proc/${pid}/statm" (not provided
+        # by `psutil`), which is read just once per process for all of them.
+        #  $ man 5 proc  # then search for "/proc/[pid]/statm"
+        npgd=   Fi( None,   PageCountType,
+                        "statm_pages",
+                        _get_pages_data,
+                        "Number of pages of data + stack"
+                ),
+
+        npgp=   Fi( None,   PageCountType,
+                        "statm_pages",
+                        _get_pages_private,
+                        "Number of resident private pages (resident - shared)"
+                ),
+
+        npgr=   Fi( 'N',    PageCountType,
+                        "statm_pages",
+                        _get_pages_resident,
+                        "Number of resident pages (resident set size)"
+                ),
+
+        npgs=   Fi( None,   PageCountType,
+                        "statm_pages",
+                        _get_pages_shared,
+                        "Number of resident shared pages (backed by a file)"
+                ),
+
+        npgt=   Fi( None,   PageCountType,
+                        "statm_pages",
+                        _get_pages_text,
+                        "Number of pages of text (code)"
+                ),
+
+        npgv=   Fi( 'n',    PageCountType,
+                        "statm_pages",
+                        _get_pages_size,
+                        "Number of pages of virtual memory (total program size)"
+                ),
 
         ooms=   Fi( 'o',    OomScoreType,
+                        "oom_score",
                         (),
-                        _read_int_from_proc("oom_score", 0),
                         "Linux OOM Score: [0, 1000]"
                 ),
 
@@ -563,6 +903,24 @@ _ALL_FIELD_DEFS = dict(
                         "Parent process ID (integer)"
                 ),
 
+        pssh=   Fi( 'z',    SmapsMemSizeHumanType,
+                        "memory_full_info",
+                        (_get_pss, _format_human_size_or_none),
+                        "Proportional set size (shared pages divided among sharers), human-readable"
+                ),
+
+        pssk=   Fi( 'Z',    SmapsMemSizeKType,
+                        "memory_full_info",
+                        (_get_pss, _bytes_to_kiB_or_none),
+                        "Proportional set size (shared pages divided among sharers), in KB or KiB"
+                ),
+
+        ptek=   Fi( None,   MemSizeKType,
+                        "memory_status",
+                        (_get_status_pte, _bytes_to_kiB),
+                        "Page table size (\"VmPTE\" in status), in KB or KiB"
+                ),
+
         rszh=   Fi( 'r',    MemSizeHumanType,
                         "memory_info",
                         (_get_rsz, _format_human_size),
@@ -587,6 +945,18 @@ _ALL_FIELD_DEFS = dict(
                         "Start-time of process (UTC), in seconds since UNIX epoch"
                 ),
 
+        swaph=  Fi( None,   SmapsMemSizeHumanType,
+                        "memory_full_info",
+                        (_get_swap, _format_human_size_or_none),
+                        "Swapped-out memory size, in human-readable format"
+                ),
+
+        swapk=  Fi( None,   SmapsMemSizeKType,
+                        "memory_full_info",
+                        (_get_swap, _bytes_to_kiB_or_none),
+                        "Swapped-out memory size, in KB or KiB"
+                ),
+
         tty=    Fi( 'y',    TtyType,
                         "terminal",
                         (),
@@ -599,12 +969,30 @@ _ALL_FIELD_DEFS = dict(
                         "User ID (integer)"
                 ),
 
+        ussh=   Fi( 'q',    SmapsMemSizeHumanType,
+                        "memory_full_info",
+                        (_get_uss, _format_human_size_or_none),
+                        "Unique set size (private pages, freed if killed), human-readable"
+                ),
+
+        ussk=   Fi( 'Q',    SmapsMemSizeKType,
+                        "memory_full_info",
+                        (_get_uss, _bytes_to_kiB_or_none),
+                        "Unique set size (private pages, freed if killed), in KB or KiB"
+                ),
+
         user=   Fi( 'u',    UsernameType,
                         "username",
                         (),
                         "Username (string)"
                 ),
 
+        vmswapk=Fi( None,   MemSizeKType,
+                        "memory_status",
+                        (_get_status_swap, _bytes_to_kiB),
+                        "Swapped-out memory size (\"VmSwap\" in status), in KB or KiB"
+                ),
+
         vszh=   Fi( 'v',    MemSizeHumanType,
                         "memory_info",
                         (_get_vsz, _format_human_size),
@@ -625,34 +1013,6 @@ _ALL_FIELD_DEFS = dict(
 )
 
 
-# TODO: To get number of pages (virtual or RSS), check out:
-#   $ cat /proc/$pid/statm
-#   1461407 22849 13530 39075 0 69932 0
-#
-#   $ cat /proc/$pid/status
-#   <snip long>
-#   VmSize:	 5845628 kB
-#   <snip>
-#   VmRSS:	   91648 kB
-#
-#   $ man 5 proc  # then search for "measured in pages"
-#        /proc/[pid]/statm
-#               Provides information about memory usage, measured in pages.  The columns are:
-# 
-#                   size       (1) total program size
-#                              (same as VmSize in /proc/[pid]/status)
-#                   resident   (2) resident set size
-#                              (same as VmRSS in /proc/[pid]/status)
-#                   shared     (3) number of resident shared pages (i.e., backed by a file)
-#                              (same as RssFile+RssShmem in /proc/[pid]/status)
-#                   text       (4) text (code)
-#                   lib        (5) library (unused since Linux 2.6; always 0)
-#                   data       (6) data + stack
-#                   dt         (7) dirty pages (unused since Linux 2.6; always 0)
-#
-# This functionality is not supported by `psutil`, so it should go into `_procio`.
-
-
 def get_field_info(field_name):
     """Access the FieldInfo for supplied `field_name`.
 
@@ -665,6 +1025,14 @@ def get_field_info(field_name):
         raise ValueError("invalid field name: %s" % field_name)
 
 
+def get_field_type(field_name):
+    """Access the FieldType of supplied `field_name`.
+
+    If `field_name` is not valid (ie, not in the master-list), raise `ValueError`.
+    """
+    return get_field_info(field_name).field_type
+
+
 def list_all_fields(return_headers=False, descr=False):
     """Return a newly-allocated list of all fields defined in the master-list.
 
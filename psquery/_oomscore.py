@@ -0,0 +1,95 @@
+# Copyright (c) 2020 James Boyden <jboy@jboy.me>. All rights reserved.
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Estimate the Linux OOM Score of processes, without reading "oom_score".
+
+The kernel calculates the "badness" of a process as the number of pages of
+memory that the OOM Killer would free by killing it:  its resident set size,
+plus its swapped-out pages, plus its page tables.  The OOM Score Adjustment
+(in [-1000, 1000]) is then added, in units of 1/1000 of the total pages of
+RAM & swap.  Finally, "/proc/${pid}/oom_score" scales the badness by the
+total pages:
+ - since Linux 5.9:  `(1000 + badness * 1000 / totalpages) * 2 / 3`
+ - before Linux 5.9:  `max(badness, 1) * 1000 / totalpages`
+(in integer arithmetic, like C).  A process with an OOM Score Adjustment of
+-1000, the init process & kernel threads are never killed; their score is 0.
+
+ $ less mm/oom_kill.c  # function `oom_badness`
+ $ less fs/proc/base.c  # function `proc_oom_score`
+"""
+
+import os
+from array import array
+
+
+# The formula of "/proc/${pid}/oom_score" in Linux 5.9 and later.
+OOM_SCORE_FORMULA_CURRENT = "current"
+# The formula of "/proc/${pid}/oom_score" in Linux 4.17 to 5.8.  (Before 4.17,
+# processes with `CAP_SYS_ADMIN` also got a 3% bonus, which is not estimated.)
+OOM_SCORE_FORMULA_LEGACY = "legacy"
+
+_OOM_SCORE_ADJ_MIN = -1000
+
+
+def get_kernel_oom_score_formula(release=None):
+    """Return the OOM Score formula of the running kernel (or of `release`).
+
+    The `release` is a kernel release string like `os.uname().release`, eg,
+    "5.15.0-91-generic".  If it can't be parsed, assume the current formula.
+    """
+    if release is None:
+        release = os.uname().release
+    try:
+        (major, minor) = (int(v) for v in release.split("-")[0].split(".")[:2])
+    except ValueError:
+        return OOM_SCORE_FORMULA_CURRENT
+    if (major, minor) >= (5, 9):
+        return OOM_SCORE_FORMULA_CURRENT
+    else:
+        return OOM_SCORE_FORMULA_LEGACY
+
+
+def _c_div(a, b):
+    """Divide integers like C does (truncating towards zero), for `b > 0`."""
+    return (a // b) if a >= 0 else -(-a // b)
+
+
+def estimate_oom_scores(rss_KiB, vms_KiB, swap_KiB, pte_KiB, oom_score_adjs, pids,
+        total_KiB, formula=OOM_SCORE_FORMULA_CURRENT, page_size=None):
+    """Return an `array` of the estimated OOM Score of each process.
+
+    The arguments `rss_KiB` to `pids` are equal-length columns (eg, of results
+    in format `RESULT_FORMAT_COLUMNS`) of the fields `rszk`, `vszk`, `vmswapk`,
+    `ptek`, `adj` & `pid` of each process.  (A value of `None` is treated as 0.)
+    The `total_KiB` is the total RAM plus the total swap, in KiB.
+
+    An invalid `formula` will raise `ValueError`.
+    """
+    if formula not in (OOM_SCORE_FORMULA_CURRENT, OOM_SCORE_FORMULA_LEGACY):
+        raise ValueError("invalid OOM Score formula: %s" % formula)
+    if page_size is None:
+        page_size = os.sysconf("SC_PAGE_SIZE")
+    page_KiB = page_size >> 10
+    total_pages = max(total_KiB // page_KiB, 1)
+    # Like the kernel, multiply each adjustment by `totalpages / 1000` (which is
+    # truncated first).
+    pages_per_adj = total_pages // 1000
+    is_current = (formula == OOM_SCORE_FORMULA_CURRENT)
+
+    scores = array("l", bytes(array("l").itemsize * len(pids)))
+    for idx, (rss, vms, swap, pte, adj, pid) in enumerate(zip(
+            rss_KiB, vms_KiB, swap_KiB, pte_KiB, oom_score_adjs, pids)):
+        adj = adj or 0
+        if adj == _OOM_SCORE_ADJ_MIN or pid == 1 or not vms:
+            # Never killed:  the adjustment forbids it, or it's the init process,
+            # or it's a kernel thread (which has no user-space memory).
+            continue
+        badness = ((rss or 0) + (swap or 0) + (pte or 0)) // page_KiB + adj * pages_per_adj
+        if is_current:
+            score = _c_div((1000 + _c_div(badness * 1000, total_pages)) * 2, 3)
+        else:
+            score = max(badness, 1) * 1000 // total_pages
+        scores[idx] = max(score, 0)
+    return scores
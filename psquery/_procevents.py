@@ -0,0 +1,266 @@
+# Copyright (c) 2020 James Boyden <jboy@jboy.me>. All rights reserved.
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Sources of events about new processes (ie, `fork` & `exec`) on Linux.
+
+Each event source has a method `wait_for_pids(timeout)`, which waits (for at
+most `timeout` seconds, or forever if `timeout` is `None`) until there are some
+new or exec'd processes, then returns a list of `(pid, event_time_ns)`, where
+`event_time_ns` is the time of the event in the clock of `time.monotonic_ns`.
+(The list may be empty, if the timeout expired.)
+
+If some events were lost (eg, a burst of `fork`s overflowed the receive buffer
+of the proc connector socket), `wait_for_pids` returns `None` instead of a list;
+then the caller should re-scan all the running processes.
+"""
+
+import errno
+import os
+import select
+import socket
+import struct
+from time import monotonic, monotonic_ns, sleep
+
+from ._procio import list_proc_pids
+
+
+## The Linux "proc connector", a netlink socket that reports process events.
+##  https://www.kernel.org/doc/html/latest/driver-api/connector.html
+##  $ less /usr/include/linux/cn_proc.h
+##  $ less /usr/include/linux/connector.h
+
+NETLINK_CONNECTOR = 11
+CN_IDX_PROC = 1
+CN_VAL_PROC = 1
+
+# The operations that subscribe & unsubscribe to process events.
+PROC_CN_MCAST_LISTEN = 1
+PROC_CN_MCAST_IGNORE = 2
+
+# The `what` of each process event that we handle.  An event of `what`
+# `PROC_EVENT_NONE` is the acknowledgement of a (un)subscribe operation.
+PROC_EVENT_NONE = 0x00000000
+PROC_EVENT_FORK = 0x00000001
+PROC_EVENT_EXEC = 0x00000002
+
+_NLMSG_DONE = 3
+
+# struct nlmsghdr: len, type, flags, seq, pid
+_NLMSGHDR = struct.Struct("=IHHII")
+# struct cn_msg: id.idx, id.val, seq, ack, len, flags
+_CN_MSG = struct.Struct("=IIIIHH")
+# struct proc_event: what, cpu, timestamp_ns (then the event data)
+_PROC_EVENT = struct.Struct("=IIQ")
+# struct fork_proc_event: parent_pid, parent_tgid, child_pid, child_tgid
+_FORK_PROC_EVENT = struct.Struct("=IIII")
+# struct exec_proc_event: process_pid, process_tgid
+_EXEC_PROC_EVENT = struct.Struct("=II")
+# struct ack: err
+_ACK_PROC_EVENT = struct.Struct("=I")
+
+_RECV_BUF_SIZE = 65536
+
+# How long to wait for the acknowledgement of the subscription.  (The kernel
+# doesn't acknowledge at all if the caller is not in the initial PID & user
+# namespaces; and in that case, no events would ever be received.)
+_ACK_TIMEOUT_SECS = 1.0
+
+
+class ProcConnectorEvents(object):
+    """Report new & exec'd processes, using the Linux proc connector.
+
+    This requires capability `CAP_NET_ADMIN` (eg, running as root), in the
+    initial PID & user namespaces; if the proc connector can't be used (ie, the
+    kernel doesn't acknowledge the subscription, or rejects it), the
+    constructor raises `OSError`.
+
+    The proc connector reports the `timestamp_ns` of each event (in the kernel
+    monotonic clock), so the latency from each event can be measured exactly.
+    """
+    __slots__ = ("name", "num_events", "_sock", "_pending_events")
+
+    def __init__(self):
+        self.name = "netlink"
+        self.num_events = 0
+        # The events that were received while waiting for the acknowledgement
+        # of the subscription (or `None`, if some events were lost).
+        self._pending_events = []
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_CONNECTOR)
+        try:
+            # Let the kernel assign the netlink port ID.
+            sock.bind((0, CN_IDX_PROC))
+            self._sock = sock
+            # The acknowledgement is multicast (like the events), so identify
+            # our own by the `ack` number of the operation.
+            ack = os.getpid()
+            self._send_op(PROC_CN_MCAST_LISTEN, ack)
+            self._wait_for_ack(ack)
+        except BaseException:
+            sock.close()
+            raise
+
+    def _send_op(self, op, ack=0):
+        op_data = struct.pack("=I", op)
+        cn_msg = _CN_MSG.pack(CN_IDX_PROC, CN_VAL_PROC, 0, ack, len(op_data), 0)
+        msg_len = _NLMSGHDR.size + len(cn_msg) + len(op_data)
+        nlmsghdr = _NLMSGHDR.pack(msg_len, _NLMSG_DONE, 0, 0, os.getpid())
+        self._sock.send(nlmsghdr + cn_msg + op_data)
+
+    def _wait_for_ack(self, ack):
+        """Wait for the acknowledgement of the operation with `ack` number `ack`.
+
+        If the operation failed (eg, `EPERM`), or there is no acknowledgement
+        within `_ACK_TIMEOUT_SECS`, raise `OSError`.
+        """
+        deadline = monotonic() + _ACK_TIMEOUT_SECS
+        events = []
+        is_events_lost = False
+        while True:
+            timeout = deadline - monotonic()
+            if timeout <= 0.0:
+                raise OSError(errno.ETIMEDOUT,
+                        "proc connector did not acknowledge the subscription")
+            (readable, writable, exceptional) = select.select((self._sock,), (), (), timeout)
+            if not readable:
+                continue
+            try:
+                data = self._sock.recv(_RECV_BUF_SIZE)
+            except OSError as e:
+                if e.errno != errno.ENOBUFS:
+                    raise
+                # Some events were lost (the acknowledgement might have been
+                # lost too, in which case the timeout will expire).
+                is_events_lost = True
+                continue
+            ack_err = self._parse_events(data, events, ack)
+            if ack_err is not None:
+                if ack_err != 0:
+                    raise OSError(ack_err, os.strerror(ack_err))
+                self._pending_events = None if is_events_lost else events
+                return
+
+    def close(self):
+        try:
+            self._send_op(PROC_CN_MCAST_IGNORE)
+        except OSError:
+            pass
+        self._sock.close()
+
+    def wait_for_pids(self, timeout=None):
+        # First, any events that were received during the subscription.
+        events = self._pending_events
+        self._pending_events = []
+        if events is None:
+            return None
+        elif not events:
+            (readable, writable, exceptional) = \
+                    select.select((self._sock,), (), (), timeout)
+            if not readable:
+                return []
+
+        # Read all the events that are already waiting (without blocking), so
+        # that a burst of events can be handled as a single batch.
+        while True:
+            try:
+                data = self._sock.recv(_RECV_BUF_SIZE, socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                if e.errno != errno.ENOBUFS:
+                    raise
+                # The kernel dropped some events, because the socket's receive
+                # buffer was full.  The socket is still usable, but the events
+                # that were dropped can't be recovered.
+                return None
+            self._parse_events(data, events)
+        return events
+
+    def _parse_events(self, data, events, op_ack=None):
+        """Append the events in `data` to `events`.
+
+        If `data` contains the acknowledgement of the operation with `ack`
+        number `op_ack`, return its error number (0 if none); else, `None`.
+        """
+        ack_err = None
+        offset = 0
+        while offset + _NLMSGHDR.size <= len(data):
+            (msg_len, msg_type, msg_flags, msg_seq, msg_pid) = \
+                    _NLMSGHDR.unpack_from(data, offset)
+            if msg_len < _NLMSGHDR.size:
+                break
+            cn_offset = offset + _NLMSGHDR.size
+            (cn_idx, cn_val, cn_seq, cn_ack, cn_len, cn_flags) = \
+                    _CN_MSG.unpack_from(data, cn_offset)
+            event_offset = cn_offset + _CN_MSG.size
+            (what, cpu, timestamp_ns) = _PROC_EVENT.unpack_from(data, event_offset)
+            event_offset += _PROC_EVENT.size
+            if what == PROC_EVENT_NONE:
+                # The kernel acknowledges with the `ack` number of the
+                # operation, incremented.  (Its `seq` is the kernel's own.)
+                if op_ack is not None and cn_ack == ((op_ack + 1) & 0xffffffff):
+                    (ack_err,) = _ACK_PROC_EVENT.unpack_from(data, event_offset)
+            elif what == PROC_EVENT_FORK:
+                (parent_pid, parent_tgid, child_pid, child_tgid) = \
+                        _FORK_PROC_EVENT.unpack_from(data, event_offset)
+                # A new thread (rather than a new process) has a PID that is
+                # different from its thread-group ID (ie, its "process ID").
+                if child_pid == child_tgid:
+                    events.append((child_tgid, timestamp_ns))
+                    self.num_events += 1
+            elif what == PROC_EVENT_EXEC:
+                (process_pid, process_tgid) = \
+                        _EXEC_PROC_EVENT.unpack_from(data, event_offset)
+                events.append((process_tgid, timestamp_ns))
+                self.num_events += 1
+            # Each netlink message is aligned to 4 bytes.
+            offset += (msg_len + 3) & ~3
+        return ack_err
+
+
+class ProcPidDiffEvents(object):
+    """Report new processes, by polling the PID directories of "/proc".
+
+    This is the fall-back if the proc connector can't be used.  It can only
+    detect new PIDs (not an `exec` by an existing process), and only once per
+    `poll_interval_secs`; the event time of each new PID is the time at which
+    it was detected.
+    """
+    __slots__ = ("name", "num_events", "poll_interval_secs", "_known_pids", "_next_poll")
+
+    def __init__(self, poll_interval_secs=1.0):
+        self.name = "poll"
+        self.num_events = 0
+        self.poll_interval_secs = poll_interval_secs
+        self._known_pids = set(list_proc_pids())
+        self._next_poll = monotonic() + poll_interval_secs
+
+    def close(self):
+        pass
+
+    def wait_for_pids(self, timeout=None):
+        wait_secs = self._next_poll - monotonic()
+        if timeout is not None and timeout < wait_secs:
+            sleep(max(timeout, 0.0))
+            return []
+        if wait_secs > 0.0:
+            sleep(wait_secs)
+        self._next_poll = monotonic() + self.poll_interval_secs
+
+        pids = set(list_proc_pids())
+        new_pids = pids - self._known_pids
+        self._known_pids = pids
+        self.num_events += len(new_pids)
+        event_time_ns = monotonic_ns()
+        return [(pid, event_time_ns) for pid in sorted(new_pids)]
+
+
+def open_proc_event_source(poll_interval_secs=1.0):
+    """Return a `ProcConnectorEvents` if possible, else a `ProcPidDiffEvents`."""
+    try:
+        return ProcConnectorEvents()
+    except OSError:
+        # Eg, `PermissionError` (no `CAP_NET_ADMIN`), or the kernel (or the
+        # container) doesn't support the proc connector.
+        return ProcPidDiffEvents(poll_interval_secs)
@@ -5,7 +5,19 @@
 
 """Functions to query the Linux proc-filesystem that are missing from `psutil`."""
 
+import errno
+import os
 from collections import namedtuple
+from glob import glob
+from threading import Lock
+
+from ._users import UserNameResolver
+
+
+# The mount point of the proc-filesystem.  Like `psutil.PROCFS_PATH`, this may
+# be changed (eg, to a synthetic tree of files, for benchmarks); it's read when
+# each path is constructed, rather than when this module is imported.
+PROCFS_PATH = "/proc"
 
 
 def _read_int_from_file(fullpath, default=None):
@@ -16,7 +28,8 @@ def _read_int_from_file(fullpath, default=None):
     be returned instead of raising exceptions.
     """
     try:
-        val = open(fullpath, 'r').read()
+        with open(fullpath, 'r') as f:
+            val = f.read()
     except Exception as e:  # FileNotFoundError in Python3; IOError in Python2
         if default is not None:
             return default
@@ -53,9 +66,8 @@ def read_int_from_proc_pid(fname, default_int=None):
     if (default_int is not None) and not isinstance(default_int, int):
         raise ValueError("invalid `default_int`: %s" % default_int)
 
-    fullpath_pid_template = "/proc/%%d/%s" % fname
     def _impl(ignore_1, pid, ignore_3):
-        fullpath = fullpath_pid_template % pid
+        fullpath = "%s/%d/%s" % (PROCFS_PATH, pid, fname)
         return _read_int_from_file(fullpath, default_int)
     return _impl
 
@@ -78,7 +90,7 @@ def read_overcommit_settings(raise_on_error=True):
     # https://www.kernel.org/doc/Documentation/vm/overcommit-accounting
     # https://serverfault.com/questions/606185/how-does-vm-overcommit-memory-work
     try:
-        mode = _read_int_from_file("/proc/sys/vm/overcommit_memory")
+        mode = _read_int_from_file(PROCFS_PATH + "/sys/vm/overcommit_memory")
         descr = _OVERCOMMIT_DESCRS[mode]
     except Exception as e:
         if raise_on_error:
@@ -90,7 +102,7 @@ def read_overcommit_settings(raise_on_error=True):
 
     # https://engineering.pivotal.io/post/virtual_memory_settings_in_linux_-_the_problem_with_overcommit
     try:
-        ratio = _read_int_from_file("/proc/sys/vm/overcommit_ratio")
+        ratio = _read_int_from_file(PROCFS_PATH + "/sys/vm/overcommit_ratio")
     except Exception as e:
         if raise_on_error:
             raise
@@ -99,3 +111,879 @@ def read_overcommit_settings(raise_on_error=True):
             ratio = None
 
     return OvercommitSettings(mode, descr, ratio)
+
+
+## A native reader of per-process attributes from the proc-filesystem.
+##
+## This reader is an alternative to `psutil.process_iter`.  It offers the same
+## attributes (with the same names & the same value types) as the subset of
+## `psutil.Process` attributes that are used by our field definitions; but it
+## reads each of the files "/proc/${pid}/stat", "/proc/${pid}/statm" and
+## "/proc/${pid}/status" at most once per process per query, and it decodes
+## only the values that were actually requested.
+
+# These named-tuples have the same attribute names (in the same order) as the
+# corresponding named-tuples returned by `psutil` on Linux:
+#  https://psutil.readthedocs.io/en/latest/#psutil.Process.cpu_times
+#  https://psutil.readthedocs.io/en/latest/#psutil.Process.memory_info
+#  https://psutil.readthedocs.io/en/latest/#psutil.Process.memory_full_info
+#  https://psutil.readthedocs.io/en/latest/#psutil.Process.uids
+ProcCpuTimes = namedtuple("ProcCpuTimes",
+        ("user", "system", "children_user", "children_system"))
+ProcMemoryInfo = namedtuple("ProcMemoryInfo",
+        ("rss", "vms", "shared", "text", "lib", "data", "dirty"))
+ProcMemoryFullInfo = namedtuple("ProcMemoryFullInfo",
+        ProcMemoryInfo._fields + ("uss", "pss", "swap"))
+ProcUids = namedtuple("ProcUids", ("real", "effective", "saved"))
+
+# The memory sizes in "/proc/${pid}/status" that are not provided by `psutil`
+# (in bytes, like `memory_info`):  "VmSwap" (the swapped-out anonymous memory)
+# & "VmPTE" (the page tables).  A kernel thread has neither, so both are 0.
+ProcMemoryStatus = namedtuple("ProcMemoryStatus", ("swap", "pte"))
+
+# The page counts of "/proc/${pid}/statm", which are not provided by `psutil`
+# (without the columns "lib" & "dt", which are unused since Linux 2.6).
+ProcStatmPages = namedtuple("ProcStatmPages",
+        ("size", "resident", "shared", "text", "data"))
+
+
+# The OOM-related attributes that are not available from `psutil` at all.
+# Each attribute is read from the file "/proc/${pid}/${attr_name}", which
+# contains a single integer.  (If it can't be read, the value will be 0.)
+OOM_ATTR_NAMES = frozenset(("oom_adj", "oom_score", "oom_score_adj"))
+
+
+def split_oom_attr_names(attr_names):
+    """Split `attr_names` into 2 tuples: (non-OOM attr names, OOM attr names)."""
+    return (tuple(a for a in attr_names if a not in OOM_ATTR_NAMES),
+            tuple(a for a in attr_names if a in OOM_ATTR_NAMES))
+
+
+# The cgroup (v2) attributes that are not available from `psutil` at all:
+#  - "cgroup": the path of the process's cgroup (v2), from "/proc/${pid}/cgroup",
+#    relative to the cgroup2 mount; or "" if the process has no cgroup v2 path.
+#  - "cgroup_memory": a `CgroupMemory` of the memory accounting of that cgroup.
+CGROUP_ATTR_NAMES = frozenset(("cgroup", "cgroup_memory"))
+
+
+def split_cgroup_attr_names(attr_names):
+    """Split `attr_names` into 2 tuples: (non-cgroup attr names, cgroup attr names)."""
+    return (tuple(a for a in attr_names if a not in CGROUP_ATTR_NAMES),
+            tuple(a for a in attr_names if a in CGROUP_ATTR_NAMES))
+
+
+# The memory accounting of a cgroup (v2), read from the files in its directory:
+#  https://www.kernel.org/doc/html/latest/admin-guide/cgroup-v2.html#memory-interface-files
+#  https://www.kernel.org/doc/html/latest/accounting/psi.html
+CgroupMemory = namedtuple("CgroupMemory", (
+        # "memory.current": the memory usage of the cgroup & its descendants, in bytes.
+        "current",
+        # "memory.max": the hard limit of memory usage, in bytes; or -1 if "max"
+        # (ie, unlimited), or if there is no limit (eg, the root cgroup).
+        "max",
+        # "memory.events": the number of times that the cgroup's memory usage
+        # reached its limit and the OOM Killer was invoked ("oom"), and the
+        # number of processes in the cgroup that were OOM-killed ("oom_kill").
+        "oom", "oom_kill",
+        # "memory.pressure": the percentage of time (in the last 10 seconds)
+        # that all the (non-idle) processes in the cgroup were stalled on memory
+        # ("full avg10"), as a `float`.
+        "pressure"))
+
+# The `CgroupMemory` of a process that has no cgroup v2 path (or if there is
+# no cgroup2 file-system mounted).  Any value that can't be read will be the
+# corresponding value in this named-tuple.
+_NO_CGROUP_MEMORY = CgroupMemory(0, -1, 0, 0, 0.0)
+
+
+def _find_cgroup2_mount():
+    """Return the path at which the cgroup2 file-system is mounted, or `None`.
+
+    On a host with "unified" cgroups, this is usually "/sys/fs/cgroup"; on a
+    host with "hybrid" cgroups (v1 & v2), this is usually "/sys/fs/cgroup/unified".
+    """
+    #  $ man 5 proc  # then search for "/proc/[pid]/mounts"
+    try:
+        with open(PROCFS_PATH + "/self/mounts", "rb") as f:
+            for line in f:
+                # device mount-point fs-type options dump pass
+                fields = line.split()
+                if len(fields) >= 3 and fields[2] == b"cgroup2":
+                    # Any spaces in the mount-point are escaped as octal "\040".
+                    return os.fsdecode(fields[1]).replace("\\040", " ")
+    except OSError:
+        pass
+    return None
+
+
+# The range of valid values of "/proc/${pid}/oom_score_adj".
+#  $ man 5 proc  # then search for "/proc/[pid]/oom_score_adj"
+OOM_SCORE_ADJ_MIN = -1000
+OOM_SCORE_ADJ_MAX = 1000
+
+
+def write_oom_score_adj(pid, oom_score_adj):
+    """Write the `int` value `oom_score_adj` to "/proc/${pid}/oom_score_adj".
+
+    If the process no longer exists, raise `ProcessLookupError`.
+    If the caller is not permitted, raise `PermissionError`.
+    """
+    if not (OOM_SCORE_ADJ_MIN <= oom_score_adj <= OOM_SCORE_ADJ_MAX):
+        raise ValueError("invalid oom_score_adj: %s" % oom_score_adj)
+    try:
+        with open("%s/%d/oom_score_adj" % (PROCFS_PATH, pid), "w") as f:
+            f.write("%d\n" % oom_score_adj)
+    except FileNotFoundError:
+        raise ProcessLookupError(pid)
+
+
+# The capability that is required to lower the `oom_score_adj` of a process
+# below its minimum (which is the last value written with this capability).
+#  $ man 7 capabilities  # then search for "CAP_SYS_RESOURCE"
+#  $ less fs/proc/base.c  # function `__set_oom_adj`
+_CAP_SYS_RESOURCE = 24
+
+# The "/proc/self/uid_map" of the initial user namespace.
+_INITIAL_UID_MAP = [b"0", b"0", b"4294967295"]
+
+
+def has_cap_sys_resource():
+    """Return whether this process has `CAP_SYS_RESOURCE` in the initial user namespace.
+
+    The kernel checks the capability in the initial user namespace, so the
+    capabilities of a process in any other user namespace (eg, the root user
+    of a rootless container) don't count.
+    """
+    try:
+        with open(PROCFS_PATH + "/self/uid_map", "rb") as f:
+            if f.read().split() != _INITIAL_UID_MAP:
+                return False
+        with open(PROCFS_PATH + "/self/status", "rb") as f:
+            for line in f:
+                if line.startswith(b"CapEff:"):
+                    return bool((int(line.split()[1], 16) >> _CAP_SYS_RESOURCE) & 1)
+    except (OSError, ValueError):
+        pass
+    return False
+
+
+# The result of `OomScoreAdjWriter.write`: the number of writes in each outcome,
+# and a list of `(pid, error)` for each write that was not applied because the
+# process had vanished (`ProcessLookupError`) or was not permitted
+# (`PermissionError`).
+OomScoreAdjWriteReport = namedtuple("OomScoreAdjWriteReport",
+        ("num_applied", "num_skipped", "num_vanished", "num_denied", "failures"))
+
+
+class OomScoreAdjWriter(object):
+    """Write "/proc/${pid}/oom_score_adj" for many processes, in bulk.
+
+    Method `write` takes a mapping of PID -> desired `oom_score_adj`.  If the
+    current values (as already read by the query that chose the processes) are
+    also supplied, any write that would not change the value is skipped.
+
+    Each write uses `os.open` & `os.write` directly (rather than a buffered
+    text file).  The file descriptors of up to `max_open_fds` processes are
+    kept open & re-used by later calls to `write` (eg, by a daemon that writes
+    the same process more than once), until `close()` is called.  A kept file
+    descriptor always refers to the process that it was opened for: if that
+    process has exited (and its PID has been re-used), the write fails with
+    `ESRCH`, so the file is re-opened for the new process.
+    """
+    __slots__ = ("max_open_fds", "num_files_opened", "_fds")
+
+    def __init__(self, max_open_fds=256):
+        if max_open_fds < 0:
+            raise ValueError("invalid max open fds: %s" % max_open_fds)
+        self.max_open_fds = max_open_fds
+        self.num_files_opened = 0
+        # PID -> open file descriptor, in order of last use.
+        self._fds = {}
+
+    def close(self):
+        """Close all the kept file descriptors."""
+        fds = self._fds
+        while fds:
+            (pid, fd) = fds.popitem()
+            os.close(fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, desired_adjs, current_adjs=None, dry_run=False):
+        """Write each PID -> `oom_score_adj` in mapping `desired_adjs`.
+
+        If `current_adjs` is not `None`, it's a mapping of PID -> the current
+        `oom_score_adj`; the write is skipped for each PID whose current value
+        is already the desired value.
+
+        If `dry_run` is true, don't write anything: instead, check (using
+        `os.access`) whether each file exists & is writable.  But `os.access`
+        always succeeds for root, and the kernel also requires capability
+        `CAP_SYS_RESOURCE` (in the initial user namespace) to lower the value
+        below the process's minimum, which can't be read from "/proc".  So a
+        dry run that would lower the value (below the current value, from
+        `current_adjs` or else read from the file) also checks that this
+        process has that capability.  (If the minimum is lower than the current
+        value, this might predict a `PermissionError` for a write that would
+        actually succeed.)
+
+        Return an `OomScoreAdjWriteReport`.
+        """
+        if current_adjs is None:
+            current_adjs = {}
+        num_applied = 0
+        num_skipped = 0
+        failures = []
+        # Whether this process can lower the values (only checked in a dry run).
+        can_lower = None
+        for pid, oom_score_adj in desired_adjs.items():
+            if not (OOM_SCORE_ADJ_MIN <= oom_score_adj <= OOM_SCORE_ADJ_MAX):
+                raise ValueError("invalid oom_score_adj: %s" % oom_score_adj)
+            if current_adjs.get(pid) == oom_score_adj:
+                num_skipped += 1
+                continue
+            try:
+                if dry_run:
+                    self._check_writable(pid)
+                    current_adj = current_adjs.get(pid)
+                    if current_adj is None:
+                        current_adj = self._read_current(pid)
+                    if oom_score_adj < current_adj:
+                        if can_lower is None:
+                            can_lower = has_cap_sys_resource()
+                        if not can_lower:
+                            raise PermissionError(errno.EACCES, os.strerror(errno.EACCES),
+                                    "%s/%d/oom_score_adj" % (PROCFS_PATH, pid))
+                else:
+                    self._write_one(pid, b"%d\n" % oom_score_adj)
+                num_applied += 1
+            except (PermissionError, ProcessLookupError) as e:
+                failures.append((pid, e))
+
+        num_vanished = sum(1 for pid, e in failures if isinstance(e, ProcessLookupError))
+        return OomScoreAdjWriteReport(num_applied, num_skipped,
+                num_vanished, len(failures) - num_vanished, failures)
+
+    def _check_writable(self, pid):
+        path = "%s/%d/oom_score_adj" % (PROCFS_PATH, pid)
+        if not os.access(path, os.W_OK):
+            if not os.path.exists(path):
+                raise ProcessLookupError(pid)
+            raise PermissionError(errno.EACCES, os.strerror(errno.EACCES), path)
+
+    def _read_current(self, pid):
+        try:
+            return _read_int_from_file("%s/%d/oom_score_adj" % (PROCFS_PATH, pid))
+        except FileNotFoundError:
+            raise ProcessLookupError(pid)
+
+    def _write_one(self, pid, data):
+        fds = self._fds
+        fd = fds.pop(pid, None)
+        if fd is not None:
+            try:
+                os.write(fd, data)
+            except ProcessLookupError:
+                # The process has exited; its PID might have been re-used.
+                os.close(fd)
+                fd = None
+            except BaseException:
+                os.close(fd)
+                raise
+            else:
+                fds[pid] = fd
+                return
+
+        try:
+            fd = os.open("%s/%d/oom_score_adj" % (PROCFS_PATH, pid),
+                    os.O_WRONLY | os.O_CLOEXEC)
+        except FileNotFoundError:
+            raise ProcessLookupError(pid)
+        self.num_files_opened += 1
+        try:
+            os.write(fd, data)
+        except BaseException:
+            os.close(fd)
+            raise
+
+        if self.max_open_fds > 0:
+            if len(fds) >= self.max_open_fds:
+                # Close the least-recently used.
+                os.close(fds.pop(next(iter(fds))))
+            fds[pid] = fd
+        else:
+            os.close(fd)
+
+
+# Indices into the whitespace-separated fields of "/proc/${pid}/stat" that
+# follow the parenthesised executable name (ie, starting at field (3) `state`).
+#  $ man 5 proc  # then search for "/proc/[pid]/stat"
+_STAT_IDX_PPID = 1       # (4) ppid
+_STAT_IDX_TTY_NR = 4     # (7) tty_nr
+_STAT_IDX_UTIME = 11     # (14) utime
+_STAT_IDX_STIME = 12     # (15) stime
+_STAT_IDX_CUTIME = 13    # (16) cutime
+_STAT_IDX_CSTIME = 14    # (17) cstime
+_STAT_IDX_STARTTIME = 19 # (22) starttime
+
+
+def list_proc_pids():
+    """Return a list of the PIDs of all processes, in ascending order."""
+    return sorted(int(d) for d in os.listdir(PROCFS_PATH) if d.isdigit())
+
+
+def proc_pid_exists(pid):
+    """Return whether a process with PID `pid` currently exists."""
+    return pid > 0 and os.path.exists("%s/%d" % (PROCFS_PATH, pid))
+
+
+class ProcReaderCaches(object):
+    """The system-wide values that are cached by a `ProcReader`.
+
+    These are the values (such as the boot-time & the terminal-device map)
+    that are needed to decode per-process values, and the `CgroupMemory` of
+    each cgroup (v2) that is requested.  Each value is looked-up when it's
+    first needed, and then re-used.
+
+    A `ProcReaderCaches` may be shared by several `ProcReader` instances (eg,
+    the readers of the concurrent batches of an async query), so that each
+    system-wide value is looked-up at most once per query.  Unlike a
+    `ProcReader`, it's thread-safe.  (But if readers in different threads
+    request the same cgroup at the same time, its files might be read by each
+    of them.)
+    """
+    __slots__ = ("cgroup_memory", "_lock", "_boot_time", "_terminal_map", "_cgroup2_mount")
+
+    def __init__(self):
+        # A look-up table of cgroup path -> `CgroupMemory`.
+        self.cgroup_memory = {}
+        self._lock = Lock()
+        self._boot_time = None
+        self._terminal_map = None
+        self._cgroup2_mount = None
+
+    @property
+    def cgroup2_mount(self):
+        """The path at which the cgroup2 file-system is mounted, or `None`."""
+        if self._cgroup2_mount is None:
+            with self._lock:
+                if self._cgroup2_mount is None:
+                    # Use "" (rather than `None`) to remember that there is no mount.
+                    self._cgroup2_mount = _find_cgroup2_mount() or ""
+        return self._cgroup2_mount or None
+
+    @property
+    def boot_time(self):
+        """The system boot-time, in seconds since the epoch, in UTC."""
+        if self._boot_time is None:
+            with self._lock:
+                if self._boot_time is None:
+                    self._boot_time = _read_boot_time()
+        return self._boot_time
+
+    @property
+    def terminal_map(self):
+        """A look-up table of terminal device number -> terminal device path.
+
+        This is the same look-up table that `psutil` constructs to implement
+        method `Process.terminal()`.
+        """
+        if self._terminal_map is None:
+            with self._lock:
+                if self._terminal_map is None:
+                    self._terminal_map = _get_terminal_map()
+        return self._terminal_map
+
+
+def _read_boot_time():
+    path = PROCFS_PATH + "/stat"
+    with open(path, "rb") as f:
+        for line in f:
+            if line.startswith(b"btime"):
+                return float(line.split()[1])
+    raise ValueError("did not read `btime` from file `%s`" % path)
+
+
+def _get_terminal_map():
+    terminal_map = {}
+    for name in glob("/dev/tty*") + glob("/dev/pts/*"):
+        try:
+            terminal_map[os.stat(name).st_rdev] = name
+        except OSError:
+            pass
+    return terminal_map
+
+
+class ProcReader(object):
+    """Per-query state & settings for reading processes from "/proc".
+
+    Create a new `ProcReader` for each query.  It caches system-wide values
+    (such as the boot-time & the terminal-device map) that are needed to decode
+    per-process values, so that they are looked-up at most once per query.
+
+    It also counts the number of per-process files it has opened, in attribute
+    `num_files_opened`.
+
+    It also caches the `CgroupMemory` of each cgroup (v2) that is requested,
+    so that the files of each cgroup are read at most once per query, and
+    shared by all the processes in that cgroup.  (So a parallel query will
+    read the files of each cgroup at most once per chunk.)
+
+    The system-wide values are cached in the `ProcReaderCaches` in attribute
+    `caches`, which may be supplied (eg, to share it between the readers of
+    the batches of an async query); otherwise, new caches are created.
+
+    User names are resolved by the `_users.UserNameResolver` in attribute
+    `user_names`, which may be supplied (eg, to share it between the readers
+    of a parallel query); otherwise, a new resolver is created.
+
+    A `ProcReader` re-uses a buffer for reading, so it must NOT be shared
+    between threads.
+    """
+    __slots__ = ("clock_ticks", "page_size", "num_files_opened", "user_names", "caches",
+            "_int_buf")
+
+    # Big enough for any single integer (plus newline) in an OOM file.
+    _INT_BUF_SIZE = 32
+
+    def __init__(self, user_names=None, caches=None):
+        self.clock_ticks = os.sysconf("SC_CLK_TCK")
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+        self.num_files_opened = 0
+        if user_names is None:
+            user_names = UserNameResolver()
+        self.user_names = user_names
+        if caches is None:
+            caches = ProcReaderCaches()
+        self.caches = caches
+        self._int_buf = bytearray(self._INT_BUF_SIZE)
+
+    def list_pids(self):
+        """Return a list of the PIDs of all processes, in ascending order."""
+        return list_proc_pids()
+
+    def snapshot(self, pid):
+        """Return a new `ProcPidSnapshot` of the process with PID `pid`."""
+        return ProcPidSnapshot(self, pid)
+
+    def read_pid_file(self, pid, fname):
+        """Read & return the `bytes` content of file "/proc/${pid}/${fname}".
+
+        If the process no longer exists, raise `ProcessLookupError`.
+        """
+        try:
+            with open("%s/%d/%s" % (PROCFS_PATH, pid, fname), "rb") as f:
+                self.num_files_opened += 1
+                return f.read()
+        except (FileNotFoundError, ProcessLookupError):
+            raise ProcessLookupError(pid)
+
+    def read_oom_ints(self, pid, oom_attr_names, default_int=0):
+        """Return a tuple of the `int` values of the OOM attributes of `pid`.
+
+        All the files for the OOM attributes in `oom_attr_names` are read in
+        a single pass, using `os.open` & `os.read` into a re-used buffer, and
+        the integers are parsed directly from the bytes (without decoding).
+
+        Any value that can't be read or parsed will be `default_int` instead.
+        But if the process no longer exists, raise `ProcessLookupError`.
+        """
+        buf = self._int_buf
+        path_prefix = "%s/%d/" % (PROCFS_PATH, pid)
+        values = []
+        for attr_name in oom_attr_names:
+            try:
+                fd = os.open(path_prefix + attr_name, os.O_RDONLY)
+            except (FileNotFoundError, ProcessLookupError):
+                raise ProcessLookupError(pid)
+            except OSError as e:
+                values.append(default_int)
+                continue
+
+            self.num_files_opened += 1
+            try:
+                num_bytes = os.readv(fd, (buf,))
+            except OSError as e:
+                num_bytes = 0
+            finally:
+                os.close(fd)
+
+            try:
+                # Function `int()` accepts `bytes` & ignores the trailing newline.
+                values.append(int(buf[:num_bytes]))
+            except ValueError as e:
+                values.append(default_int)
+        return tuple(values)
+
+    def read_cgroup_path(self, pid):
+        """Return the cgroup (v2) path of `pid`, or "" if none.
+
+        If the process no longer exists, raise `ProcessLookupError`.
+        """
+        #  $ man 7 cgroups  # then search for "/proc/[pid]/cgroup"
+        # Each line is "hierarchy-ID:controller-list:cgroup-path"; the line of
+        # the cgroup v2 hierarchy is "0::cgroup-path".
+        for line in self.read_pid_file(pid, "cgroup").splitlines():
+            if line.startswith(b"0::"):
+                return os.fsdecode(line[3:])
+        return ""
+
+    def get_cgroup_memory(self, cgroup_path):
+        """Return the `CgroupMemory` of the cgroup (v2) at `cgroup_path`.
+
+        The files of each cgroup are read at most once per `ProcReaderCaches`.
+        """
+        cgroup_memory = self.caches.cgroup_memory.get(cgroup_path)
+        if cgroup_memory is None:
+            cgroup_memory = self.caches.cgroup_memory[cgroup_path] = \
+                    self._read_cgroup_memory(cgroup_path)
+        return cgroup_memory
+
+    def _read_cgroup_memory(self, cgroup_path):
+        cgroup2_mount = self.cgroup2_mount
+        if not cgroup_path or cgroup2_mount is None:
+            return _NO_CGROUP_MEMORY
+        # The path of a cgroup that has been removed has the suffix " (deleted)",
+        # so its files won't be found, and the defaults will be used.
+        dir_path = cgroup2_mount.rstrip("/") + cgroup_path.rstrip("/") + "/"
+
+        (current, max_, oom, oom_kill, pressure) = _NO_CGROUP_MEMORY
+        data = self._read_cgroup_file(dir_path + "memory.current")
+        if data:
+            current = int(data)
+        data = self._read_cgroup_file(dir_path + "memory.max")
+        if data and not data.startswith(b"max"):
+            max_ = int(data)
+        data = self._read_cgroup_file(dir_path + "memory.events")
+        if data:
+            for line in data.splitlines():
+                (key, value) = line.split()
+                if key == b"oom":
+                    oom = int(value)
+                elif key == b"oom_kill":
+                    oom_kill = int(value)
+        data = self._read_cgroup_file(dir_path + "memory.pressure")
+        if data:
+            # eg, "full avg10=0.00 avg60=0.00 avg300=0.00 total=0"
+            start = data.find(b"full avg10=")
+            if start >= 0:
+                pressure = float(data[start + 11 : data.find(b" ", start + 11)])
+        return CgroupMemory(current, max_, oom, oom_kill, pressure)
+
+    def _read_cgroup_file(self, path):
+        """Return the `bytes` content of the file at `path`, or `None` if error."""
+        try:
+            with open(path, "rb") as f:
+                self.num_files_opened += 1
+                return f.read()
+        except OSError:
+            # Eg, the file doesn't exist in the root cgroup, or the memory
+            # controller is not enabled for this cgroup, or PSI is disabled.
+            return None
+
+    @property
+    def cgroup2_mount(self):
+        """The path at which the cgroup2 file-system is mounted, or `None`."""
+        return self.caches.cgroup2_mount
+
+    @property
+    def boot_time(self):
+        """The system boot-time, in seconds since the epoch, in UTC."""
+        return self.caches.boot_time
+
+    @property
+    def terminal_map(self):
+        """A look-up table of terminal device number -> terminal device path."""
+        return self.caches.terminal_map
+
+
+def _readlink_proc_pid(pid, fname, default_if_missing):
+    """Read the symlink "/proc/${pid}/${fname}"; return the target path.
+
+    If the symlink can't be read due to permissions, return `None` (just like
+    `psutil.process_iter` does for attributes that raise `AccessDenied`).
+
+    If the symlink doesn't exist, but the process *does* still exist (which
+    happens for kernel threads & zombies), return `default_if_missing`.
+    """
+    try:
+        return os.readlink("%s/%d/%s" % (PROCFS_PATH, pid, fname))
+    except PermissionError:
+        return None
+    except (FileNotFoundError, ProcessLookupError):
+        if not os.path.lexists("%s/%d" % (PROCFS_PATH, pid)):
+            raise ProcessLookupError(pid)
+        return default_if_missing
+
+
+class ProcPidSnapshot(object):
+    """A lazily-read snapshot of a single process, for a single query.
+
+    Each file in "/proc/${pid}" is read at most once per snapshot, when the
+    first attribute that requires it is requested.
+    """
+    __slots__ = ("_reader", "pid", "_comm", "_stat_fields", "_statm_fields",
+            "_status", "_cmdline", "_cgroup_path")
+
+    def __init__(self, reader, pid):
+        self._reader = reader
+        self.pid = pid
+        self._comm = None
+        self._stat_fields = None
+        self._statm_fields = None
+        self._status = None
+        self._cmdline = None
+        self._cgroup_path = None
+
+    def get_attrs(self, attr_names, oom_attr_names=()):
+        """Return a new `dict` of attribute name -> value for `attr_names`.
+
+        The attribute names (& the types of the returned values) are the same
+        as those of the corresponding `psutil.Process` methods.
+
+        The OOM attribute names in `oom_attr_names` (which should have been
+        split from the other attribute names by `split_oom_attr_names`) will
+        be read together by `ProcReader.read_oom_ints`.
+
+        If an attribute can't be read due to permissions, its value will be
+        `None` (just like `psutil.process_iter` does for `AccessDenied`).
+
+        If the process no longer exists, raise `ProcessLookupError`.
+        """
+        attr_dict = {}
+        for attr_name in attr_names:
+            try:
+                attr_dict[attr_name] = _PROC_ATTR_GETTERS[attr_name](self)
+            except PermissionError:
+                attr_dict[attr_name] = None
+        if oom_attr_names:
+            attr_dict.update(zip(oom_attr_names,
+                    self._reader.read_oom_ints(self.pid, oom_attr_names)))
+        return attr_dict
+
+    def _read_stat(self):
+        # The executable name (field (2) `comm`) is in parentheses, and may
+        # itself contain spaces & parentheses; so split at the *last* ")".
+        data = self._reader.read_pid_file(self.pid, "stat")
+        lparen = data.find(b"(")
+        rparen = data.rfind(b")")
+        self._comm = data[lparen + 1 : rparen]
+        self._stat_fields = data[rparen + 2 :].split()
+        return self._stat_fields
+
+    def stat_fields(self):
+        return self._stat_fields or self._read_stat()
+
+    def statm_fields(self):
+        statm_fields = self._statm_fields
+        if statm_fields is None:
+            statm_fields = self._statm_fields = \
+                    self._reader.read_pid_file(self.pid, "statm").split()
+        return statm_fields
+
+    def status_value(self, key):
+        """Return the `bytes` value of the line in "status" that starts `key`."""
+        status = self._status
+        if status is None:
+            # Prepend a newline so every line (even the first) starts "\n".
+            status = self._status = b"\n" + self._reader.read_pid_file(self.pid, "status")
+        start = status.find(b"\n" + key + b":")
+        if start < 0:
+            return None
+        start += len(key) + 2
+        end = status.find(b"\n", start)
+        return status[start:end] if end >= 0 else status[start:]
+
+    def cmdline(self):
+        cmdline = self._cmdline
+        if cmdline is None:
+            data = os.fsdecode(self._reader.read_pid_file(self.pid, "cmdline"))
+            if not data:
+                cmdline = []
+            elif "\x00" in data:
+                cmdline = data.rstrip("\x00").split("\x00")
+            else:
+                # Some processes (eg, "sshd: user@pts/0") overwrite their
+                # command-line with a single space-separated string.
+                cmdline = data.split(" ")
+            self._cmdline = cmdline
+        return cmdline
+
+    def cgroup_path(self):
+        cgroup_path = self._cgroup_path
+        if cgroup_path is None:
+            cgroup_path = self._cgroup_path = self._reader.read_cgroup_path(self.pid)
+        return cgroup_path
+
+
+def _get_proc_pid_cgroup(snapshot):
+    return snapshot.cgroup_path()
+
+
+def _get_proc_pid_cgroup_memory(snapshot):
+    return snapshot._reader.get_cgroup_memory(snapshot.cgroup_path())
+
+
+def _get_proc_pid_cmdline(snapshot):
+    # Return a new list, in case the caller mutates it.
+    return list(snapshot.cmdline())
+
+
+def _get_proc_pid_comm(snapshot):
+    # The executable name as truncated by the kernel (to 15 characters), which
+    # is set by each `execve`.  This is not a `psutil` attribute; it's read
+    # (cheaply, from "stat" alone) to identify a process across the refreshes
+    # of a `LiveQuery`.
+    snapshot.stat_fields()
+    return os.fsdecode(snapshot._comm)
+
+
+def _get_proc_pid_cpu_times(snapshot):
+    stat_fields = snapshot.stat_fields()
+    clock_ticks = snapshot._reader.clock_ticks
+    return ProcCpuTimes(
+            int(stat_fields[_STAT_IDX_UTIME]) / clock_ticks,
+            int(stat_fields[_STAT_IDX_STIME]) / clock_ticks,
+            int(stat_fields[_STAT_IDX_CUTIME]) / clock_ticks,
+            int(stat_fields[_STAT_IDX_CSTIME]) / clock_ticks)
+
+
+def _get_proc_pid_create_time(snapshot):
+    reader = snapshot._reader
+    start_ticks = int(snapshot.stat_fields()[_STAT_IDX_STARTTIME])
+    return (start_ticks / reader.clock_ticks) + reader.boot_time
+
+
+def _get_proc_pid_cwd(snapshot):
+    return _readlink_proc_pid(snapshot.pid, "cwd", None)
+
+
+def _get_proc_pid_exe(snapshot):
+    return _readlink_proc_pid(snapshot.pid, "exe", "")
+
+
+def _get_proc_pid_memory_info(snapshot):
+    # The columns of "/proc/${pid}/statm" are (in pages):
+    #   size resident shared text lib data dt
+    # but `psutil` puts `rss` (ie, "resident") before `vms` (ie, "size").
+    page_size = snapshot._reader.page_size
+    (size, resident, shared, text, lib, data, dt) = \
+            (int(v) * page_size for v in snapshot.statm_fields()[:7])
+    return ProcMemoryInfo(resident, size, shared, text, lib, data, dt)
+
+
+def _get_proc_pid_memory_full_info(snapshot):
+    # Like `psutil`, read "/proc/${pid}/smaps_rollup" (Linux 4.14 and later),
+    # which sums all the memory mappings in the kernel; but for some processes,
+    # that file can't be read (even though the process exists), in which case
+    # fall-back to "/proc/${pid}/smaps" (one entry per memory mapping), which
+    # is much slower.  Each entry is eg, "Pss:    1234 kB".
+    #  $ man 5 proc  # then search for "/proc/[pid]/smaps"
+    reader = snapshot._reader
+    try:
+        data = reader.read_pid_file(snapshot.pid, "smaps_rollup")
+    except ProcessLookupError:
+        data = reader.read_pid_file(snapshot.pid, "smaps")
+    uss = pss = swap = 0
+    for line in data.splitlines():
+        if line.startswith(b"Private_"):
+            # "Private_Clean", "Private_Dirty" & "Private_Hugetlb".
+            uss += int(line.split()[1])
+        elif line.startswith(b"Pss:"):
+            pss += int(line.split()[1])
+        elif line.startswith(b"Swap:"):
+            swap += int(line.split()[1])
+    return ProcMemoryFullInfo(*(_get_proc_pid_memory_info(snapshot) +
+            (uss << 10, pss << 10, swap << 10)))
+
+
+def _get_proc_pid_statm_pages(snapshot):
+    # The same split columns of "statm" are shared with `memory_info`.
+    (size, resident, shared, text, lib, data) = snapshot.statm_fields()[:6]
+    return ProcStatmPages(int(size), int(resident), int(shared), int(text), int(data))
+
+
+def _get_proc_pid_memory_status(snapshot):
+    # Each value is eg, b"\t     128 kB".
+    (swap, pte) = (snapshot.status_value(b"VmSwap"), snapshot.status_value(b"VmPTE"))
+    return ProcMemoryStatus(
+            (int(swap.split()[0]) << 10) if swap is not None else 0,
+            (int(pte.split()[0]) << 10) if pte is not None else 0)
+
+
+def statm_pages_from_memory_info(memory_info, page_size):
+    """Convert a `memory_info` named-tuple (in bytes) to a `ProcStatmPages`.
+
+    This is for `psutil`, which reads "/proc/${pid}/statm" for `memory_info`.
+    """
+    return ProcStatmPages(memory_info.vms // page_size, memory_info.rss // page_size,
+            memory_info.shared // page_size, memory_info.text // page_size,
+            memory_info.data // page_size)
+
+
+def _get_proc_pid_name(snapshot):
+    snapshot.stat_fields()
+    name = os.fsdecode(snapshot._comm)
+    # The kernel truncates `comm` to 15 characters.  Like `psutil`, try to
+    # recover the full executable name from the first command-line argument.
+    if len(name) >= 15:
+        try:
+            cmdline = snapshot.cmdline()
+        except PermissionError:
+            cmdline = None
+        if cmdline:
+            extended_name = os.path.basename(cmdline[0])
+            if extended_name.startswith(name):
+                name = extended_name
+    return name
+
+
+def _get_proc_pid_pid(snapshot):
+    return snapshot.pid
+
+
+def _get_proc_pid_ppid(snapshot):
+    return int(snapshot.stat_fields()[_STAT_IDX_PPID])
+
+
+def _get_proc_pid_terminal(snapshot):
+    tty_nr = int(snapshot.stat_fields()[_STAT_IDX_TTY_NR])
+    if tty_nr == 0:
+        return None
+    return snapshot._reader.terminal_map.get(tty_nr)
+
+
+def _get_proc_pid_uids(snapshot):
+    (real, effective, saved) = snapshot.status_value(b"Uid").split()[:3]
+    return ProcUids(int(real), int(effective), int(saved))
+
+
+def _get_proc_pid_username(snapshot):
+    return snapshot._reader.user_names.get_user_name(_get_proc_pid_uids(snapshot).real)
+
+
+# A look-up table of attribute name -> attribute getter function.
+_PROC_ATTR_GETTERS = dict(
+        cgroup=_get_proc_pid_cgroup,
+        cgroup_memory=_get_proc_pid_cgroup_memory,
+        cmdline=_get_proc_pid_cmdline,
+        comm=_get_proc_pid_comm,
+        cpu_times=_get_proc_pid_cpu_times,
+        create_time=_get_proc_pid_create_time,
+        cwd=_get_proc_pid_cwd,
+        exe=_get_proc_pid_exe,
+        memory_full_info=_get_proc_pid_memory_full_info,
+        memory_info=_get_proc_pid_memory_info,
+        memory_status=_get_proc_pid_memory_status,
+        name=_get_proc_pid_name,
+        pid=_get_proc_pid_pid,
+        ppid=_get_proc_pid_ppid,
+        statm_pages=_get_proc_pid_statm_pages,
+        terminal=_get_proc_pid_terminal,
+        uids=_get_proc_pid_uids,
+        username=_get_proc_pid_username,
+)
@@ -0,0 +1,312 @@
+# Copyright (c) 2020 James Boyden <jboy@jboy.me>. All rights reserved.
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""A time-series of per-process field values (eg, memory usage), for leak detection."""
+
+from array import array
+from collections import deque
+from operator import attrgetter
+from time import monotonic
+
+from ._fields import get_field_type
+
+
+# Each time is stored as the (unsigned 32-bit) number of milliseconds since
+# the previous sample of the same process; each value is stored as the (signed
+# 32-bit) difference from the previous value of the same field.
+_TIME_DELTA_TYPECODE = "I"
+_VALUE_DELTA_TYPECODE = "i"
+
+# The initial capacity (number of deltas) of each new ring buffer; the capacity
+# is doubled as needed, up to the maximum number of samples per process.
+_INITIAL_RING_CAPACITY = 8
+
+
+class _SampleRing(object):
+    """A ring buffer of the samples of a single process, delta-encoded.
+
+    The oldest sample is stored in full (`base_time` & `base_values`); each
+    later sample is stored as the deltas from the sample before it.  The most
+    recent sample is also stored in full (`last_time` & `last_values`), so that
+    the most recent samples can be reconstructed backwards from it.
+    """
+    __slots__ = ("start_time", "base_time", "base_values", "last_time", "last_values",
+            "time_deltas", "value_deltas", "head", "num_deltas")
+
+    def __init__(self, start_time, sample_time, values):
+        self.start_time = start_time
+        self.base_time = self.last_time = sample_time
+        self.base_values = list(values)
+        self.last_values = list(values)
+        self.time_deltas = array(_TIME_DELTA_TYPECODE)
+        self.value_deltas = tuple(array(_VALUE_DELTA_TYPECODE) for v in values)
+        # The physical index of the oldest delta in each array.
+        self.head = 0
+        self.num_deltas = 0
+
+    @property
+    def num_samples(self):
+        return self.num_deltas + 1
+
+    @property
+    def num_bytes(self):
+        return sum(a.itemsize * len(a) for a in ((self.time_deltas,) + self.value_deltas))
+
+    def append(self, sample_time, values, max_deltas):
+        """Append a sample; evict the oldest sample if there are `max_deltas`.
+
+        Return the change in the number of samples (ie, 1 or 0).  If a delta is
+        too large to store, raise `OverflowError` (& leave the ring unchanged).
+        """
+        # Check every delta (for overflow) before changing anything.
+        new_time_delta = array(_TIME_DELTA_TYPECODE, (sample_time - self.last_time,))
+        new_value_deltas = array(_VALUE_DELTA_TYPECODE,
+                (v - last_v for v, last_v in zip(values, self.last_values)))
+
+        time_deltas = self.time_deltas
+        capacity = len(time_deltas)
+        num_samples_added = 1
+        if self.num_deltas == capacity:
+            if capacity < max_deltas:
+                self._grow(min(max(capacity * 2, _INITIAL_RING_CAPACITY), max_deltas))
+            else:
+                self.evict_oldest()
+                num_samples_added = 0
+
+        capacity = len(time_deltas)
+        idx = (self.head + self.num_deltas) % capacity
+        time_deltas[idx] = new_time_delta[0]
+        for value_deltas, value_delta in zip(self.value_deltas, new_value_deltas):
+            value_deltas[idx] = value_delta
+        self.num_deltas += 1
+        self.last_time = sample_time
+        self.last_values[:] = values
+        return num_samples_added
+
+    def _grow(self, new_capacity):
+        # Rotate the arrays so that the oldest delta is at physical index 0,
+        # then extend them (with zeros) at the end.
+        head = self.head
+        extension = new_capacity - len(self.time_deltas)
+        for a in ((self.time_deltas,) + self.value_deltas):
+            if head:
+                a[:] = a[head:] + a[:head]
+            a.extend(array(a.typecode, bytes(a.itemsize * extension)))
+        self.head = 0
+
+    def compact(self):
+        """Shrink the arrays to the current number of deltas.
+
+        This releases the storage of any evicted deltas (& of any capacity that
+        has not been used yet); the arrays will be grown again as needed.
+        """
+        head = self.head
+        num_deltas = self.num_deltas
+        for a in ((self.time_deltas,) + self.value_deltas):
+            if head:
+                a[:] = a[head:] + a[:head]
+            del a[num_deltas:]
+        self.head = 0
+
+    def evict_oldest(self):
+        """Evict the oldest sample (there must be more than 1 sample)."""
+        head = self.head
+        self.base_time += self.time_deltas[head]
+        base_values = self.base_values
+        for i, value_deltas in enumerate(self.value_deltas):
+            base_values[i] += value_deltas[head]
+        self.head = (head + 1) % len(self.time_deltas)
+        self.num_deltas -= 1
+
+    def iter_samples_backwards(self, value_idx):
+        """Iterate over `(sample_time, value)` from the newest to the oldest sample."""
+        sample_time = self.last_time
+        value = self.last_values[value_idx]
+        yield (sample_time, value)
+        time_deltas = self.time_deltas
+        value_deltas = self.value_deltas[value_idx]
+        capacity = len(time_deltas)
+        head = self.head
+        for i in range(self.num_deltas - 1, -1, -1):
+            idx = (head + i) % capacity
+            sample_time -= time_deltas[idx]
+            value -= value_deltas[idx]
+            yield (sample_time, value)
+
+
+class MemorySampler(object):
+    """Sample integer fields (eg, `rszk` & `ooms`) of processes over time.
+
+    The samples of each process are kept in a ring buffer in memory, in which
+    the sample times & the field values are delta-encoded in `array` storage
+    (4 bytes per field per sample, plus 4 bytes for the time).  Each process
+    keeps at most `max_samples_per_pid` samples; and all the processes share
+    a memory budget of `memory_budget_bytes` for the storage of the samples
+    (ie, `num_bytes`, which counts the allocated capacity of each buffer, not
+    just the stored samples).  When a buffer or the budget is full, the oldest
+    samples are evicted first, & the buffers that are over-allocated are
+    shrunk to fit.  (But at least the most recent sample of each process is
+    always kept.)
+
+    The samples are supplied by `add_samples`, as the results of a query that
+    includes the fields `pid` & `starts` (to identify each process, even if
+    its PID is re-used) and the fields in `fields_to_sample`; eg:
+
+        live_query = LiveQuery(("pid", "starts", "rszk", "ooms"), ...)
+        sampler = MemorySampler(("rszk", "ooms"))
+        while True:
+            sampler.add_samples(live_query.refresh())
+            ... sampler.get_slopes("rszk", 60.0) ...
+            time.sleep(1.0)
+
+    The samples of a process are discarded when it's no longer supplied (eg,
+    because it exited).  A value of `None` is stored as the previous value.
+
+    Each field in `fields_to_sample` must have a field type of `int` (which
+    does not change by more than 2**31 between samples), else `ValueError`
+    is raised.
+    """
+    __slots__ = ("fields_to_sample", "max_samples_per_pid", "memory_budget_bytes",
+            "max_samples", "num_samples", "_get_values", "_rings", "_sample_times")
+
+    def __init__(self, fields_to_sample=("rszk", "ooms"),
+            memory_budget_bytes=(1 << 20),
+            max_samples_per_pid=3600):
+        fields_to_sample = tuple(fields_to_sample)
+        if not fields_to_sample:
+            raise ValueError("no fields to sample")
+        for field_name in fields_to_sample:
+            # If the field name is not valid, `ValueError` will be raised.
+            if get_field_type(field_name).py_type is not int:
+                raise ValueError("field cannot be sampled: %s" % field_name)
+        if max_samples_per_pid < 2:
+            raise ValueError("invalid max samples per PID: %s" % max_samples_per_pid)
+
+        self.fields_to_sample = fields_to_sample
+        self.max_samples_per_pid = max_samples_per_pid
+        self.memory_budget_bytes = memory_budget_bytes
+        bytes_per_sample = (array(_TIME_DELTA_TYPECODE).itemsize +
+                array(_VALUE_DELTA_TYPECODE).itemsize * len(fields_to_sample))
+        self.max_samples = memory_budget_bytes // bytes_per_sample
+        self.num_samples = 0
+        self._get_values = attrgetter("pid", "starts", *fields_to_sample)
+        # PID -> `_SampleRing`.
+        self._rings = {}
+        # The time of each call to `add_samples` that might still be stored,
+        # so that the oldest samples (of all the processes) can be evicted.
+        # Each process keeps at most `max_samples_per_pid` samples (from that
+        # many different calls), so no older time can still be stored.
+        self._sample_times = deque(maxlen=max_samples_per_pid)
+
+    def __len__(self):
+        """The number of processes that have samples."""
+        return len(self._rings)
+
+    @property
+    def num_bytes(self):
+        """The number of bytes allocated for the (delta-encoded) samples."""
+        return sum(ring.num_bytes for ring in self._rings.values())
+
+    def add_samples(self, queried_procs, sample_time=None):
+        """Add a sample of each process in `queried_procs`.
+
+        The `sample_time` is in seconds (default: `time.monotonic()`).
+        """
+        if sample_time is None:
+            sample_time = monotonic()
+        sample_time_ms = int(sample_time * 1000)
+        # No single buffer may grow larger than the whole memory budget.
+        max_deltas = max(min(self.max_samples_per_pid, self.max_samples) - 1, 1)
+        num_samples = self.num_samples
+        get_values = self._get_values
+        old_rings = self._rings
+        new_rings = {}
+        for qp in queried_procs:
+            (pid, start_time, *values) = get_values(qp)
+            ring = old_rings.pop(pid, None)
+            if ring is not None and ring.start_time == start_time:
+                if None in values:
+                    values = [(last_v if v is None else v)
+                            for v, last_v in zip(values, ring.last_values)]
+                try:
+                    num_samples += ring.append(sample_time_ms, values, max_deltas)
+                    new_rings[pid] = ring
+                    continue
+                except OverflowError:
+                    # Start again with this sample.
+                    pass
+            if ring is not None:
+                num_samples -= ring.num_samples
+            values = [(0 if v is None else v) for v in values]
+            new_rings[pid] = _SampleRing(start_time, sample_time_ms, values)
+            num_samples += 1
+
+        # The remaining old rings are for processes that were not supplied.
+        for ring in old_rings.values():
+            num_samples -= ring.num_samples
+        self._rings = new_rings
+        self.num_samples = num_samples
+
+        sample_times = self._sample_times
+        sample_times.append(sample_time_ms)
+        while self.num_samples > self.max_samples and len(sample_times) > 1:
+            self._evict_oldest_samples(sample_times.popleft())
+        if self.num_bytes > self.memory_budget_bytes:
+            # The samples fit within the budget, but the buffers (which double
+            # their capacity as they grow) might not; so shrink them to fit.
+            for ring in self._rings.values():
+                if len(ring.time_deltas) > ring.num_deltas:
+                    ring.compact()
+
+    def _evict_oldest_samples(self, oldest_time):
+        num_samples = self.num_samples
+        for ring in self._rings.values():
+            if ring.base_time <= oldest_time and ring.num_deltas > 0:
+                ring.evict_oldest()
+                num_samples -= 1
+        self.num_samples = num_samples
+
+    def get_slope(self, pid, field_name, window_secs):
+        """Return the growth rate (per second) of a field of process `pid`.
+
+        The growth rate is the slope of the least-squares line through the
+        samples of the last `window_secs` seconds (up to the most recent
+        sample of process `pid`).  If there are fewer than 2 such samples (or
+        no samples of process `pid`), return `None`.
+        """
+        ring = self._rings.get(pid)
+        if ring is None:
+            return None
+        value_idx = self._get_value_idx(field_name)
+        cutoff_time = ring.last_time - int(window_secs * 1000)
+
+        last_time = ring.last_time
+        n = 0
+        sum_t = sum_v = sum_tt = sum_tv = 0.0
+        for sample_time, value in ring.iter_samples_backwards(value_idx):
+            if sample_time < cutoff_time:
+                break
+            t = (sample_time - last_time) / 1000.0
+            n += 1
+            sum_t += t
+            sum_v += value
+            sum_tt += t * t
+            sum_tv += t * value
+        denominator = n * sum_tt - sum_t * sum_t
+        if n < 2 or denominator == 0.0:
+            return None
+        return (n * sum_tv - sum_t * sum_v) / denominator
+
+    def get_slopes(self, field_name, window_secs):
+        """Return a new `dict` of PID -> growth rate (see `get_slope`)."""
+        self._get_value_idx(field_name)
+        return dict((pid, self.get_slope(pid, field_name, window_secs))
+                for pid in self._rings)
+
+    def _get_value_idx(self, field_name):
+        try:
+            return self.fields_to_sample.index(field_name)
+        except ValueError:
+            raise ValueError("field not sampled: %s" % field_name)
@@ -0,0 +1,394 @@
+# Copyright (c) 2020 James Boyden <jboy@jboy.me>. All rights reserved.
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""A compact binary file format for recorded snapshots of queried processes.
+
+A snapshot file starts with a file header, which describes the recorded fields
+(the name & the value type of each field).  Then follow any number of snapshot
+records, which are appended to the file one at a time.
+
+Each snapshot record is framed by its length (so that a reader can skip from
+record to record without reading the contents of each record), and contains:
+ 1. a snapshot header:  the time of the snapshot, the values of `MemoryInfo`
+    & `OvercommitSettings`, and the number of strings & rows that follow;
+ 2. a string table:  each distinct string in the snapshot, stored just once
+    (eg, the user name or the executable name of many processes);
+ 3. the rows:  the field values of each process, in a fixed-size binary row,
+    in which each string value is an index into the string table.
+
+Each snapshot record is self-contained, so that any snapshot can be read
+without reading any other snapshot.  All numbers are little-endian.
+"""
+
+import mmap
+import struct
+from collections import namedtuple
+from itertools import chain
+from math import isnan
+
+from ._procio import _OVERCOMMIT_DESCRS, OvercommitSettings
+
+
+SNAPSHOT_FILE_MAGIC = b"OOMPSNAP"
+SNAPSHOT_FILE_VERSION = 1
+
+# The file header:  magic, version, number of fields; then for each field:
+# the typecode (1 char), the length of the field name, then the field name.
+_FILE_HEADER = struct.Struct("<8sHH")
+_FIELD_HEADER = struct.Struct("<cB")
+
+# The length of each snapshot record (not including this length itself).
+_RECORD_LEN = struct.Struct("<I")
+
+# The snapshot header:  snapshot time (secs since UNIX epoch); the 9 values of
+# `MemoryInfo` (of which the 5th, "mem_avail_perc", is a float); the overcommit
+# mode & ratio (each -1 if unknown); then the number of strings & rows.
+_SNAPSHOT_HEADER = struct.Struct("<d4qd4qiiII")
+
+# The string table:  an array of `num_strings + 1` offsets into a blob of the
+# concatenated UTF-8 strings (so the length of string `i` is the difference
+# between offsets `i + 1` & `i`), followed by that blob.
+_STRING_OFFSET = struct.Struct("<I")
+
+# The typecode of each field value in a row.  A string value is an index into
+# the string table of its snapshot.
+_TYPECODE_INT = b"q"
+_TYPECODE_FLOAT = b"d"
+_TYPECODE_STR = b"I"
+
+# A `None` value is stored as a sentinel value of the same type.
+_NONE_INT = -(1 << 63)
+_NONE_FLOAT = float("nan")
+_NONE_STR = 0xFFFFFFFF
+
+
+def get_field_typecode(field_name, py_type):
+    """Return the typecode to record values of Python type `py_type`.
+
+    If values of `py_type` can't be recorded (eg, a `tuple`), raise `ValueError`.
+    """
+    if isinstance(py_type, tuple):
+        # It's a value that might be `None`, eg `(str, type(None))`.
+        py_types = set(py_type) - {type(None)}
+        if len(py_types) == 1:
+            py_type = py_types.pop()
+    if py_type is int:
+        return _TYPECODE_INT
+    elif py_type is float:
+        return _TYPECODE_FLOAT
+    elif py_type is str:
+        return _TYPECODE_STR
+    raise ValueError("field cannot be recorded: %s" % field_name)
+
+
+def _get_row_struct(typecodes):
+    return struct.Struct("<" + b"".join(typecodes).decode("ascii"))
+
+
+class SnapshotWriter(object):
+    """Append snapshot records to a snapshot file.
+
+    If the file at `path` does not exist (or is empty), it will be created,
+    and the file header for the fields `field_names` (with corresponding
+    typecodes `typecodes`) will be written.  Otherwise, the existing file
+    header must describe exactly the same fields, else `ValueError` is raised.
+
+    Each snapshot record is written with a single `write` (then flushed), so
+    that if the writer is interrupted, at most the last snapshot record will
+    be incomplete (and a `SnapshotReader` will ignore it).  When an existing
+    file is opened, an incomplete last record is truncated before any new
+    record is appended, so that the new records can be read.
+    """
+    __slots__ = ("field_names", "num_snapshots", "_typecodes", "_str_idxs", "_row_struct",
+            "_file")
+
+    def __init__(self, path, field_names, typecodes):
+        self.field_names = tuple(field_names)
+        self.num_snapshots = 0
+        self._typecodes = tuple(typecodes)
+        self._str_idxs = tuple(idx for idx, typecode in enumerate(self._typecodes)
+                if typecode == _TYPECODE_STR)
+        self._row_struct = _get_row_struct(self._typecodes)
+
+        # In append mode, every write is at the end of the file, regardless of
+        # any `seek` (which is only used to read the existing file header).
+        f = open(path, "a+b")
+        try:
+            f.seek(0)
+            existing_header = f.read(_FILE_HEADER.size)
+            if existing_header:
+                # Read (at least) the rest of the file header: each field name
+                # is at most 255 bytes long.
+                (magic, version, num_fields) = _unpack_file_header(existing_header)
+                existing_header += f.read(num_fields * (_FIELD_HEADER.size + 255))
+                (field_names, typecodes, header_len) = _parse_file_header(existing_header)
+                if (field_names, typecodes) != (self.field_names, self._typecodes):
+                    raise ValueError("snapshot file has different fields: %s" % path)
+                self._truncate_incomplete_record(f, header_len)
+            else:
+                f.write(_build_file_header(self.field_names, self._typecodes))
+                f.flush()
+        except BaseException:
+            f.close()
+            raise
+        self._file = f
+
+    @staticmethod
+    def _truncate_incomplete_record(f, header_len):
+        # Walk the records just like a `SnapshotReader`, so that the new
+        # records will be framed exactly where the reader expects them.
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            file_len = len(m)
+            (record_offsets, end_offset) = _find_complete_records(m, header_len)
+        if end_offset < file_len:
+            f.truncate(end_offset)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_snapshot(self, rows, memory_info, overcommit_settings, snapshot_time):
+        """Append a snapshot record of `rows` (each a sequence of field values)."""
+        str_idxs = self._str_idxs
+        typecodes = self._typecodes
+        pack_row = self._row_struct.pack
+        strings = {}
+        packed_rows = []
+        for row in rows:
+            row = list(row)
+            for i in str_idxs:
+                s = row[i]
+                if s is None:
+                    row[i] = _NONE_STR
+                else:
+                    # Each distinct string is stored just once per snapshot.
+                    row[i] = strings.setdefault(s, len(strings))
+            packed_rows.append(pack_row(*(_none_sentinel(v, tc)
+                    for v, tc in zip(row, typecodes))))
+
+        # Dicts retain insertion order, so `strings` is in order of index.
+        encoded_strings = [s.encode("utf-8", "surrogateescape") for s in strings]
+        offsets = [0]
+        for s in encoded_strings:
+            offsets.append(offsets[-1] + len(s))
+
+        if overcommit_settings is None:
+            overcommit_settings = (None, None, None)
+        (overcommit_mode, overcommit_descr, overcommit_ratio) = overcommit_settings
+        record = b"".join(chain(
+                (_SNAPSHOT_HEADER.pack(snapshot_time, *memory_info,
+                        -1 if overcommit_mode is None else overcommit_mode,
+                        -1 if overcommit_ratio is None else overcommit_ratio,
+                        len(encoded_strings), len(packed_rows)),),
+                (_STRING_OFFSET.pack(offset) for offset in offsets),
+                encoded_strings,
+                packed_rows))
+
+        self._file.write(_RECORD_LEN.pack(len(record)) + record)
+        self._file.flush()
+        self.num_snapshots += 1
+
+
+def _none_sentinel(value, typecode):
+    if value is not None:
+        return value
+    return _NONE_FLOAT if typecode == _TYPECODE_FLOAT else _NONE_INT
+
+
+def _build_file_header(field_names, typecodes):
+    header = [_FILE_HEADER.pack(SNAPSHOT_FILE_MAGIC, SNAPSHOT_FILE_VERSION, len(field_names))]
+    for field_name, typecode in zip(field_names, typecodes):
+        encoded_name = field_name.encode("ascii")
+        header.append(_FIELD_HEADER.pack(typecode, len(encoded_name)))
+        header.append(encoded_name)
+    return b"".join(header)
+
+
+def _unpack_file_header(data):
+    """Return `(magic, version, num_fields)` from the start of `data` (if valid)."""
+    if len(data) < _FILE_HEADER.size:
+        raise ValueError("not a snapshot file (too short)")
+    (magic, version, num_fields) = _FILE_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_FILE_MAGIC:
+        raise ValueError("not a snapshot file (bad magic)")
+    if version != SNAPSHOT_FILE_VERSION:
+        raise ValueError("unsupported snapshot file version: %d" % version)
+    return (magic, version, num_fields)
+
+
+def _parse_file_header(data):
+    """Return `(field_names, typecodes, header_len)` from the file header in `data`."""
+    (magic, version, num_fields) = _unpack_file_header(data)
+    field_names = []
+    typecodes = []
+    offset = _FILE_HEADER.size
+    for i in range(num_fields):
+        if offset + _FIELD_HEADER.size > len(data):
+            raise ValueError("not a snapshot file (truncated header)")
+        (typecode, name_len) = _FIELD_HEADER.unpack_from(data, offset)
+        offset += _FIELD_HEADER.size
+        field_name = data[offset:offset + name_len].decode("ascii")
+        offset += name_len
+        if typecode not in (_TYPECODE_INT, _TYPECODE_FLOAT, _TYPECODE_STR):
+            raise ValueError("invalid typecode for field %s: %r" % (field_name, typecode))
+        field_names.append(field_name)
+        typecodes.append(typecode)
+    if offset > len(data):
+        raise ValueError("not a snapshot file (truncated header)")
+    return (tuple(field_names), tuple(typecodes), offset)
+
+
+def _find_complete_records(m, offset):
+    """Return `(record_offsets, end_offset)` of the complete records in `m`.
+
+    The records start at `offset` (ie, after the file header).  Skip from record
+    to record, reading only the length of each; stop at the first incomplete
+    record (if any), the offset of which is `end_offset`.
+    """
+    record_offsets = []
+    file_len = len(m)
+    while offset + _RECORD_LEN.size <= file_len:
+        (record_len,) = _RECORD_LEN.unpack_from(m, offset)
+        if offset + _RECORD_LEN.size + record_len > file_len:
+            break
+        record_offsets.append(offset + _RECORD_LEN.size)
+        offset += _RECORD_LEN.size + record_len
+    return (record_offsets, offset)
+
+
+# The header info of a snapshot record, as stored.  (Module `api` converts
+# `memory_info` to a `MemoryInfo`.)
+SnapshotHeader = namedtuple("SnapshotHeader",
+        ("snapshot_time", "memory_info", "overcommit_settings", "num_rows"))
+
+
+class SnapshotReader(object):
+    """Read the snapshot records of a snapshot file, by memory-mapping it.
+
+    Only the length of each snapshot record is read when the file is opened;
+    the contents of a snapshot record are not read until requested.  So only
+    the pages of the file that contain the requested snapshots are read.
+
+    If the last snapshot record is incomplete (eg, its writer was killed), it
+    will be ignored.  If the file is not a valid snapshot file, the constructor
+    raises `ValueError`.
+    """
+    __slots__ = ("field_names", "typecodes", "RecordedProcess", "_row_struct",
+            "_str_idxs", "_int_idxs", "_float_idxs", "_record_offsets", "_file", "_mmap")
+
+    def __init__(self, path):
+        f = open(path, "rb")
+        try:
+            try:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # It's an empty file, which can't be memory-mapped.
+                raise ValueError("not a snapshot file (empty): %s" % path)
+            try:
+                self._init_from_mmap(m)
+            except BaseException:
+                m.close()
+                raise
+        except BaseException:
+            f.close()
+            raise
+        self._file = f
+        self._mmap = m
+
+    def _init_from_mmap(self, m):
+        # The file header is small, but it's not a fixed size.
+        (magic, version, num_fields) = _unpack_file_header(m[:_FILE_HEADER.size])
+        (self.field_names, self.typecodes, offset) = _parse_file_header(
+                m[:_FILE_HEADER.size + num_fields * (_FIELD_HEADER.size + 255)])
+        self.RecordedProcess = namedtuple("RecordedProcess", self.field_names)
+        self._row_struct = _get_row_struct(self.typecodes)
+        typecodes = self.typecodes
+        self._str_idxs = tuple(i for i, tc in enumerate(typecodes) if tc == _TYPECODE_STR)
+        self._int_idxs = tuple(i for i, tc in enumerate(typecodes) if tc == _TYPECODE_INT)
+        self._float_idxs = tuple(i for i, tc in enumerate(typecodes) if tc == _TYPECODE_FLOAT)
+
+        (self._record_offsets, end_offset) = _find_complete_records(m, offset)
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._record_offsets)
+
+    def read_header(self, snapshot_idx):
+        """Return the `SnapshotHeader` of snapshot `snapshot_idx`.
+
+        If `snapshot_idx` is out of range, raise `IndexError`.
+        """
+        values = _SNAPSHOT_HEADER.unpack_from(self._mmap, self._record_offsets[snapshot_idx])
+        (overcommit_mode, overcommit_ratio, num_strings, num_rows) = values[10:]
+        if overcommit_mode < 0:
+            overcommit_settings = OvercommitSettings(None, None,
+                    None if overcommit_ratio < 0 else overcommit_ratio)
+        else:
+            overcommit_settings = OvercommitSettings(overcommit_mode,
+                    _OVERCOMMIT_DESCRS[overcommit_mode],
+                    None if overcommit_ratio < 0 else overcommit_ratio)
+        return SnapshotHeader(values[0], values[1:10], overcommit_settings, num_rows)
+
+    def iter_rows(self, snapshot_idx):
+        """Iterate over a `RecordedProcess` for each row in snapshot `snapshot_idx`.
+
+        If `snapshot_idx` is out of range, raise `IndexError`.
+        """
+        m = self._mmap
+        offset = self._record_offsets[snapshot_idx]
+        (num_strings, num_rows) = _SNAPSHOT_HEADER.unpack_from(m, offset)[12:]
+        offset += _SNAPSHOT_HEADER.size
+        offsets_len = (num_strings + 1) * _STRING_OFFSET.size
+        string_offsets = struct.unpack_from("<%dI" % (num_strings + 1), m, offset)
+        blob_offset = offset + offsets_len
+        rows_offset = blob_offset + string_offsets[-1]
+        rows_len = num_rows * self._row_struct.size
+
+        # Each string is decoded only when first used, then cached.
+        strings = [None] * num_strings
+
+        def get_string(idx):
+            s = strings[idx]
+            if s is None:
+                s = strings[idx] = m[blob_offset + string_offsets[idx]:
+                        blob_offset + string_offsets[idx + 1]].decode("utf-8",
+                                "surrogateescape")
+            return s
+
+        str_idxs = self._str_idxs
+        int_idxs = self._int_idxs
+        float_idxs = self._float_idxs
+        RecordedProcess = self.RecordedProcess
+        # Unpack each row directly from the mmap (rather than through a
+        # `memoryview`), so that no buffer is exported while this generator is
+        # suspended, and the reader can be closed after a partial iteration.
+        unpack_row = self._row_struct.unpack_from
+        row_size = self._row_struct.size
+        for row_offset in range(rows_offset, rows_offset + rows_len, row_size):
+            values = list(unpack_row(m, row_offset))
+            for i in str_idxs:
+                idx = values[i]
+                values[i] = None if idx == _NONE_STR else get_string(idx)
+            for i in int_idxs:
+                if values[i] == _NONE_INT:
+                    values[i] = None
+            for i in float_idxs:
+                if isnan(values[i]):
+                    values[i] = None
+            yield RecordedProcess._make(values)
@@ -0,0 +1,143 @@
+# Copyright (c) 2020 James Boyden <jboy@jboy.me>. All rights reserved.
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""An index of the process tree (parent -> children) of the queried processes."""
+
+
+class ProcessTree(object):
+    """An index of the parent -> children relationships of a list of processes.
+
+    The tree is built from a sequence of `rows` (in a single pass), each of
+    which has attributes `pid` & `ppid`.  The tree refers to each process by
+    its *row index* in `rows`, so that it can be used with any list (or column)
+    of results that is in the same order as `rows`.
+
+    A process is a root of the tree if its parent is not in `rows` (eg, because
+    the parent was not selected by the query).  The children of each process
+    (and the roots of the tree) are in the order of `rows`.
+
+    The methods `sum_subtrees` & `max_subtrees` roll-up the values of a field
+    over each subtree (ie, a process & all its descendants) in O(n) time.
+    """
+    __slots__ = ("rows", "roots", "_parent_idxs", "_child_idxs", "_preorder")
+
+    def __init__(self, rows):
+        self.rows = rows
+        num_rows = len(rows)
+        idxs_by_pid = {}
+        ppids = []
+        for idx, row in enumerate(rows):
+            idxs_by_pid[row.pid] = idx
+            ppids.append(row.ppid)
+
+        parent_idxs = [None] * num_rows
+        child_idxs = [[] for row in rows]
+        roots = []
+        for idx, ppid in enumerate(ppids):
+            parent_idx = idxs_by_pid.get(ppid)
+            if parent_idx is None or parent_idx == idx:
+                roots.append(idx)
+            else:
+                parent_idxs[idx] = parent_idx
+                child_idxs[parent_idx].append(idx)
+
+        self.roots = roots
+        self._parent_idxs = parent_idxs
+        self._child_idxs = child_idxs
+        self._preorder = self._get_preorder(roots, parent_idxs, child_idxs)
+
+    @staticmethod
+    def _get_preorder(roots, parent_idxs, child_idxs):
+        """Return a list of `(depth, row_idx)` in depth-first pre-order."""
+        preorder = []
+        is_visited = [False] * len(parent_idxs)
+        for root_idx in roots:
+            ProcessTree._visit_depth_first(root_idx, child_idxs, is_visited, preorder)
+
+        if len(preorder) < len(parent_idxs):
+            # Some processes were not reachable from any root, so there is a
+            # cycle of parents.  This can only happen if a PID was re-used
+            # while the processes were being read; break each cycle by making
+            # one of its processes into a root.  (An unvisited process might
+            # only be a descendant of a cycle, so follow its ancestors until
+            # a process repeats: that process is in the cycle.)
+            for idx in range(len(parent_idxs)):
+                if is_visited[idx]:
+                    continue
+                ancestors = set()
+                while idx not in ancestors:
+                    ancestors.add(idx)
+                    idx = parent_idxs[idx]
+                child_idxs[parent_idxs[idx]].remove(idx)
+                parent_idxs[idx] = None
+                roots.append(idx)
+                ProcessTree._visit_depth_first(idx, child_idxs, is_visited, preorder)
+        return preorder
+
+    @staticmethod
+    def _visit_depth_first(root_idx, child_idxs, is_visited, preorder):
+        # Use an explicit stack (rather than recursion), because a process tree
+        # may be deeper than Python's recursion limit.
+        stack = [(0, root_idx)]
+        while stack:
+            (depth, idx) = stack.pop()
+            is_visited[idx] = True
+            preorder.append((depth, idx))
+            stack.extend((depth + 1, c) for c in reversed(child_idxs[idx]))
+
+    def __len__(self):
+        return len(self._parent_idxs)
+
+    def get_parent(self, row_idx):
+        """Return the row index of the parent of `row_idx`, or `None` if a root."""
+        return self._parent_idxs[row_idx]
+
+    def get_children(self, row_idx):
+        """Return a tuple of the row indices of the children of `row_idx`."""
+        return tuple(self._child_idxs[row_idx])
+
+    def iter_depth_first(self):
+        """Iterate over `(depth, row_idx)` for every process, in depth-first order.
+
+        Each root has depth 0; each process is followed by all its descendants.
+        """
+        return iter(self._preorder)
+
+    def sum_subtrees(self, field_name):
+        """Return a list of the sum of field `field_name` over each subtree.
+
+        The list is in the order of `rows`.  A value of `None` (eg, due to
+        permissions) is ignored; if every value in a subtree is `None`, its sum
+        will also be `None`.
+        """
+        return self._aggregate_subtrees(field_name, (lambda a, b: a + b))
+
+    def max_subtrees(self, field_name):
+        """Return a list of the maximum of field `field_name` over each subtree.
+
+        The list is in the order of `rows`.  A value of `None` is ignored, just
+        like in `sum_subtrees`.
+        """
+        return self._aggregate_subtrees(field_name, max)
+
+    def _aggregate_subtrees(self, field_name, combine):
+        # Visit the processes in reverse pre-order, so that every process is
+        # visited after all of its descendants; then combine the aggregate of
+        # each process into the aggregate of its parent.
+        aggregates = [getattr(row, field_name) for row in self.rows]
+        parent_idxs = self._parent_idxs
+        for depth, idx in reversed(self._preorder):
+            parent_idx = parent_idxs[idx]
+            if parent_idx is None:
+                continue
+            value = aggregates[idx]
+            if value is None:
+                continue
+            parent_value = aggregates[parent_idx]
+            if parent_value is None:
+                aggregates[parent_idx] = value
+            else:
+                aggregates[parent_idx] = combine(parent_value, value)
+        return aggregates
@@ -0,0 +1,130 @@
+# Copyright (c) 2020 James Boyden <jboy@jboy.me>. All rights reserved.
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Resolve UIDs to user names, with a bounded cache."""
+
+from collections import OrderedDict
+from pwd import getpwuid
+from threading import Lock
+from time import monotonic
+
+
+# The path of the local password file, which is pre-loaded in bulk.
+#  $ man 5 passwd
+_PASSWD_PATH = "/etc/passwd"
+
+
+def _read_passwd_file(path=_PASSWD_PATH):
+    """Return a list of `(uid, user_name)` from the password file at `path`.
+
+    If a UID occurs more than once, only its first user name is returned
+    (which is the one that `pwd.getpwuid` would return from this file).
+
+    If the file can't be read, return an empty list.
+    """
+    uids_and_names = []
+    seen_uids = set()
+    try:
+        with open(path, "rb") as f:
+            for line in f:
+                # name:password:UID:GID:GECOS:directory:shell
+                fields = line.split(b":", 3)
+                if len(fields) < 4 or not fields[2].isdigit():
+                    # Skip comments, NIS "+" lines, and any other junk.
+                    continue
+                uid = int(fields[2])
+                if uid not in seen_uids:
+                    seen_uids.add(uid)
+                    uids_and_names.append((uid, fields[0].decode(errors="replace")))
+    except OSError:
+        pass
+    return uids_and_names
+
+
+class UserNameResolver(object):
+    """Resolve UIDs to user names, with a bounded LRU cache.
+
+    On hosts that use LDAP (or SSSD, etc.) behind NSS, each `pwd.getpwuid` may
+    be a network round-trip, so each UID should be looked-up at most once per
+    query (rather than once per process).
+
+    On the first look-up, the local password file "/etc/passwd" is pre-loaded
+    into the cache in bulk (up to `max_size` entries); any UIDs that are not
+    in that file are looked-up using `pwd.getpwuid` as they are encountered.
+    (So this assumes that NSS consults "files" first, which is the default.)
+
+    If `ttl_secs` is not `None`, method `expire_if_stale()` will empty the cache
+    (and the password file will be pre-loaded again) when the cache is older
+    than `ttl_secs`; this is intended for a resolver that is re-used across
+    many queries.
+
+    The cache is protected by a lock, so a `UserNameResolver` may be shared
+    between the threads of a single query.
+    """
+    __slots__ = ("max_size", "ttl_secs", "num_hits", "num_misses",
+            "_cache", "_is_preloaded", "_loaded_at", "_lock")
+
+    def __init__(self, max_size=1024, ttl_secs=None):
+        if max_size < 1:
+            raise ValueError("invalid max size: %s" % max_size)
+        self.max_size = max_size
+        self.ttl_secs = ttl_secs
+        self.num_hits = 0
+        self.num_misses = 0
+        self._cache = OrderedDict()
+        self._is_preloaded = False
+        self._loaded_at = monotonic()
+        self._lock = Lock()
+
+    def get_user_name(self, uid):
+        """Return the user name of `uid`, or (like `psutil`) `str(uid)` if none."""
+        cache = self._cache
+        with self._lock:
+            try:
+                user_name = cache[uid]
+            except KeyError:
+                pass
+            else:
+                cache.move_to_end(uid)
+                self.num_hits += 1
+                return user_name
+
+            if not self._is_preloaded:
+                self._preload()
+                if uid in cache:
+                    self.num_hits += 1
+                    return cache[uid]
+
+            self.num_misses += 1
+            try:
+                user_name = getpwuid(uid).pw_name
+            except KeyError:
+                user_name = str(uid)
+            cache[uid] = user_name
+            if len(cache) > self.max_size:
+                # Evict the least-recently used.
+                cache.popitem(last=False)
+            return user_name
+
+    def expire_if_stale(self):
+        """Empty the cache if it's older than `ttl_secs` (if not `None`)."""
+        ttl_secs = self.ttl_secs
+        if ttl_secs is None:
+            return
+        now = monotonic()
+        if now - self._loaded_at >= ttl_secs:
+            with self._lock:
+                self._cache.clear()
+                self._is_preloaded = False
+                self._loaded_at = now
+
+    def __len__(self):
+        return len(self._cache)
+
+    def _preload(self):
+        cache = self._cache
+        for uid, user_name in _read_passwd_file()[:self.max_size]:
+            cache[uid] = user_name
+        self._is_preloaded = True
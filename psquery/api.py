@@ -5,18 +5,43 @@
 
 """Select, filter, sort, and query processes according to requested fields."""
 
+import os
 from abc import ABCMeta, abstractmethod  # Python3 only, sorry  :'(
-from collections import namedtuple
+from array import array
+from asyncio import get_running_loop
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from heapq import nlargest, nsmallest
+from itertools import chain, islice, repeat
 from operator import attrgetter
+from time import perf_counter, time
 
 # Module `_fields` contains the field definitions.
-from ._fields import get_field_info, get_post_proc_settings, list_all_fields
+from ._fields import COST_CHEAP, COST_EXPENSIVE, get_field_info, get_field_type, \
+        get_post_proc_settings, list_all_fields, split_format_func, with_new_format_caches
 # Use `_procio` to augment the capabilities of `psutil`.
-from ._procio import read_overcommit_settings
+from . import _procio
+from ._procio import ProcReader, ProcReaderCaches, list_proc_pids, proc_pid_exists, \
+        read_overcommit_settings, split_cgroup_attr_names, split_oom_attr_names, \
+        statm_pages_from_memory_info
+# Module `_oomscore` estimates the OOM Score from the memory usage.
+from ._oomscore import OOM_SCORE_FORMULA_CURRENT, OOM_SCORE_FORMULA_LEGACY, \
+        estimate_oom_scores as _estimate_oom_score_column, get_kernel_oom_score_formula
+# Module `_sampler` keeps a time-series of per-process field values.
+from ._sampler import MemorySampler
+# Module `_snapshots` reads & writes the binary format of recorded snapshots.
+from ._snapshots import SnapshotReader, SnapshotWriter, get_field_typecode
+# Module `_tree` indexes the parent -> children relationships of processes.
+from ._tree import ProcessTree
+from ._users import UserNameResolver
 
 # https://github.com/giampaolo/psutil
 # https://pypi.org/project/psutil/
 # https://psutil.readthedocs.io/en/latest/
+import psutil
+from psutil import NoSuchProcess as psutil_NoSuchProcess
+from psutil import Process as psutil_Process
+from psutil import pids as psutil_pids
 from psutil import process_iter as psutil_process_iter
 from psutil import virtual_memory as psutil_virtual_memory
 from psutil import swap_memory as psutil_swap_memory
@@ -122,7 +147,10 @@ def _get_field_accessors(field_names, psutil_attr_names=None):
                 assert isinstance(a, str)
                 psutil_attr_names.add(a)
 
-        acc_funcs = field_info.acc_funcs
+        # The formatting function (if any) is split-off, to be applied later
+        # (by a row-formatter function from `_compile_row_formatter`) only to
+        # the field values that are actually returned to the caller.
+        (acc_funcs, format_func) = split_format_func(field_info.acc_funcs)
         if hasattr(acc_funcs, "__call__"):
             # It's just a single accessor function.
             # For speed per-process, optimise for this common case by handling
@@ -150,19 +178,194 @@ def _get_field_accessors(field_names, psutil_attr_names=None):
                 assert hasattr(a, "__call__")
 
         field_accessors.append((field_name,
-                single_attr_name, multi_attr_names, single_acc_func, multi_acc_funcs))
+                single_attr_name, multi_attr_names, single_acc_func, multi_acc_funcs,
+                format_func))
         field_types.append(field_type)
 
     return (tuple(field_accessors), tuple(field_types), psutil_attr_names)
 
 
-def _select_processes(AllFields, field_accessors, psutil_attr_names, selection_funcs, post_proc_settings):
-    selected_processes = []
+class QueryStats(object):
+    """Statistics about the work done by a single query."""
+    __slots__ = ("num_files_opened", "num_processes_scanned", "num_processes_selected",
+            "select_secs", "extract_secs", "num_format_cache_hits", "num_format_cache_misses")
 
-    # Pre-initialise re-usable list `field_values` to the appropriate length,
-    # so we can update a pre-allocated list in-place.
-    field_values = [None for field in field_accessors]
+    def __init__(self):
+        # The number of per-process files opened in "/proc" by `_procio`.
+        # (This does NOT include any files opened internally by `psutil`.)
+        self.num_files_opened = 0
+        # The number of processes visited, and the number that were selected.
+        self.num_processes_scanned = 0
+        self.num_processes_selected = 0
+        # The (accumulated) time in seconds spent in each phase of selection:
+        #  1. "select": evaluating the selection criteria for every process;
+        #  2. "extract": extracting the remaining fields of selected processes.
+        self.select_secs = 0.0
+        self.extract_secs = 0.0
+        # The hits & misses of the memo caches of the formatting functions
+        # (in `_fields.FormatCaches`), including the caches of each worker.
+        self.num_format_cache_hits = 0
+        self.num_format_cache_misses = 0
+
+    def add_format_cache_stats(self, post_proc_settings):
+        """Accumulate the hits & misses of the format caches of `post_proc_settings`."""
+        (num_hits, num_misses) = post_proc_settings.format_caches.get_hits_and_misses()
+        self.num_format_cache_hits += num_hits
+        self.num_format_cache_misses += num_misses
+
+    def add(self, other):
+        """Accumulate the statistics of `other` (eg, from a worker) into `self`."""
+        for a in self.__slots__:
+            setattr(self, a, getattr(self, a) + getattr(other, a))
 
+    def __repr__(self):
+        return "%s(%s)" % (__class__.__name__,
+                ", ".join("%s=%r" % (a, getattr(self, a)) for a in self.__slots__))
+
+
+## Backends that query process attributes for `_select_processes`.
+##
+## Each backend is a generator function that takes a `QueryStats` to update,
+## and yields a 2-tuple `(pid, snapshot)` for each process running on the
+## system, in ascending order of PID.
+##
+## If a list of `pids` (in ascending order) is supplied to the backend, only
+## those processes will be visited.
+##
+## If a `_users.UserNameResolver` is supplied as `user_names`, it will be used
+## to resolve the "username" attribute (so that it can be shared by all the
+## chunks of a parallel query, or across the refreshes of a `LiveQuery`).
+## Likewise, if a `_procio.ProcReaderCaches` is supplied as `reader_caches`,
+## it will be used to cache the system-wide values (so that it can be shared
+## by all the batches of an async query).
+##
+## Each `snapshot` has a method `get_attrs(attr_names, oom_attr_names)` that
+## returns a `dict` of attribute name -> value, which may be called more than
+## once per process (without re-reading anything that was already read), and
+## which will raise `ProcessLookupError` if the process no longer exists.
+## The attribute names & value types are those of `psutil.Process`, plus the
+## OOM attributes in `_procio.OOM_ATTR_NAMES` (which should be split from the
+## other attribute names by `_procio.split_oom_attr_names`).
+
+# Read "/proc" directly, using `_procio`.
+BACKEND_PROC = "proc"
+# Use `psutil.process_iter`.
+BACKEND_PSUTIL = "psutil"
+
+
+def set_procfs_path(path):
+    """Read the proc-filesystem at `path` (default: "/proc") in all backends.
+
+    This sets both `_procio.PROCFS_PATH` & `psutil.PROCFS_PATH`, so that the
+    processes & the system-wide memory info are read from the same tree (eg,
+    a synthetic tree of files, for benchmarks).  It should be called before a
+    query is started, not during one.
+    """
+    path = path.rstrip("/") or "/"
+    if not os.path.isdir(path):
+        raise ValueError("not a directory: %s" % path)
+    _procio.PROCFS_PATH = path
+    psutil.PROCFS_PATH = path
+
+
+def _iter_proc_backend(query_stats, pids=None, user_names=None, reader_caches=None):
+    # Each of the per-process files "/proc/${pid}/{stat,statm,status}" will be
+    # read at most once per process, and only if a requested attribute needs it.
+    reader = ProcReader(user_names, reader_caches)
+    if pids is None:
+        pids = reader.list_pids()
+    else:
+        # The supplied PIDs are not checked for existence (which would cost
+        # an extra `stat` per PID); a PID whose files can't be read is skipped
+        # (by `ProcessLookupError`), just like a process that exited.  Only the
+        # PIDs that can never be a process (PID <= 0) are skipped up-front.
+        pids = (pid for pid in pids if pid > 0)
+    try:
+        for pid in pids:
+            yield (pid, reader.snapshot(pid))
+    finally:
+        query_stats.num_files_opened += reader.num_files_opened
+
+
+class _PsutilProcessSnapshot(object):
+    """Adapt a `psutil.Process` to the snapshot interface of the backends."""
+    __slots__ = ("_proc", "_reader")
+
+    def __init__(self, proc, reader):
+        self._proc = proc
+        self._reader = reader
+
+    def get_attrs(self, attr_names, oom_attr_names=()):
+        # An empty collection of attr-names would make `psutil` retrieve ALL
+        # the attributes, so don't call `Process.as_dict` at all in that case.
+        proc = self._proc
+        # The cgroup attributes are not available from `psutil`, so they are
+        # read by `_procio` instead.
+        (attr_names, cgroup_attr_names) = split_cgroup_attr_names(attr_names)
+        # Attribute "username" is resolved from the UIDs by the resolver of
+        # the reader (which caches each UID), rather than by `psutil` (which
+        # would look-up the UID of every process).
+        is_username_requested = ("username" in attr_names)
+        if is_username_requested:
+            is_uids_requested = ("uids" in attr_names)
+            attr_names = [a for a in attr_names if a != "username"]
+            if not is_uids_requested:
+                attr_names.append("uids")
+        # Attribute "memory_status" is not available from `psutil` at all.
+        is_memory_status_requested = ("memory_status" in attr_names)
+        if is_memory_status_requested:
+            attr_names = [a for a in attr_names if a != "memory_status"]
+        # Likewise, attribute "statm_pages" is derived from "memory_info"
+        # (which `psutil` reads from "/proc/${pid}/statm" on Linux).
+        is_statm_pages_requested = ("statm_pages" in attr_names)
+        if is_statm_pages_requested:
+            is_memory_info_requested = ("memory_info" in attr_names)
+            attr_names = [a for a in attr_names if a != "statm_pages"]
+            if not is_memory_info_requested:
+                attr_names.append("memory_info")
+        if attr_names:
+            try:
+                # This is what `psutil.process_iter` does for each process.
+                attr_dict = proc.as_dict(attr_names, ad_value=None)
+            except psutil_NoSuchProcess:
+                raise ProcessLookupError(proc.pid)
+        else:
+            attr_dict = {}
+        if is_username_requested:
+            if is_uids_requested:
+                uids = attr_dict["uids"]
+            else:
+                uids = attr_dict.pop("uids")
+            attr_dict["username"] = (None if uids is None else
+                    self._reader.user_names.get_user_name(uids.real))
+        if is_statm_pages_requested:
+            if is_memory_info_requested:
+                memory_info = attr_dict["memory_info"]
+            else:
+                memory_info = attr_dict.pop("memory_info")
+            attr_dict["statm_pages"] = (None if memory_info is None else
+                    statm_pages_from_memory_info(memory_info, self._reader.page_size))
+        if is_memory_status_requested:
+            # Read "/proc/${pid}/status" for the values that `psutil` doesn't
+            # provide, just like the proc backend does.
+            attr_dict.update(self._reader.snapshot(proc.pid).get_attrs(("memory_status",)))
+        if cgroup_attr_names:
+            reader = self._reader
+            cgroup_path = reader.read_cgroup_path(proc.pid)
+            for attr_name in cgroup_attr_names:
+                if attr_name == "cgroup":
+                    attr_dict[attr_name] = cgroup_path
+                else:
+                    attr_dict[attr_name] = reader.get_cgroup_memory(cgroup_path)
+        # The OOM attributes are not available from `psutil`, so they are read
+        # by `_procio` instead.
+        if oom_attr_names:
+            attr_dict.update(zip(oom_attr_names,
+                    self._reader.read_oom_ints(proc.pid, oom_attr_names)))
+        return attr_dict
+
+
+def _iter_psutil_backend(query_stats, pids=None, user_names=None, reader_caches=None):
     # Function `psutil.process_iter` yields a `psutil.Process` for each process
     # running on the system.  Processes are yielded in ascending order of PID
     # (ie, successive PIDs increase).
@@ -182,60 +385,357 @@ def _select_processes(AllFields, field_accessors, psutil_attr_names, selection_f
     # [1] https://psutil.readthedocs.io/en/latest/#psutil.process_iter
     # [2] https://psutil.readthedocs.io/en/latest/#psutil.Process.as_dict
     # [3] https://psutil.readthedocs.io/en/latest/#psutil.Process.oneshot
-    psutil_attr_names = tuple(psutil_attr_names)  # for speed
-    for proc in psutil_process_iter(psutil_attr_names):
-        pid = proc.pid
-        attr_dict = proc.info
-        # Note:  There might be more fields requested than psutil attributes
-        # returned, because not all the fields that can be requested, can be
-        # obtained directly from psutil Process results.  Also, some fields
-        # use the same psutil attribute, which would also cause a disparity.
-        #
-        # Furthermore, some psutil attributes might be used for sorting,
-        # not for requested fields, so that's another reason for a mismatch.
-        #
-        # So there's no point in trying to "zip" the list of fields directly
-        # with the iterable `attr_dict.items()`.
-        for field_idx, \
-                (field_name, single_attr_name, multi_attr_names, single_acc_func, multi_acc_funcs) \
-                in enumerate(field_accessors):
-
-            field_value = None
-            # First, extract any psutil attributes.
-            if single_attr_name is not None:
-                field_value = attr_dict[single_attr_name]
-            elif multi_attr_names is not None:
-                # It will be a multi-value field value.
-                field_value = tuple(attr_dict[a] for a in multi_attr_names)
-
-            # Now apply field-accessor functions or post-processing functions.
-            # These functions: (value, pid, post_proc_settings) -> value
-            if single_acc_func is not None:
-                field_value = single_acc_func(field_value, pid, post_proc_settings)
-            elif multi_acc_funcs is not None:
-                # There will be multiple access or post-processing functions.
-                for f in multi_acc_funcs:
-                    field_value = f(field_value, pid, post_proc_settings)
-
-            # Update the elements of the pre-allocated list in-place.
-            field_values[field_idx] = field_value
-
-        all_fields = AllFields(*field_values)
-        is_selected_process = False
-        if not selection_funcs:
-            # No `selection_funcs` were supplied, so we default to selecting
-            # ALL processes.
-            is_selected_process = True
+    #
+    # Because `snapshot.get_attrs` may be called more than once per process,
+    # we hold the `oneshot()` context open while the snapshot is in use, so
+    # that `psutil` doesn't re-read anything for the second call.
+    reader = ProcReader(user_names, reader_caches)
+    if pids is None:
+        procs = psutil_process_iter()
+    else:
+        procs = _iter_psutil_pids(pids)
+    try:
+        for proc in procs:
+            with proc.oneshot():
+                yield (proc.pid, _PsutilProcessSnapshot(proc, reader))
+    finally:
+        query_stats.num_files_opened += reader.num_files_opened
+
+
+def _iter_psutil_pids(pids):
+    for pid in pids:
+        try:
+            yield psutil_Process(pid)
+        except psutil_NoSuchProcess:
+            continue
+
+
+_BACKENDS = {
+        BACKEND_PROC: _iter_proc_backend,
+        BACKEND_PSUTIL: _iter_psutil_backend,
+}
+
+# Functions that list the PIDs of all processes, in ascending order.
+_BACKEND_LIST_PIDS = {
+        BACKEND_PROC: list_proc_pids,
+        BACKEND_PSUTIL: psutil_pids,
+}
+
+
+def _get_backend(backend, user_names=None, reader_caches=None):
+    try:
+        iter_backend = _BACKENDS[backend]
+    except KeyError as e:
+        # Invalid backend name.
+        raise ValueError("invalid backend: %s" % backend)
+
+    if user_names is None and reader_caches is None:
+        return iter_backend
+    else:
+        return (lambda query_stats, pids=None:
+                iter_backend(query_stats, pids, user_names, reader_caches))
+
+
+def _get_field_value(field_accessor, attr_dict, pid, post_proc_settings):
+    """Interpret `field_accessor` to evaluate a single field of a process.
+
+    This is the generic (un-compiled) equivalent of the row-builder functions
+    generated by `_compile_row_builder`.  (The formatting function of the field,
+    if any, is NOT applied.)
+    """
+    (field_name, single_attr_name, multi_attr_names, single_acc_func, multi_acc_funcs,
+            format_func) = field_accessor
+
+    field_value = None
+    # First, extract any psutil attributes.
+    if single_attr_name is not None:
+        field_value = attr_dict[single_attr_name]
+    elif multi_attr_names is not None:
+        # It will be a multi-value field value.
+        field_value = tuple(attr_dict[a] for a in multi_attr_names)
+
+    # Now apply field-accessor functions or post-processing functions.
+    # These functions: (value, pid, post_proc_settings) -> value
+    if single_acc_func is not None:
+        field_value = single_acc_func(field_value, pid, post_proc_settings)
+    elif multi_acc_funcs is not None:
+        # There will be multiple access or post-processing functions.
+        for f in multi_acc_funcs:
+            field_value = f(field_value, pid, post_proc_settings)
+
+    return field_value
+
+
+def _compile_row_builder(func_name, RowType, field_accessors, apply_format_funcs=False):
+    """Generate a function that builds a `RowType` row from an attr-dict.
+
+    The generated function has the signature:
+        (attr_dict, pid, post_proc_settings, selection_fields) -> RowType
+
+    Parameter `field_accessors` is a sequence of `(select_idx, field_accessor)`
+    pairs (one for each field in `RowType`, in order), where `field_accessor`
+    is an element of the tuple returned by `_get_field_accessors`.  If the
+    `select_idx` is not `None`, the field value is instead re-used from index
+    `select_idx` in `selection_fields`.
+
+    The generated function does the same thing as calling `_get_field_value`
+    for each field, but the single-vs-multi attribute & accessor branching is
+    resolved just once per query (rather than once per field per process), by
+    generating a single expression that evaluates exactly the required attrs
+    & accessor functions for each field.
+
+    The formatting functions of the fields are applied only if parameter
+    `apply_format_funcs` is `True`.
+    """
+    namespace = dict(_RowType=RowType, _tuple_new=tuple.__new__)
+    field_exprs = []
+    for field_idx, (select_idx, field_accessor) in enumerate(field_accessors):
+        if select_idx is not None:
+            field_exprs.append("selection_fields[%d]" % select_idx)
+            continue
+
+        (field_name, single_attr_name, multi_attr_names, single_acc_func, multi_acc_funcs,
+                format_func) = field_accessor
+        if single_attr_name is not None:
+            expr = "attr_dict[%r]" % single_attr_name
+        elif multi_attr_names is not None:
+            expr = "(%s,)" % ", ".join("attr_dict[%r]" % a for a in multi_attr_names)
+        else:
+            expr = "None"
+
+        if single_acc_func is not None:
+            acc_funcs = (single_acc_func,)
+        elif multi_acc_funcs is not None:
+            acc_funcs = multi_acc_funcs
         else:
-            for f in selection_funcs:
-                if f(all_fields):
-                    is_selected_process = True
-                    break
+            acc_funcs = ()
+        if apply_format_funcs and format_func is not None:
+            acc_funcs += (format_func,)
+        for func_idx, f in enumerate(acc_funcs):
+            # The accessor functions are looked-up as globals of the generated
+            # function, by these generated names.
+            global_name = "_f%d_%d" % (field_idx, func_idx)
+            namespace[global_name] = f
+            expr = "%s(%s, pid, post_proc_settings)" % (global_name, expr)
+        field_exprs.append(expr)
+
+    # Bypass the `__new__` of the `namedtuple` (which would re-pack the args).
+    source = ("def %s(attr_dict, pid, post_proc_settings, selection_fields):\n"
+            "    return _tuple_new(_RowType, (%s))\n") % \
+            (func_name, "".join(("%s, " % e) for e in field_exprs))
+    exec(source, namespace)
+    return namespace[func_name]
+
+
+def _compile_row_formatter(func_name, RowType, field_accessors):
+    """Generate a function that applies the formatting functions to a row.
+
+    The generated function has the signature:
+        (row, post_proc_settings) -> RowType
+
+    The new `RowType` row will contain the first `len(field_accessors)` fields
+    of `row`, with the formatting function of each field (if any) applied.
+    (The `pid` argument of each formatting function will be `None`.)
+    """
+    namespace = dict(_RowType=RowType, _tuple_new=tuple.__new__)
+    field_exprs = []
+    for field_idx, field_accessor in enumerate(field_accessors):
+        format_func = field_accessor[5]
+        if format_func is None:
+            field_exprs.append("row[%d]" % field_idx)
+        else:
+            global_name = "_f%d" % field_idx
+            namespace[global_name] = format_func
+            field_exprs.append("%s(row[%d], None, post_proc_settings)" %
+                    (global_name, field_idx))
 
-        if is_selected_process:
-            selected_processes.append(all_fields)
+    source = ("def %s(row, post_proc_settings):\n"
+            "    return _tuple_new(_RowType, (%s))\n") % \
+            (func_name, "".join(("%s, " % e) for e in field_exprs))
+    exec(source, namespace)
+    return namespace[func_name]
 
-    return selected_processes
+
+def _iter_selected_processes(compiled_query, post_proc_settings, iter_backend, query_stats, pids=None):
+    """Select processes in 2 phases; yield an `AllFields` for each one selected.
+
+    In phase 1 ("select"), only the fields required by the selection criteria
+    are evaluated, and the selection criteria are tested.  In phase 2 ("extract"),
+    the remaining fields are evaluated, but only for the selected processes.
+    So expensive fields (eg, `cmdline`, `cwd`) are never read for processes
+    that are not selected.
+
+    If there are no selection criteria, ALL processes are selected, so phase 1
+    is skipped entirely.
+
+    Processes with pushed-down PIDs are selected without testing the other
+    selection criteria.  If there are no other selection criteria, only the
+    pushed-down PIDs are visited at all.
+    """
+    build_selection_fields = compiled_query.build_selection_fields
+    build_all_fields = compiled_query.build_all_fields
+    build_pushdown_fields = compiled_query.build_pushdown_fields
+    selection_funcs = compiled_query.selection_funcs
+    pushdown_pids = compiled_query.pushdown_pids
+    pids = compiled_query.get_pids_to_visit(pids)
+    (select_attr_names, select_oom_attr_names) = compiled_query.select_attr_names
+    (extract_attr_names, extract_oom_attr_names) = compiled_query.extract_attr_names
+    pushdown_attr_names = compiled_query.pushdown_attr_names
+
+    num_processes_scanned = 0
+    num_processes_selected = 0
+    select_secs = 0.0
+    extract_secs = 0.0
+
+    time_prev = perf_counter()
+    try:
+        for pid, snapshot in iter_backend(query_stats, pids):
+            num_processes_scanned += 1
+            # Note:  There might be more fields requested than psutil attributes
+            # returned, because not all the fields that can be requested, can be
+            # obtained directly from psutil Process results.  Also, some fields
+            # use the same psutil attribute, which would also cause a disparity.
+            #
+            # Furthermore, some psutil attributes might be used for sorting,
+            # not for requested fields, so that's another reason for a mismatch.
+            #
+            # So there's no point in trying to "zip" the list of fields directly
+            # with the iterable `attr_dict.items()`.
+            try:
+                # Phase 1: "select".
+                build_fields = build_all_fields
+                if selection_funcs and pid in pushdown_pids:
+                    # A pushed-down PID is selected without reading or
+                    # evaluating any of the selection fields; so all the
+                    # fields are evaluated in phase 2 instead.
+                    selection_fields = None
+                    attr_dict = snapshot.get_attrs(*pushdown_attr_names)
+                    build_fields = build_pushdown_fields
+                elif selection_funcs:
+                    attr_dict = snapshot.get_attrs(select_attr_names, select_oom_attr_names)
+                    selection_fields = build_selection_fields(attr_dict, pid,
+                            post_proc_settings, None)
+                    is_selected_process = False
+                    for f in selection_funcs:
+                        if f(selection_fields):
+                            is_selected_process = True
+                            break
+
+                    time_now = perf_counter()
+                    select_secs += time_now - time_prev
+                    time_prev = time_now
+                    if not is_selected_process:
+                        continue
+
+                    attr_dict.update(
+                            snapshot.get_attrs(extract_attr_names, extract_oom_attr_names))
+                else:
+                    # No `selection_funcs` were supplied, so we default to selecting
+                    # ALL processes (or ALL the pushed-down PIDs, which are the only
+                    # processes that were visited).
+                    selection_fields = None
+                    attr_dict = snapshot.get_attrs(extract_attr_names, extract_oom_attr_names)
+
+                # Phase 2: "extract".
+                # Re-use the values of any fields that were already evaluated for
+                # selection (in `selection_fields`).
+                all_fields = build_fields(attr_dict, pid, post_proc_settings,
+                        selection_fields)
+            except ProcessLookupError:
+                # The process exited after we listed the PIDs.  Skip it,
+                # just like `psutil.process_iter` does.
+                time_prev = perf_counter()
+                continue
+
+            num_processes_selected += 1
+            extract_secs += perf_counter() - time_prev
+
+            yield all_fields
+            # Don't count the time spent by the consumer of this generator.
+            time_prev = perf_counter()
+    finally:
+        query_stats.num_processes_scanned += num_processes_scanned
+        query_stats.num_processes_selected += num_processes_selected
+        query_stats.select_secs += select_secs
+        query_stats.extract_secs += extract_secs
+
+
+def _select_processes(compiled_query, post_proc_settings, iter_backend, query_stats, pids=None,
+        limit=None):
+    """Select processes; return a list of `AllFields` instances.
+
+    If `limit` is `None`, return all the selected processes (in the order they
+    were visited, ie, ascending PID).  Otherwise, return only the first `limit`
+    selected processes, as sorted by the `SortByField` criteria of the query.
+    """
+    selected_processes = _iter_selected_processes(compiled_query, post_proc_settings,
+            iter_backend, query_stats, pids)
+    try:
+        if limit is None:
+            return list(selected_processes)
+        else:
+            return _select_top_n(selected_processes, limit, compiled_query.sort_by_fields)
+    finally:
+        # If we stopped early, ensure the per-query stats are updated now.
+        selected_processes.close()
+
+
+def _select_top_n(selected_processes, limit, sort_by_fields):
+    """Return the first `limit` of `selected_processes`, as sorted by `sort_by_fields`.
+
+    The processes are NOT fully sorted; instead, a bounded heap (of at most
+    `limit` elements) is maintained as `selected_processes` is iterated, using
+    functions `heapq.nsmallest` & `heapq.nlargest`.  These functions are stable
+    (ie, equivalent to `sorted(...)[:limit]`), so the result is the same as if
+    all the selected processes were sorted and then truncated.
+
+    If there are no `sort_by_fields`, return the first `limit` processes in the
+    order they were visited (and stop iterating after that).
+    """
+    if not sort_by_fields:
+        return list(islice(selected_processes, limit))
+
+    field_names = tuple(sbf.field_name for sbf in sort_by_fields)
+    reverses = tuple(sbf.reverse for sbf in sort_by_fields)
+    if all(reverses):
+        return nlargest(limit, selected_processes, key=attrgetter(*field_names))
+    elif not any(reverses):
+        return nsmallest(limit, selected_processes, key=attrgetter(*field_names))
+    else:
+        # There is a mixture of ascending & descending sort criteria, so there
+        # is no single key that can be compared natively.
+        return nsmallest(limit, selected_processes,
+                key=_get_mixed_sort_key(field_names, reverses))
+
+
+def _get_mixed_sort_key(field_names, reverses):
+    """Return a sort-key type for a mixture of ascending & descending fields."""
+    get_values = attrgetter(*field_names)
+    field_idxs_and_reverses = tuple(enumerate(reverses))
+
+    class MixedSortKey(object):
+        __slots__ = ("values",)
+
+        def __init__(self, all_fields):
+            self.values = get_values(all_fields)
+
+        def __lt__(self, other):
+            # Compare lexicographically, in the direction of each field.
+            values = self.values
+            other_values = other.values
+            for idx, reverse in field_idxs_and_reverses:
+                a = values[idx]
+                b = other_values[idx]
+                if a != b:
+                    return (b < a) if reverse else (a < b)
+            return False
+
+        def __eq__(self, other):
+            # Needed because `heapq` compares keys within tuples, and tuple
+            # comparison tests the elements for equality first.
+            return self.values == other.values
+
+    return MixedSortKey
 
 
 ## Select processes to be queried.
@@ -307,6 +807,17 @@ class ProcessSelectionCriterion(metaclass=ABCMeta):
         """
         pass
 
+    def pushdown_pids(self):
+        """Return a tuple of the only PIDs that this criterion can match, or `None`.
+
+        If a criterion can only ever match a known set of PIDs, the query can
+        visit those PIDs directly, rather than scanning every process.
+
+        This method does NOT need to be overridden; by default it returns `None`
+        (which means that any process could match).
+        """
+        return None
+
     def __repr__(self):
         """Return an unambiguous string representation of an instance.
 
@@ -415,6 +926,9 @@ class ProcessPidEquals(ProcessSelectionCriterion):
     def get_func(self):
         return (lambda process: process.pid == self._pid_to_equal)
 
+    def pushdown_pids(self):
+        return (self._pid_to_equal,)
+
 
 class ProcessUidEquals(ProcessSelectionCriterion):
     """Match processes owned by a user whose UID `== uid`."""
@@ -446,13 +960,472 @@ class SortByField(object):
         return "%s(%r, reverse=%r)" % (__class__.__name__, self.field_name, self.reverse)
 
 
+class _CompiledQuery(object):
+    """The per-query state that is derived from the query arguments.
+
+    This is everything that `_select_processes` needs, that does not change
+    per-process.  It's constructed from the (picklable) query arguments, so
+    that it can also be re-constructed in a worker process.
+    """
+    __slots__ = ("fields_to_query", "num_fields_to_query", "QueriedProcess", "QueriedColumns",
+            "all_field_names", "AllFields", "field_accessors", "field_types",
+            "selection_funcs", "pushdown_pids", "SelectionFields", "select_field_accessors",
+            "select_attr_names", "extract_field_accessors", "extract_attr_names",
+            "pushdown_attr_names", "build_selection_fields", "build_all_fields",
+            "build_pushdown_fields", "format_queried_process",
+            "format_funcs", "sort_by_fields")
+
+    def __init__(self, fields_to_query, selection_criteria, sort_by_fields,
+            extra_field_names=()):
+        # First, ensure that `fields_to_query` is not empty.
+        num_fields_to_query = len(fields_to_query)
+        if num_fields_to_query == 0:
+            raise ValueError("no field names supplied: %s" % fields_to_query)
+        # Second, ensure there are no duplicates in `fields_to_query`.
+        all_field_names_in_set = set(fields_to_query)  # A `set` contains no duplicates.
+        if num_fields_to_query != len(all_field_names_in_set):
+            raise ValueError("duplicate field names supplied: %s" % ",".join(fields_to_query))
+
+        # Now convert `fields_to_query` to a `tuple`, to ensure fastest iteration.
+        # [And also to ensure it's immutable, so we can't accidentally mutate it.]
+        if not isinstance(fields_to_query, tuple):
+            fields_to_query = tuple(fields_to_query)
+        self.fields_to_query = fields_to_query
+        self.num_fields_to_query = num_fields_to_query
+        self.QueriedProcess = namedtuple("QueriedProcess", fields_to_query)
+        self.QueriedColumns = namedtuple("QueriedColumns", fields_to_query)
+
+        # Now create our own `list` copy of the supplied collection of field names
+        # to query, so that we *can* modify our list if necessary (to add fields
+        # for process selection, filtering, and sorting) while still maintaining
+        # the ordering of the first `fields_to_query`.
+        all_field_names_in_list = list(fields_to_query)
+
+        # Add the field names required for process selection.
+        # We want to maintain the order of the first `fields_to_query` in this list,
+        # so we append to the end of the list.  But we don't want duplicates in this
+        # list (because we'll also use it to define field names in a `namedtuple`),
+        # so we only append new fields if they're not already in the list (which we
+        # check by also maintaining a set of field names).
+        #
+        # We also collect the field names required for process selection (in
+        # the order they're first required) into a separate list, for phase 1
+        # of `_select_processes`.
+        #
+        # But criteria that can only match a known set of PIDs (eg, criteria of
+        # type `ProcessPidEquals`) are not tested per-process at all; instead,
+        # their PIDs are "pushed-down" into the set `pushdown_pids`, which will
+        # be selected directly.
+        selection_funcs = []
+        selection_field_names = []
+        pushdown_pids = set()
+        for select_crit in selection_criteria:
+            crit_pids = select_crit.pushdown_pids()
+            if crit_pids is not None:
+                pushdown_pids.update(crit_pids)
+                continue
+            selection_funcs.append(select_crit.get_func())
+            selection_fields = select_crit.field_names()
+            for f in selection_fields:
+                if f not in selection_field_names:
+                    selection_field_names.append(f)
+                if f not in all_field_names_in_set:
+                    all_field_names_in_set.add(f)
+                    all_field_names_in_list.append(f)
+        self.selection_funcs = selection_funcs
+        self.pushdown_pids = frozenset(pushdown_pids)
+
+        # Add the field names required for process sorting.
+        self.sort_by_fields = tuple(sort_by_fields)
+        for sbf in sort_by_fields:
+            f = sbf.field_name
+            # And while we're iterating through a collection of (what we assume are)
+            # `SortByField` instances, verify that they actually have the expected
+            # `.reverse` attribute (in addition to the `.field_name` attribute).
+            r = sbf.reverse
+            if f not in all_field_names_in_set:
+                all_field_names_in_set.add(f)
+                all_field_names_in_list.append(f)
+
+        # Add any extra field names that the caller requires in `AllFields`
+        # (eg, the fields of `PROCESS_TREE_FIELD_NAMES`).
+        for f in extra_field_names:
+            if f not in all_field_names_in_set:
+                all_field_names_in_set.add(f)
+                all_field_names_in_list.append(f)
+
+        # TODO: Do the same thing for the filtering fields (if any).
+
+        # Named-tuple `AllFields` enables a "Decorate-Sort-Undecorate"-like idiom
+        # that we use for process selection, filtering & sorting:
+        #  https://docs.python.org/3/howto/sorting.html#the-old-way-using-decorate-sort-undecorate
+        (self.field_accessors, self.field_types, all_attr_names) = \
+                _get_field_accessors(all_field_names_in_list)
+        self.all_field_names = tuple(all_field_names_in_list)
+        self.AllFields = namedtuple("AllFields", self.all_field_names)
+
+        # Phase 1 ("select") of `_select_processes` evaluates only the fields
+        # required for process selection, in named-tuple `SelectionFields`.
+        (self.select_field_accessors, select_field_types, select_attr_names) = \
+                _get_field_accessors(selection_field_names)
+        self.SelectionFields = namedtuple("SelectionFields", selection_field_names)
+        self.select_attr_names = split_oom_attr_names(select_attr_names)
+
+        # Phase 2 ("extract") of `_select_processes` evaluates all the other
+        # fields, re-using the field values from phase 1 (if any).  It needs
+        # only the attributes that were not already obtained in phase 1.
+        #
+        # The selection criteria test the formatted field values (just like
+        # the ones that are returned to the caller), but the `AllFields` contain
+        # un-formatted values (for sorting); so a field that has a formatting
+        # function is evaluated again in phase 2, rather than re-used.
+        extract_field_accessors = []
+        for field_accessor in self.field_accessors:
+            field_name = field_accessor[0]
+            if field_name in selection_field_names and field_accessor[5] is None:
+                select_idx = selection_field_names.index(field_name)
+            else:
+                select_idx = None
+            extract_field_accessors.append((select_idx, field_accessor))
+        self.extract_field_accessors = tuple(extract_field_accessors)
+        self.extract_attr_names = split_oom_attr_names(all_attr_names - select_attr_names)
+
+        # Generate the per-query functions that build the rows of each phase.
+        self.build_selection_fields = _compile_row_builder("build_selection_fields",
+                self.SelectionFields,
+                tuple((None, fa) for fa in self.select_field_accessors),
+                apply_format_funcs=True)
+        self.build_all_fields = _compile_row_builder("build_all_fields",
+                self.AllFields, self.extract_field_accessors)
+        # A process with a pushed-down PID is selected without phase 1, so
+        # when there are also other selection criteria, its fields are all
+        # evaluated in one pass (without `selection_fields`).
+        if self.selection_funcs and self.pushdown_pids:
+            self.pushdown_attr_names = split_oom_attr_names(all_attr_names)
+            self.build_pushdown_fields = _compile_row_builder("build_pushdown_fields",
+                    self.AllFields, tuple((None, fa) for fa in self.field_accessors))
+        else:
+            self.pushdown_attr_names = None
+            self.build_pushdown_fields = None
+        # The formatting functions are applied only when the `AllFields` are
+        # "undecorated" (after sorting & any `limit`).
+        queried_field_accessors = self.field_accessors[:num_fields_to_query]
+        self.format_funcs = tuple(fa[5] for fa in queried_field_accessors)
+        self.format_queried_process = _compile_row_formatter("format_queried_process",
+                self.QueriedProcess, queried_field_accessors)
+
+    def get_pids_to_visit(self, pids=None):
+        """Return the PIDs that must be visited, in ascending order, or `None`.
+
+        If `pids` is not `None`, the returned PIDs will be a subset of `pids`.
+
+        If the only selection criteria are pushed-down PIDs, only those PIDs
+        need to be visited (rather than scanning every process).  Otherwise,
+        every process in `pids` (or, if `pids` is `None`, every process running
+        on the system) must be visited; so return `pids` unchanged.
+        """
+        pushdown_pids = self.pushdown_pids
+        if self.selection_funcs or not pushdown_pids:
+            return pids
+        elif pids is None:
+            # Skip the pushed-down PIDs that don't exist, as `iter_fields` does
+            # for its `pids`.
+            return [pid for pid in sorted(pushdown_pids) if proc_pid_exists(pid)]
+        else:
+            return [pid for pid in pids if pid in pushdown_pids]
+
+
+## Collect processes in parallel, in chunks of PIDs.
+
+# Use a pool of threads.
+WORKER_POOL_THREADS = "threads"
+# Use a pool of processes.
+WORKER_POOL_PROCESSES = "processes"
+
+_WORKER_POOL_EXECUTORS = {
+        WORKER_POOL_THREADS: ThreadPoolExecutor,
+        WORKER_POOL_PROCESSES: ProcessPoolExecutor,
+}
+
+# The number of chunks of PIDs per worker, so that a worker that finishes its
+# chunk early (eg, a chunk of mostly-unselected processes) can take another.
+_NUM_CHUNKS_PER_WORKER = 4
+
+
+def _select_processes_in_chunk(compiled_query, post_proc_settings, backend, limit,
+        pids, user_names=None):
+    """Select processes in the chunk `pids`; return `(rows, query_stats)`.
+
+    This runs in a worker thread.  Each chunk uses its own `QueryStats`, its
+    own `_fields.FormatCaches` (in a copy of `post_proc_settings`), and its own
+    `_procio.ProcReader` (inside the backend), so that no mutable state is
+    shared between threads, except for the (thread-safe)
+    `_users.UserNameResolver` in `user_names`.  The statistics of the chunk's
+    format caches are included in the returned `query_stats`.
+
+    If `limit` is not `None`, each chunk returns only its own top `limit` rows.
+    """
+    query_stats = QueryStats()
+    post_proc_settings = with_new_format_caches(post_proc_settings)
+    rows = _select_processes(compiled_query, post_proc_settings,
+            _get_backend(backend, user_names), query_stats, pids, limit)
+    query_stats.add_format_cache_stats(post_proc_settings)
+    return (rows, query_stats)
+
+
+def _select_processes_in_chunk_in_worker_process(query_args, post_proc_settings, backend, limit, pids):
+    """Select processes in the chunk `pids`; return `(rows, query_stats)`.
+
+    This runs in a worker process.  Neither the `_CompiledQuery` (which holds
+    function closures & `namedtuple` types defined on-the-fly) nor its `AllFields`
+    instances can be pickled, so the `_CompiledQuery` is re-constructed from the
+    (picklable) query arguments, and the rows are returned as plain tuples.
+    """
+    compiled_query = _CompiledQuery(*query_args)
+    # Each worker process uses its own `_users.UserNameResolver` per chunk.
+    (rows, query_stats) = _select_processes_in_chunk(compiled_query,
+            post_proc_settings, backend, limit, pids)
+    return ([tuple(r) for r in rows], query_stats)
+
+
+def _select_processes_in_parallel(compiled_query, query_args, post_proc_settings,
+        backend, query_stats, workers, worker_pool, limit=None, user_names=None):
+    try:
+        Executor = _WORKER_POOL_EXECUTORS[worker_pool]
+    except KeyError as e:
+        # Invalid worker pool name.
+        raise ValueError("invalid worker pool: %s" % worker_pool)
+
+    # Split the PID-space into contiguous chunks of ascending PIDs, so that
+    # concatenating the results of the chunks (in order) maintains the order
+    # of ascending PIDs (just like a single serial scan).
+    pids = compiled_query.get_pids_to_visit()
+    if pids is None:
+        pids = _BACKEND_LIST_PIDS[backend]()
+    num_chunks = workers * _NUM_CHUNKS_PER_WORKER
+    chunk_size = max(1, -(-len(pids) // num_chunks))  # Ceiling division.
+    chunks = [pids[i : i + chunk_size] for i in range(0, len(pids), chunk_size)]
+
+    with Executor(max_workers=workers) as executor:
+        if worker_pool == WORKER_POOL_PROCESSES:
+            AllFields = compiled_query.AllFields
+            results = executor.map(_select_processes_in_chunk_in_worker_process,
+                    repeat(query_args), repeat(post_proc_settings), repeat(backend),
+                    repeat(limit), chunks)
+        else:
+            AllFields = None
+            results = executor.map(_select_processes_in_chunk,
+                    repeat(compiled_query), repeat(post_proc_settings), repeat(backend),
+                    repeat(limit), chunks, repeat(user_names))
+
+        # Function `Executor.map` yields the results in the order of `chunks`.
+        selected_processes = []
+        for rows, chunk_query_stats in results:
+            if AllFields is not None:
+                rows = [AllFields._make(r) for r in rows]
+            selected_processes.extend(rows)
+            query_stats.add(chunk_query_stats)
+
+    if limit is not None:
+        # The top `limit` of all the chunks is the top `limit` of the union of
+        # the top `limit` of each chunk.  And because the chunks are in order,
+        # ties are still broken by ascending PID.
+        selected_processes = _select_top_n(selected_processes, limit,
+                compiled_query.sort_by_fields)
+
+    return selected_processes
+
+
+def _sort_selected_processes(sort_by_fields, selected_processes, limit):
+    """Sort the `AllFields` in `selected_processes` in-place, by `sort_by_fields`.
+
+    The `AllFields` contain un-formatted field values (so that, eg, field `rszh`
+    is sorted by its numeric value, not by its human-readable string).
+    """
+    # Now sort the selected processes by the specified sort criteria (if any).
+    #
+    # If multiple sort criteria were specified, we collect them into a tuple
+    # (in the order they were supplied as command-line options, left-to-right
+    # on the command-line: first option supplied => first element in tuple;
+    # etc.) and then perform a single-pass lexicographical sort of the tuple
+    # (in which the first element of the tuple has the highest priority in the
+    # sort; etc.).
+    #
+    # [OK, confession time:  We don't actually do that; we actually *reverse*
+    # the list of sort criteria, so that we sort in reverse order of fields,
+    # because apparently Python's Timsort "does multiple sorts efficiently" [1].
+    # But the result should be the same!]
+    #
+    # [1] https://docs.python.org/3/howto/sorting.html#sort-stability-and-complex-sorts
+    #
+    # So the first command-line sort-option supplied, will have the highest
+    # priority; and each successive sort-option supplied on the command-line,
+    # will be used only for differentiation between tied sorts in the earlier
+    # sort-options.
+    #
+    # [This seems like the most-reasonable, least-surprising way to interpret
+    # multiple command-line sort-options.]
+    #
+    # If there was a `limit`, the selected processes have already been sorted
+    # (and truncated) by `_select_top_n`.
+    if limit is not None:
+        pass
+    elif len(sort_by_fields) == 1:
+        # There was just one sort criterion supplied.
+        sbf = sort_by_fields[0]
+        selected_processes.sort(key=attrgetter(sbf.field_name), reverse=sbf.reverse)
+    elif len(sort_by_fields) > 1:
+        # Create our own `list` copy of `sort_by_fields` so we can reverse it.
+        sort_by_fields = list(sort_by_fields)
+        sort_by_fields.reverse()
+        for sbf in sort_by_fields:
+            selected_processes.sort(key=attrgetter(sbf.field_name), reverse=sbf.reverse)
+
+
+def _sort_and_undecorate(compiled_query, selected_processes, limit, post_proc_settings):
+    """Sort the `AllFields` in `selected_processes`; convert to `QueriedProcess`.
+
+    The list `selected_processes` is sorted & undecorated in-place, and returned.
+
+    The field values are formatted when they are converted to `QueriedProcess`.
+    """
+    format_queried_process = compiled_query.format_queried_process
+    _sort_selected_processes(compiled_query.sort_by_fields, selected_processes, limit)
+
+    # Now "undecorate" the `AllFields`, converting it to `QueriedProcess`
+    # (by taking the first `num_fields_to_query` fields, and formatting them),
+    # then replace the `AllFields` instance with the new `QueriedProcess`
+    # instance, in-place in the sorted list.
+    for idx, fields in enumerate(selected_processes):
+        selected_processes[idx] = format_queried_process(fields, post_proc_settings)
+
+    return selected_processes
+
+
+## Return the query results in column-oriented format.
+
+# Return a list of `QueriedProcess` (one for each process).
+RESULT_FORMAT_ROWS = "rows"
+# Return a `QueriedColumns` (one column for each field).
+RESULT_FORMAT_COLUMNS = "columns"
+
+# The `array.array` type-codes for the field types that can be stored in arrays.
+_ARRAY_TYPECODES = {
+        int: 'q',
+        float: 'd',
+}
+
+
+def _make_column(values, py_type):
+    """Return the sequence `values` as an `array.array` if possible, else a `list`."""
+    typecode = _ARRAY_TYPECODES.get(py_type)
+    if typecode is not None:
+        try:
+            return array(typecode, values)
+        except (TypeError, OverflowError):
+            # There is a `None` value (eg, due to permissions), or an integer
+            # that is too large for a 64-bit array element.
+            pass
+    return list(values)
+
+
+def _transpose_selected_processes(compiled_query, selected_processes):
+    """Append the field values of each `AllFields` to the column of its field.
+
+    The `selected_processes` may be any iterable (eg, the generator returned by
+    `_iter_selected_processes`), so that the rows need never be collected into
+    a list.  Each column of a numeric field type starts as an `array.array`,
+    which is converted to a `list` only if a value doesn't fit (eg, `None`).
+
+    Return `(all_columns, num_rows)`, with a column for each field in `AllFields`.
+    """
+    all_columns = []
+    for field_type in compiled_query.field_types:
+        typecode = _ARRAY_TYPECODES.get(field_type.py_type)
+        all_columns.append(array(typecode) if typecode is not None else [])
+    num_rows = 0
+    for fields in selected_processes:
+        for field_idx, value in enumerate(fields):
+            try:
+                all_columns[field_idx].append(value)
+            except (TypeError, OverflowError):
+                column = all_columns[field_idx] = list(all_columns[field_idx])
+                column.append(value)
+        num_rows += 1
+    return (all_columns, num_rows)
+
+
+def _select_columns(compiled_query, post_proc_settings, iter_backend, query_stats):
+    """Select processes; return `(all_columns, num_rows)` (like `_select_processes`).
+
+    The field values of each selected process are appended directly to the
+    columns, so no `AllFields` is kept after its values have been appended.
+    """
+    selected_processes = _iter_selected_processes(compiled_query, post_proc_settings,
+            iter_backend, query_stats)
+    try:
+        return _transpose_selected_processes(compiled_query, selected_processes)
+    finally:
+        selected_processes.close()
+
+
+def _sort_columns(compiled_query, all_columns, num_rows, limit, post_proc_settings):
+    """Sort the columns of `AllFields` in `all_columns`; return a `QueriedColumns`.
+
+    The columns are sorted by a permutation of row indices (rather than by
+    moving the rows).  This is the same sort (stable, and in the same order) as
+    `_sort_selected_processes`.
+    """
+    field_types = compiled_query.field_types
+    # If there was a `limit`, the selected processes have already been sorted
+    # (and truncated) by `_select_top_n`.
+    if limit is None and compiled_query.sort_by_fields:
+        all_field_names = compiled_query.all_field_names
+        order = list(range(num_rows))
+        # Just like `_sort_selected_processes`, sort in reverse order of fields.
+        for sbf in reversed(compiled_query.sort_by_fields):
+            sort_column = all_columns[all_field_names.index(sbf.field_name)]
+            order.sort(key=sort_column.__getitem__, reverse=sbf.reverse)
+    else:
+        order = None
+
+    columns = []
+    for field_idx in range(compiled_query.num_fields_to_query):
+        column = all_columns[field_idx]
+        # Release each column of `AllFields` as soon as it has been converted.
+        all_columns[field_idx] = None
+        format_func = compiled_query.format_funcs[field_idx]
+        if order is None and format_func is None:
+            # The column is already an `array.array` if possible.
+            columns.append(column)
+            continue
+        if order is not None:
+            column = [column[row_idx] for row_idx in order]
+        if format_func is not None:
+            column = [format_func(v, None, post_proc_settings) for v in column]
+        columns.append(_make_column(column, field_types[field_idx].py_type))
+    return compiled_query.QueriedColumns._make(columns)
+
+
+# The fields that are always available in the rows of a `ProcessTree` that is
+# returned by `query_fields`, even if they are not in `fields_to_query`.
+PROCESS_TREE_FIELD_NAMES = ("pid", "ppid", "rszk", "vszk", "ooms")
+
+
 def query_fields(fields_to_query,
         selection_criteria=(),
         filtering_criteria=(),  # TODO: Implement
         sort_by_fields=(),  # TODO: Document
         return_field_types=False,
         return_header_info=False,
-        use_base10_human_size=False):
+        use_base10_human_size=False,
+        return_query_stats=False,
+        backend=BACKEND_PROC,
+        workers=None,
+        worker_pool=WORKER_POOL_THREADS,
+        limit=None,
+        result_format=RESULT_FORMAT_ROWS,
+        return_process_tree=False):
     """Select processes; query the fields requested in `fields_to_query`.
 
     Results will be returned as a list of instances of type `QueriedProcess`,
@@ -487,119 +1460,814 @@ def query_fields(fields_to_query,
     the selection of a process, the order of criteria-testing does not matter.
     Hence, the supplied container `selection_criteria` does NOT need to be an
     ordered collection type.
+
+    The `backend` selects how process attributes are queried: `BACKEND_PROC`
+    (the default) reads the Linux proc-filesystem directly, reading each file
+    at most once per process; `BACKEND_PSUTIL` uses `psutil.process_iter`.
+    An invalid `backend` will raise `ValueError`.
+
+    If `workers` is an integer > 1, the PID-space will be split into chunks,
+    which will be collected in parallel by a pool of `workers` workers.  The
+    `worker_pool` may be `WORKER_POOL_THREADS` (the default) or
+    `WORKER_POOL_PROCESSES`; an invalid `worker_pool` will raise `ValueError`.
+    The results (& their order) will be the same as a serial query.
+
+    If `limit` is not `None`, it must be a non-negative integer, and only the
+    first `limit` processes (after sorting) will be returned.  This is done
+    with a bounded heap while the processes are selected, so the memory used
+    is proportional to `limit`, and the selected processes are never fully
+    sorted.  An invalid `limit` will raise `ValueError`.
+
+    If `result_format` is `RESULT_FORMAT_COLUMNS`, the selected processes will
+    instead be returned as a single instance of type `QueriedColumns`:  a new
+    `namedtuple` type (with the same field names as `QueriedProcess`) in which
+    each field is a column of the values of that field for all the selected
+    processes (in the same order as the list of `QueriedProcess`).  A column
+    of a numeric field type will be an `array.array`; any other column (or a
+    numeric column that contains `None`) will be a `list`.  This uses much less
+    memory than a list of `QueriedProcess` for a large number of processes.
+    An invalid `result_format` will raise `ValueError`.
+
+    Some fields are much more expensive to read than others (eg, the fields
+    from "/proc/${pid}/smaps_rollup", in which the kernel walks every memory
+    mapping of the process); the `cost` of each field's type is `COST_CHEAP`
+    or `COST_EXPENSIVE` (see function `get_field_type`).  An expensive field
+    is only read for the processes that were selected, after the selection
+    criteria have been tested; so a narrow selection keeps its cost small.
+
+    If `return_process_tree` is `True`, a `ProcessTree` instance (an index of
+    the parent -> children relationships of the selected processes, built in
+    a single pass) will be returned after the field types & header info (if
+    any).  The tree refers to each process by its index in the results.  The
+    rows of the tree contain the un-formatted values of the fields in
+    `fields_to_query`, and also of the fields in `PROCESS_TREE_FIELD_NAMES`;
+    so, eg, `tree.sum_subtrees("rszk")` is the total resident set size of each
+    process & all its (selected) descendants.
+
+    If `return_query_stats` is `True`, a `QueryStats` instance (describing the
+    work done by this query) will be returned as the last result.
     """
-    # First, ensure that `fields_to_query` is not empty.
-    num_fields_to_query = len(fields_to_query)
-    if num_fields_to_query == 0:
-        raise ValueError("no field names supplied: %s" % fields_to_query)
-    # Second, ensure there are no duplicates in `fields_to_query`.
-    all_field_names_in_set = set(fields_to_query)  # A `set` contains no duplicates.
-    if num_fields_to_query != len(all_field_names_in_set):
-        raise ValueError("duplicate field names supplied: %s" % ",".join(fields_to_query))
-
-    # Now convert `fields_to_query` to a `tuple`, to ensure fastest iteration.
-    # [And also to ensure it's immutable, so we can't accidentally mutate it.]
-    if not isinstance(fields_to_query, tuple):
-        fields_to_query = tuple(fields_to_query)
-    QueriedProcess = namedtuple("QueriedProcess", fields_to_query)
-
-    # Now create our own `list` copy of the supplied collection of field names
-    # to query, so that we *can* modify our list if necessary (to add fields
-    # for process selection, filtering, and sorting) while still maintaining
-    # the ordering of the first `fields_to_query`.
-    all_field_names_in_list = list(fields_to_query)
-
-    # Add the field names required for process selection.
-    # We want to maintain the order of the first `fields_to_query` in this list,
-    # so we append to the end of the list.  But we don't want duplicates in this
-    # list (because we'll also use it to define field names in a `namedtuple`),
-    # so we only append new fields if they're not already in the list (which we
-    # check by also maintaining a set of field names).
-    selection_funcs = []
-    for select_crit in selection_criteria:
-        selection_funcs.append(select_crit.get_func())
-        selection_fields = select_crit.field_names()
-        for f in selection_fields:
-            if f not in all_field_names_in_set:
-                all_field_names_in_set.add(f)
-                all_field_names_in_list.append(f)
+    # Each UID is resolved to a user name at most once per query.
+    user_names = UserNameResolver()
+    iter_backend = _get_backend(backend, user_names)
+    query_stats = QueryStats()
+    if limit is not None and limit < 0:
+        raise ValueError("invalid limit: %s" % limit)
+    if result_format not in (RESULT_FORMAT_ROWS, RESULT_FORMAT_COLUMNS):
+        raise ValueError("invalid result format: %s" % result_format)
+
+    query_args = (fields_to_query, selection_criteria, sort_by_fields,
+            PROCESS_TREE_FIELD_NAMES if return_process_tree else ())
+    compiled_query = _CompiledQuery(*query_args)
+
+    post_proc_settings = \
+            get_post_proc_settings(
+                    use_base10_human_size=use_base10_human_size)
+
+    if workers is not None and workers > 1:
+        selected_processes = \
+                _select_processes_in_parallel(compiled_query, query_args,
+                        post_proc_settings, backend, query_stats,
+                        workers, worker_pool, limit, user_names)
+    elif result_format == RESULT_FORMAT_COLUMNS and limit is None and not return_process_tree:
+        # Append the field values straight to the columns, rather than
+        # collecting a list of `AllFields` (one per process) to transpose.
+        selected_processes = None
+        (all_columns, num_rows) = _select_columns(compiled_query, post_proc_settings,
+                iter_backend, query_stats)
+    else:
+        selected_processes = \
+                _select_processes(compiled_query, post_proc_settings,
+                        iter_backend, query_stats, limit=limit)
+
+    if return_process_tree:
+        # The tree refers to each process by its index in the (sorted) results,
+        # so sort the `AllFields` now.  (Sorting them again below, when they're
+        # already sorted, takes only linear time.)  The tree keeps its own list
+        # of the `AllFields`, because `selected_processes` is converted in-place.
+        _sort_selected_processes(compiled_query.sort_by_fields, selected_processes, limit)
+        process_tree = ProcessTree(list(selected_processes))
+
+    if result_format == RESULT_FORMAT_COLUMNS:
+        if selected_processes is not None:
+            (all_columns, num_rows) = _transpose_selected_processes(compiled_query,
+                    selected_processes)
+            selected_processes.clear()
+        selected_processes = _sort_columns(compiled_query, all_columns, num_rows,
+                limit, post_proc_settings)
+    else:
+        selected_processes = _sort_and_undecorate(compiled_query, selected_processes,
+                limit, post_proc_settings)
+    query_stats.add_format_cache_stats(post_proc_settings)
+
+    if return_field_types or return_header_info or return_process_tree or return_query_stats:
+        result = (selected_processes,)
+        if return_field_types:
+            result += (compiled_query.field_types[:compiled_query.num_fields_to_query],)
+        if return_header_info:
+            result += _collect_header_info()
+        if return_process_tree:
+            result += (process_tree,)
+        if return_query_stats:
+            result += (query_stats,)
+        return result
+    else:
+        return selected_processes
+
+
+
+## Stream the query results, as each process is read.
 
-    # Add the field names required for process sorting.
-    for sbf in sort_by_fields:
-        f = sbf.field_name
-        # And while we're iterating through a collection of (what we assume are)
-        # `SortByField` instances, verify that they actually have the expected
-        # `.reverse` attribute (in addition to the `.field_name` attribute).
-        r = sbf.reverse
-        if f not in all_field_names_in_set:
-            all_field_names_in_set.add(f)
-            all_field_names_in_list.append(f)
-
-    # TODO: Do the same thing for the filtering fields (if any).
-
-    # Named-tuple `AllFields` enables a "Decorate-Sort-Undecorate"-like idiom
-    # that we use for process selection, filtering & sorting:
-    #  https://docs.python.org/3/howto/sorting.html#the-old-way-using-decorate-sort-undecorate
-    (all_field_accessors, all_field_types, psutil_attr_names) = \
-            _get_field_accessors(all_field_names_in_list)
-    AllFields = namedtuple("AllFields", tuple(all_field_names_in_list))
+def _iter_queried_processes(compiled_query, post_proc_settings, iter_backend, query_stats,
+        limit=None, pids=None):
+    selected_processes = _iter_selected_processes(compiled_query, post_proc_settings,
+            iter_backend, query_stats, pids)
+    format_queried_process = compiled_query.format_queried_process
+    try:
+        for all_fields in islice(selected_processes, limit):
+            yield format_queried_process(all_fields, post_proc_settings)
+    finally:
+        # If the caller stopped early, ensure the per-query stats are updated.
+        selected_processes.close()
+        query_stats.add_format_cache_stats(post_proc_settings)
+
+
+def iter_fields(fields_to_query,
+        selection_criteria=(),
+        return_field_types=False,
+        return_header_info=False,
+        use_base10_human_size=False,
+        return_query_stats=False,
+        backend=BACKEND_PROC,
+        limit=None,
+        pids=None):
+    """Select processes; return an iterator of `QueriedProcess`, in order of PID.
+
+    This is like `query_fields` without any sort criteria, except that each
+    `QueriedProcess` is yielded by the returned iterator as soon as that process
+    has been read (rather than after all the processes have been read).  So
+    the first results are available almost immediately, and the results are
+    never all held in memory at once.
+
+    If `pids` is not `None`, only the processes with those PIDs (if they exist)
+    will be visited, rather than every process running on the system.  This is
+    intended for re-querying a few known processes (eg, newly-started ones).
+
+    The arguments are validated (raising `ValueError` just like `query_fields`)
+    when this function is called, not when the iterator is first advanced.
+
+    If any of the `return_*` flags are `True`, the iterator will be returned
+    as the first element of a tuple, followed by the same extra results as
+    `query_fields`.  The returned `QueryStats` will be updated as the iterator
+    is advanced; it will be complete when the iterator is exhausted (or closed).
+    """
+    if limit is not None and limit < 0:
+        raise ValueError("invalid limit: %s" % limit)
+    # Each UID is resolved to a user name at most once per query.
+    iter_backend = _get_backend(backend, UserNameResolver())
+    query_stats = QueryStats()
+    compiled_query = _CompiledQuery(fields_to_query, selection_criteria, ())
 
     post_proc_settings = \
             get_post_proc_settings(
                     use_base10_human_size=use_base10_human_size)
 
-    selected_processes = \
-            _select_processes(AllFields, all_field_accessors,
-                    psutil_attr_names, selection_funcs, post_proc_settings)
+    if pids is not None:
+        # The backends require the PIDs in ascending order.  These PIDs were
+        # supplied by the caller (rather than listed from "/proc"), so they
+        # might not exist; and a process whose fields don't need any file to
+        # be read (eg, only field "pid") would otherwise be yielded regardless.
+        pids = [pid for pid in sorted(pids) if proc_pid_exists(pid)]
+    queried_processes = _iter_queried_processes(compiled_query, post_proc_settings,
+            iter_backend, query_stats, limit, pids)
+
+    if return_field_types or return_header_info or return_query_stats:
+        result = (queried_processes,)
+        if return_field_types:
+            result += (compiled_query.field_types[:compiled_query.num_fields_to_query],)
+        if return_header_info:
+            result += _collect_header_info()
+        if return_query_stats:
+            result += (query_stats,)
+        return result
+    else:
+        return queried_processes
 
-    # Now sort the selected processes by the specified sort criteria (if any).
-    #
-    # If multiple sort criteria were specified, we collect them into a tuple
-    # (in the order they were supplied as command-line options, left-to-right
-    # on the command-line: first option supplied => first element in tuple;
-    # etc.) and then perform a single-pass lexicographical sort of the tuple
-    # (in which the first element of the tuple has the highest priority in the
-    # sort; etc.).
-    #
-    # [OK, confession time:  We don't actually do that; we actually *reverse*
-    # the list of sort criteria, so that we sort in reverse order of fields,
-    # because apparently Python's Timsort "does multiple sorts efficiently" [1].
-    # But the result should be the same!]
-    #
-    # [1] https://docs.python.org/3/howto/sorting.html#sort-stability-and-complex-sorts
-    #
-    # So the first command-line sort-option supplied, will have the highest
-    # priority; and each successive sort-option supplied on the command-line,
-    # will be used only for differentiation between tied sorts in the earlier
-    # sort-options.
-    #
-    # [This seems like the most-reasonable, least-surprising way to interpret
-    # multiple command-line sort-options.]
-    if len(sort_by_fields) == 1:
-        # There was just one sort criterion supplied.
-        sbf = sort_by_fields[0]
-        selected_processes.sort(key=attrgetter(sbf.field_name), reverse=sbf.reverse)
-    elif len(sort_by_fields) > 1:
-        # Create our own `list` copy of `sort_by_fields` so we can reverse it.
-        sort_by_fields = list(sort_by_fields)
-        sort_by_fields.reverse()
-        for sbf in sort_by_fields:
-            selected_processes.sort(key=attrgetter(sbf.field_name), reverse=sbf.reverse)
 
-    # Now "undecorate" the `AllFields`, converting it to `QueriedProcess`
-    # by slicing `[:num_fields_to_query]` and `*`-expanding it into the
-    # constructor of `QueriedProcess, then replace the `AllFields` instance
-    # with the new `QueriedProcess` instance, in-place in the sorted list.
-    for idx, fields in enumerate(selected_processes):
-        selected_processes[idx] = QueriedProcess(*(fields[:num_fields_to_query]))
+## Query processes from `asyncio`, without blocking the event loop.
+##
+## The PIDs are read in batches, each of which is read (and post-processed)
+## by a call to `loop.run_in_executor`, with a bounded number of batches in
+## progress at once.  The event loop is free to run other tasks while each
+## batch is read; and if the querying task is cancelled, the batches that
+## have not yet started are cancelled too.
 
-    if return_field_types or return_header_info:
+# The number of PIDs read per batch.
+_ASYNC_BATCH_SIZE = 64
+# The maximum number of batches in progress at once.
+_ASYNC_MAX_CONCURRENT_BATCHES = 4
+
+
+def _select_processes_in_batch(compiled_query, post_proc_settings, iter_backend, limit,
+        format_rows, pids):
+    """Select processes in the batch `pids`; return `(rows, query_stats)`.
+
+    This runs in an executor.  If `format_rows` is `True`, the rows will be
+    `QueriedProcess` instances; otherwise, they will be `AllFields` instances.
+
+    Batches may run concurrently, so each batch uses its own format caches
+    (like `_select_processes_in_chunk`).
+    """
+    query_stats = QueryStats()
+    post_proc_settings = with_new_format_caches(post_proc_settings)
+    rows = _select_processes(compiled_query, post_proc_settings,
+            iter_backend, query_stats, pids, limit)
+    if format_rows:
+        format_queried_process = compiled_query.format_queried_process
+        rows = [format_queried_process(r, post_proc_settings) for r in rows]
+    query_stats.add_format_cache_stats(post_proc_settings)
+    return (rows, query_stats)
+
+
+async def _aiter_batches(compiled_query, post_proc_settings, backend, query_stats,
+        executor, batch_size, limit, format_rows):
+    """Yield the list of selected rows of each batch of PIDs, in order of PID."""
+    loop = get_running_loop()
+    # Each UID is resolved to a user name at most once per query, and each
+    # system-wide value (eg, the boot-time) is looked-up at most once per
+    # query, rather than once per batch.  (Both the `UserNameResolver` & the
+    # `ProcReaderCaches` are thread-safe, so they can be shared by the batches.)
+    iter_backend = _get_backend(backend, UserNameResolver(), ProcReaderCaches())
+
+    pids = compiled_query.get_pids_to_visit()
+    if pids is None:
+        pids = await loop.run_in_executor(executor, _BACKEND_LIST_PIDS[backend])
+
+    pending = deque()
+    try:
+        for i in range(0, len(pids), batch_size):
+            if len(pending) >= _ASYNC_MAX_CONCURRENT_BATCHES:
+                (rows, batch_query_stats) = await pending.popleft()
+                query_stats.add(batch_query_stats)
+                yield rows
+            pending.append(loop.run_in_executor(executor, _select_processes_in_batch,
+                    compiled_query, post_proc_settings, iter_backend, limit,
+                    format_rows, pids[i : i + batch_size]))
+        while pending:
+            (rows, batch_query_stats) = await pending.popleft()
+            query_stats.add(batch_query_stats)
+            yield rows
+    finally:
+        # If the task was cancelled (or the caller stopped early), don't start
+        # any more batches.
+        for future in pending:
+            future.cancel()
+
+
+async def _aiter_queried_processes(compiled_query, post_proc_settings, backend,
+        query_stats, executor, batch_size, limit):
+    """Asynchronously yield each `QueriedProcess` of the batches, in order of PID."""
+    num_remaining = limit
+    batches = _aiter_batches(compiled_query, post_proc_settings, backend, query_stats,
+            executor, batch_size, limit, True)
+    try:
+        async for rows in batches:
+            if num_remaining is not None:
+                rows = rows[:num_remaining]
+                num_remaining -= len(rows)
+            for queried_process in rows:
+                yield queried_process
+            if num_remaining == 0:
+                break
+    finally:
+        await batches.aclose()
+
+
+def aiter_fields(fields_to_query,
+        selection_criteria=(),
+        use_base10_human_size=False,
+        return_query_stats=False,
+        backend=BACKEND_PROC,
+        limit=None,
+        executor=None,
+        batch_size=_ASYNC_BATCH_SIZE):
+    """Select processes; return an async iterator of `QueriedProcess`, in order of PID.
+
+    This is the `asyncio` equivalent of `iter_fields`:  the returned asynchronous
+    generator yields the same `QueriedProcess` results, without blocking the event
+    loop while "/proc" is read.  The processes are read in batches of at most
+    `batch_size` PIDs, by calling `loop.run_in_executor(executor, ...)`; if the
+    `executor` is `None`, the default executor of the event loop is used.
+
+    Like `iter_fields`, the arguments are validated (raising `ValueError`) when
+    this function is called, not when the iterator is first advanced.
+
+    If `return_query_stats` is `True`, the async iterator will be returned as the
+    first element of a tuple, followed by a `QueryStats` instance, which will be
+    updated as each batch is yielded; it will be complete when the iterator is
+    exhausted (or closed).
+    """
+    if limit is not None and limit < 0:
+        raise ValueError("invalid limit: %s" % limit)
+    if batch_size < 1:
+        raise ValueError("invalid batch size: %s" % batch_size)
+    compiled_query = _CompiledQuery(fields_to_query, selection_criteria, ())
+    post_proc_settings = \
+            get_post_proc_settings(
+                    use_base10_human_size=use_base10_human_size)
+    query_stats = QueryStats()
+
+    queried_processes = _aiter_queried_processes(compiled_query, post_proc_settings,
+            backend, query_stats, executor, batch_size, limit)
+    if return_query_stats:
+        return (queried_processes, query_stats)
+    else:
+        return queried_processes
+
+
+async def aquery_fields(fields_to_query,
+        selection_criteria=(),
+        sort_by_fields=(),
+        return_field_types=False,
+        return_header_info=False,
+        use_base10_human_size=False,
+        return_query_stats=False,
+        backend=BACKEND_PROC,
+        limit=None,
+        executor=None,
+        batch_size=_ASYNC_BATCH_SIZE):
+    """Select processes; query the fields requested in `fields_to_query`.
+
+    This is the `asyncio` equivalent of `query_fields`:  a coroutine that returns
+    the same results, without blocking the event loop while "/proc" is read.
+    The processes are read in batches of at most `batch_size` PIDs, by calling
+    `loop.run_in_executor(executor, ...)`; the final sort (& post-processing)
+    is also run in the executor.  If the `executor` is `None`, the default
+    executor of the event loop is used.
+    """
+    if limit is not None and limit < 0:
+        raise ValueError("invalid limit: %s" % limit)
+    if batch_size < 1:
+        raise ValueError("invalid batch size: %s" % batch_size)
+    compiled_query = _CompiledQuery(fields_to_query, selection_criteria, sort_by_fields)
+    post_proc_settings = \
+            get_post_proc_settings(
+                    use_base10_human_size=use_base10_human_size)
+    query_stats = QueryStats()
+
+    # If there's a `limit`, each batch returns only its own top `limit` rows.
+    selected_processes = []
+    batches = _aiter_batches(compiled_query, post_proc_settings, backend, query_stats,
+            executor, batch_size, limit, False)
+    try:
+        async for rows in batches:
+            selected_processes.extend(rows)
+    finally:
+        await batches.aclose()
+
+    loop = get_running_loop()
+    if limit is not None:
+        selected_processes = await loop.run_in_executor(executor, _select_top_n,
+                selected_processes, limit, compiled_query.sort_by_fields)
+    selected_processes = await loop.run_in_executor(executor, _sort_and_undecorate,
+            compiled_query, selected_processes, limit, post_proc_settings)
+    query_stats.add_format_cache_stats(post_proc_settings)
+
+    if return_field_types or return_header_info or return_query_stats:
         result = (selected_processes,)
         if return_field_types:
-            result += (all_field_types[:num_fields_to_query],)
+            result += (compiled_query.field_types[:compiled_query.num_fields_to_query],)
         if return_header_info:
-            result += _collect_header_info()
+            result += await loop.run_in_executor(executor, _collect_header_info)
+        if return_query_stats:
+            result += (query_stats,)
         return result
     else:
         return selected_processes
 
+
+## Repeatedly re-query the same fields (like the `top` program does).
+
+# The attributes that don't change during the lifetime of a process (or at
+# least, until it calls `execve`), which can be cached across refreshes of a
+# `LiveQuery`, per (PID, start time, "comm").
+#
+# The other "identity-like" attributes are NOT static:  a process may rewrite
+# its command-line (eg, using `setproctitle`), change its UIDs (eg, a daemon
+# that drops privileges after start-up) or its controlling terminal (using
+# `setsid`).  And the user name must be re-resolved from the current UIDs by
+# the `UserNameResolver`, so that its TTL is respected.
+#
+# So the saving is modest:  the identity attributes are read from "stat" (which
+# most queries read anyway, eg, for `ppid` or `create_time`); then the cache
+# saves the `readlink` of "exe" for every process, and the read of "cmdline"
+# for every process whose name is truncated by the kernel (15 characters or
+# more), which `name` otherwise needs to recover the full executable name.
+_STATIC_ATTR_NAMES = frozenset(("create_time", "exe", "name", "pid"))
+
+# The attributes that identify a process across refreshes of a `LiveQuery`.
+# A PID may be re-used by a new process (which will have a different start
+# time), and a process may `execve` a new executable (which will almost always
+# have a different "comm", the executable name as truncated by the kernel).
+# Both are read from "/proc/${pid}/stat" alone; unlike `name`, which also reads
+# "/proc/${pid}/cmdline" if "comm" was truncated.
+_PROC_IDENTITY_ATTR_NAMES = ("create_time", "comm")
+
+
+class _CachedProcessSnapshot(object):
+    """Wrap a backend snapshot; return the static attributes from a cache."""
+    __slots__ = ("_snapshot", "_static_attrs")
+
+    def __init__(self, snapshot, static_attrs):
+        self._snapshot = snapshot
+        # A `dict` of static attribute name -> value, which is filled lazily
+        # (the first time each static attribute is requested for a process)
+        # and re-used by all later snapshots of the same process.
+        self._static_attrs = static_attrs
+
+    def get_attrs(self, attr_names, oom_attr_names=()):
+        static_attrs = self._static_attrs
+        dynamic_attr_names = []
+        missing_static_attr_names = []
+        for a in attr_names:
+            if a not in _STATIC_ATTR_NAMES:
+                dynamic_attr_names.append(a)
+            elif a not in static_attrs:
+                missing_static_attr_names.append(a)
+
+        if missing_static_attr_names:
+            static_attrs.update(self._snapshot.get_attrs(missing_static_attr_names))
+        attr_dict = self._snapshot.get_attrs(dynamic_attr_names, oom_attr_names)
+        for a in attr_names:
+            if a in _STATIC_ATTR_NAMES:
+                attr_dict[a] = static_attrs[a]
+        return attr_dict
+
+
+def _iter_cached_backend(iter_backend, static_attrs_cache):
+    """Return a backend that caches static attributes in `static_attrs_cache`.
+
+    The `static_attrs_cache` is a `dict` of PID -> (identity, static attrs).
+    When the returned backend finishes iterating, the cache entries of PIDs
+    that were not visited (eg, because the process exited) are evicted.
+    """
+    def _iter_backend(query_stats, pids=None):
+        visited_cache = {}
+        try:
+            for pid, snapshot in iter_backend(query_stats, pids):
+                try:
+                    identity_attrs = snapshot.get_attrs(_PROC_IDENTITY_ATTR_NAMES)
+                except ProcessLookupError:
+                    continue
+                identity = tuple(identity_attrs[a] for a in _PROC_IDENTITY_ATTR_NAMES)
+                cache_entry = static_attrs_cache.get(pid)
+                if cache_entry is None or cache_entry[0] != identity:
+                    # A new process (or a new executable).  The identity
+                    # attributes are themselves static, so start with those.
+                    cache_entry = (identity, identity_attrs)
+                visited_cache[pid] = cache_entry
+                yield (pid, _CachedProcessSnapshot(snapshot, cache_entry[1]))
+        finally:
+            static_attrs_cache.clear()
+            static_attrs_cache.update(visited_cache)
+
+    return _iter_backend
+
+
+class LiveQuery(object):
+    """A query that is compiled once, then re-run (refreshed) repeatedly.
+
+    This is intended for `top`-like operation:  the fields, the selection
+    criteria & the sort criteria are validated & compiled just once, in the
+    constructor (raising `ValueError` just like `query_fields`).  Then each
+    call to `refresh()` re-queries the running processes.
+
+    With the "proc" backend, the static attributes of each process (its
+    executable name & path, and its start time) are cached across refreshes,
+    per (PID, start time) of each process; every other attribute (eg,
+    command-line, UIDs, memory info, OOM score, CPU times) is re-read by each
+    refresh.  The cached attributes of a process are evicted when the process
+    exits (or calls `execve`).  So a refresh never reads more files than the
+    same `query_fields`, and reads fewer if the executable name is queried.
+
+    User names are cached across refreshes too, by UID; this cache is emptied
+    after `user_name_ttl_secs` seconds (so that changes to the user database
+    are eventually noticed).
+
+    A `LiveQuery` is NOT thread-safe; and it always collects processes serially
+    (the `workers` parameter of `query_fields` is not supported).
+    """
+    __slots__ = ("_compiled_query", "_iter_backend", "_static_attrs_cache",
+            "_user_names", "_use_base10_human_size", "limit")
+
+    def __init__(self, fields_to_query,
+            selection_criteria=(),
+            sort_by_fields=(),
+            use_base10_human_size=False,
+            backend=BACKEND_PROC,
+            limit=None,
+            user_name_ttl_secs=60.0):
+        if limit is not None and limit < 0:
+            raise ValueError("invalid limit: %s" % limit)
+        self._static_attrs_cache = {}
+        self._user_names = UserNameResolver(ttl_secs=user_name_ttl_secs)
+        self._compiled_query = compiled_query = \
+                _CompiledQuery(fields_to_query, selection_criteria, sort_by_fields)
+        self._iter_backend = _get_backend(backend, self._user_names)
+        attr_names = set(compiled_query.select_attr_names[0])
+        attr_names.update(compiled_query.extract_attr_names[0])
+        # If no static attribute (other than `pid`) is queried, there's nothing
+        # to cache, & reading the identity attributes of each process would be
+        # wasted; so don't wrap the backend at all.  Likewise for the `psutil`
+        # backend, which doesn't provide the cheap identity attribute "comm".
+        if backend == BACKEND_PROC and attr_names & (_STATIC_ATTR_NAMES - {"pid"}):
+            self._iter_backend = _iter_cached_backend(
+                    self._iter_backend, self._static_attrs_cache)
+        self._use_base10_human_size = use_base10_human_size
+        self.limit = limit
+
+    @property
+    def field_types(self):
+        """The field types of the fields in `fields_to_query`."""
+        compiled_query = self._compiled_query
+        return compiled_query.field_types[:compiled_query.num_fields_to_query]
+
+    @property
+    def num_cached_processes(self):
+        """The number of processes whose static attributes are cached."""
+        return len(self._static_attrs_cache)
+
+    def refresh(self, return_header_info=False, return_query_stats=False):
+        """Re-query the running processes; return a list of `QueriedProcess`.
+
+        The results are the same as those of `query_fields` (for the same
+        arguments), including the optional extra results.
+        """
+        compiled_query = self._compiled_query
+        query_stats = QueryStats()
+        self._user_names.expire_if_stale()
+        # The post-processing settings include the current time, so they must
+        # be re-calculated for each refresh.
+        post_proc_settings = \
+                get_post_proc_settings(
+                        use_base10_human_size=self._use_base10_human_size)
+
+        selected_processes = _select_processes(compiled_query, post_proc_settings,
+                self._iter_backend, query_stats, limit=self.limit)
+        selected_processes = _sort_and_undecorate(compiled_query, selected_processes,
+                self.limit, post_proc_settings)
+        query_stats.add_format_cache_stats(post_proc_settings)
+
+        if return_header_info or return_query_stats:
+            result = (selected_processes,)
+            if return_header_info:
+                result += _collect_header_info()
+            if return_query_stats:
+                result += (query_stats,)
+            return result
+        else:
+            return selected_processes
+
+
+## Estimate the OOM Score of processes (& so rank the likely OOM Killer victims),
+## without reading "/proc/${pid}/oom_score" of every process.
+
+OomScoreEstimate = namedtuple("OomScoreEstimate", ("pid", "exe", "est_ooms", "ooms"))
+
+OomScoreValidation = namedtuple("OomScoreValidation", (
+        "num_processes", "num_exact", "max_abs_error", "mean_abs_error",
+        "max_abs_error_pid", "is_top_victim_correct"))
+
+# The fields that are queried to estimate the OOM Score (in the order of the
+# arguments of `_estimate_oom_score_column`), plus `exe`.
+_OOM_ESTIMATE_FIELD_NAMES = ("rszk", "vszk", "vmswapk", "ptek", "adj", "pid", "exe")
+
+
+def estimate_oom_scores(selection_criteria=(),
+        limit=None,
+        formula=None,
+        validate=False,
+        backend=BACKEND_PROC):
+    """Rank the selected processes by their estimated OOM Score (highest first).
+
+    Return a list of `OomScoreEstimate`, in which `est_ooms` is the estimated
+    OOM Score; the first process is the one that the OOM Killer would most
+    likely kill.  Processes with equal scores are in order of PID.
+
+    The OOM Score is estimated (like the kernel calculates it) from the fields
+    `rszk`, `vmswapk`, `ptek` & `adj` of each process, and the total RAM &
+    swap in `MemoryInfo`; see module `_oomscore` for the details.  So no
+    "/proc/${pid}/oom_score" file is read.  The `formula` may be
+    `OOM_SCORE_FORMULA_CURRENT` (Linux 5.9 and later) or
+    `OOM_SCORE_FORMULA_LEGACY`; if `None` (the default), the formula of the
+    running kernel will be used.  An invalid `formula` will raise `ValueError`.
+
+    The `selection_criteria`, `limit` & `backend` are just like those of
+    `query_fields`.
+
+    If `validate` is `True`, the real OOM Score (field `ooms`) of each process
+    is also read, into `OomScoreEstimate.ooms` (otherwise `None`); and an
+    `OomScoreValidation` (which compares the estimated & real scores of ALL
+    the selected processes, before `limit`) is returned as a second result.
+    """
+    if formula is None:
+        formula = get_kernel_oom_score_formula()
+    if limit is not None and limit < 0:
+        raise ValueError("invalid limit: %s" % limit)
+    fields_to_query = _OOM_ESTIMATE_FIELD_NAMES + (("ooms",) if validate else ())
+    (columns, memory_info, overcommit_settings) = query_fields(fields_to_query,
+            selection_criteria=selection_criteria,
+            return_header_info=True,
+            backend=backend,
+            result_format=RESULT_FORMAT_COLUMNS)
+
+    est_scores = _estimate_oom_score_column(
+            *columns[:len(_OOM_ESTIMATE_FIELD_NAMES) - 1],
+            memory_info.mem_total_KiB + memory_info.swap_total_KiB,
+            formula=formula)
+    # The processes are in order of PID, and the sort is stable.
+    ranking = sorted(range(len(est_scores)), key=est_scores.__getitem__, reverse=True)
+
+    pids = columns.pid
+    exes = columns.exe
+    real_scores = columns.ooms if validate else None
+    estimates = [OomScoreEstimate(pids[idx], exes[idx], est_scores[idx],
+                (real_scores[idx] if validate else None))
+            for idx in ranking[:limit]]
+    if not validate:
+        return estimates
+
+    abs_errors = [abs(est - real) for est, real in zip(est_scores, real_scores)]
+    num_processes = len(abs_errors)
+    if num_processes:
+        max_abs_error = max(abs_errors)
+        max_abs_error_pid = pids[abs_errors.index(max_abs_error)]
+        mean_abs_error = sum(abs_errors) / num_processes
+        real_top_score = max(real_scores)
+        is_top_victim_correct = (real_scores[ranking[0]] == real_top_score)
+    else:
+        (max_abs_error, max_abs_error_pid, mean_abs_error, is_top_victim_correct) = \
+                (0, None, 0.0, True)
+    validation = OomScoreValidation(num_processes, abs_errors.count(0), max_abs_error,
+            mean_abs_error, max_abs_error_pid, is_top_victim_correct)
+    return (estimates, validation)
+
+
+## Record snapshots of the queried processes to a file, for later queries
+## (eg, after an OOM incident, to see the processes just before it).
+
+# The fields that are recorded by default:  enough for all the selection
+# criteria (& the usual sort criteria) to be re-run against a snapshot.
+RECORD_FIELD_NAMES = ("pid", "ppid", "uid", "user", "starts", "tty", "exe",
+        "rszk", "vszk", "adj", "ooms", "cmds")
+
+
+class SnapshotRecorder(object):
+    """Append a snapshot of the queried processes to a file, each time `record()`.
+
+    Each snapshot contains the header info (`MemoryInfo` & `OvercommitSettings`)
+    and the field values of `fields_to_record` for each selected process.  The
+    processes are selected (& sorted & limited) just like `LiveQuery`, which
+    this class uses to query the processes.
+
+    Each field in `fields_to_record` must have a field type of `int`, `float`
+    or `str` (eg, not `cmd`, which is a `tuple`), else `ValueError` is raised.
+    If the file at `path` already exists, it must have been recorded with the
+    same `fields_to_record`, else `ValueError` is raised.
+
+    Use `SnapshotFile` to query the recorded snapshots.
+    """
+    __slots__ = ("_live_query", "_writer")
+
+    def __init__(self, path,
+            fields_to_record=RECORD_FIELD_NAMES,
+            selection_criteria=(),
+            sort_by_fields=(),
+            limit=None):
+        typecodes = tuple(get_field_typecode(f, get_field_type(f).py_type)
+                for f in fields_to_record)
+        self._live_query = LiveQuery(fields_to_record,
+                selection_criteria=selection_criteria,
+                sort_by_fields=sort_by_fields,
+                limit=limit)
+        self._writer = SnapshotWriter(path, fields_to_record, typecodes)
+
+    def close(self):
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def num_snapshots(self):
+        """The number of snapshots recorded (by this recorder)."""
+        return self._writer.num_snapshots
+
+    def record(self):
+        """Query the running processes; append a snapshot to the file.
+
+        Return the number of processes in the snapshot.
+        """
+        (queried_procs, memory_info, overcommit_settings) = \
+                self._live_query.refresh(return_header_info=True)
+        self._writer.write_snapshot(queried_procs, memory_info, overcommit_settings,
+                time())
+        return len(queried_procs)
+
+
+class SnapshotFile(object):
+    """Query the snapshots in a file that was recorded by `SnapshotRecorder`.
+
+    The file is memory-mapped, and only the snapshots that are queried are
+    read (so a query of the last snapshot in a large file is still fast).
+    If the file is not a valid snapshot file, the constructor raises
+    `ValueError`.  The snapshots are indexed from 0 (the oldest snapshot);
+    and just like a list, index -1 is the most-recent snapshot.
+    """
+    __slots__ = ("_reader",)
+
+    def __init__(self, path):
+        self._reader = SnapshotReader(path)
+
+    def close(self):
+        self._reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._reader)
+
+    @property
+    def field_names(self):
+        """The names of the fields that were recorded in each snapshot."""
+        return self._reader.field_names
+
+    @property
+    def field_types(self):
+        """The field types of the fields that were recorded in each snapshot."""
+        return tuple(get_field_type(f) for f in self._reader.field_names)
+
+    def get_header_info(self, snapshot_idx):
+        """Return `(snapshot_time, memory_info, overcommit_settings)` of a snapshot.
+
+        The `snapshot_time` is in seconds since the UNIX epoch.  If
+        `snapshot_idx` is out of range, raise `IndexError`.
+        """
+        header = self._reader.read_header(snapshot_idx)
+        return (header.snapshot_time, MemoryInfo._make(header.memory_info),
+                header.overcommit_settings)
+
+    def query(self, snapshot_idx,
+            fields_to_query=None,
+            selection_criteria=(),
+            sort_by_fields=(),
+            limit=None):
+        """Select & sort the processes in a snapshot; return a list of `QueriedProcess`.
+
+        The selection criteria, sort criteria & `limit` are just like those of
+        `query_fields`.  If `fields_to_query` is `None` (the default), all the
+        recorded fields are returned.  Every field in `fields_to_query`, and
+        every field that is required by the selection or sort criteria, must
+        have been recorded; else `ValueError` is raised.
+        """
+        reader = self._reader
+        if fields_to_query is None:
+            fields_to_query = reader.field_names
+        elif not fields_to_query:
+            raise ValueError("no fields to query")
+        if limit is not None and limit < 0:
+            raise ValueError("invalid limit: %s" % limit)
+        selection_funcs = tuple(c.get_func() for c in selection_criteria)
+        for field_name in chain(fields_to_query,
+                chain.from_iterable(c.field_names() for c in selection_criteria),
+                (sbf.field_name for sbf in sort_by_fields)):
+            if field_name not in reader.field_names:
+                # Raise `ValueError` if it's not a valid field name at all.
+                get_field_info(field_name)
+                raise ValueError("field not recorded: %s" % field_name)
+
+        selected_processes = reader.iter_rows(snapshot_idx)
+        if selection_funcs:
+            selected_processes = (p for p in selected_processes
+                    if any(func(p) for func in selection_funcs))
+        if limit is not None:
+            selected_processes = _select_top_n(selected_processes, limit, sort_by_fields)
+        else:
+            selected_processes = list(selected_processes)
+        _sort_selected_processes(sort_by_fields, selected_processes, limit)
+
+        # Like `query_fields`, return only the fields in `fields_to_query`.
+        QueriedProcess = namedtuple("QueriedProcess", fields_to_query)
+        if tuple(fields_to_query) == reader.field_names:
+            return [QueriedProcess._make(p) for p in selected_processes]
+        get_values = attrgetter(*fields_to_query)
+        if len(fields_to_query) == 1:
+            return [QueriedProcess(get_values(p)) for p in selected_processes]
+        return [QueriedProcess._make(get_values(p)) for p in selected_processes]
@@ -0,0 +1,559 @@
+# Copyright (c) 2020 James Boyden <jboy@jboy.me>. All rights reserved.
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Parse & compile `oomtables` rules; match processes; apply `oom_score_adj`.
+
+The rules look like `if`-statements in C:
+
+    # Comments start with '#' and continue until end-of-line.
+    if exe == "chrome" {
+        oom_score_adj = 500
+    }
+    if uid == 1000 && cmdline ^= "/usr/bin/python3 " {
+        oom_score_adj = -100
+    }
+
+Each rule has 1 or more conditions (joined by `&&`, all of which must match)
+and a single action.  The conditions may be any of:
+
+    exe == "<name>"         The executable name (without path) equals <name>.
+    exe ^= "<start>"        The executable name starts with <start>.
+    uid == <uid>            The (real) UID of the process equals <uid>.
+    cmdline == "<cmd>"      The joined command-line equals <cmd>.
+    cmdline ^= "<start>"    The joined command-line starts with <start>.
+
+The action must be:
+
+    oom_score_adj = <int>   Set the OOM Score Adjustment: [-1000, 1000].
+
+The rules are tested in order, and the FIRST rule that matches a process
+determines the `oom_score_adj` of that process (like `iptables`).
+
+All the rules are compiled into a single `RuleTable`, which indexes the rules
+by exe name, UID & command-line (prefix); so each process is tested against
+only the few rules that could possibly match it, and all the rules are matched
+in a single pass over the running processes.
+"""
+
+import re
+from collections import namedtuple
+from operator import attrgetter
+from time import monotonic_ns
+
+from . import api
+from ._procio import OOM_SCORE_ADJ_MAX, OOM_SCORE_ADJ_MIN, OomScoreAdjWriter
+
+
+## Parse the rules.
+
+# A single condition of a rule, eg: `exe == "chrome"`.
+Condition = namedtuple("Condition", ("field", "op", "value"))
+
+# A single rule.  The `rule_num` is the position of the rule (from 0) in the
+# order of rules; the `line_num` is the line (from 1) of the `if` keyword.
+Rule = namedtuple("Rule", ("rule_num", "line_num", "conditions", "oom_score_adj"))
+
+# The condition fields -> (the `psquery` field name, the valid operators, type).
+_CONDITION_FIELDS = {
+        "exe": ("exe", ("==", "^="), str),
+        "uid": ("uid", ("==",), int),
+        "cmdline": ("cmds", ("==", "^="), str),
+}
+
+# The action fields.
+_ACTION_FIELDS = ("oom_score_adj",)
+
+_TOKEN_REGEX = re.compile(r"""
+        (?P<space>[ \t\r]+)
+        | (?P<newline>\n)
+        | (?P<comment>\#[^\n]*)
+        | (?P<string>"(?:[^"\\\n]|\\.)*")
+        | (?P<int>[-+]?[0-9]+)
+        | (?P<name>[A-Za-z_][A-Za-z_0-9]*)
+        | (?P<op>==|\^=|&&|=|\{|\}|;)
+        """, re.VERBOSE)
+
+_STRING_ESCAPE_REGEX = re.compile(r"\\(.)")
+# The characters that must be escaped in a string (by `format_rules`).
+_STRING_UNESCAPED_REGEX = re.compile(r'["\\]')
+
+
+def _tokenize(text):
+    """Yield a 3-tuple `(kind, value, line_num)` for each token in `text`."""
+    line_num = 1
+    pos = 0
+    end = len(text)
+    while pos < end:
+        m = _TOKEN_REGEX.match(text, pos)
+        if m is None:
+            raise ValueError("line %d: invalid syntax: %r" %
+                    (line_num, text[pos:].split("\n", 1)[0]))
+        pos = m.end()
+        kind = m.lastgroup
+        value = m.group(kind)
+        if kind == "newline":
+            line_num += 1
+        elif kind == "string":
+            # Remove the quotes; replace each escape `\c` by the character `c`.
+            yield (kind, _STRING_ESCAPE_REGEX.sub(r"\1", value[1:-1]), line_num)
+        elif kind == "int":
+            yield (kind, int(value), line_num)
+        elif kind != "space" and kind != "comment":
+            yield (kind, value, line_num)
+    yield ("end", None, line_num)
+
+
+class _Parser(object):
+    __slots__ = ("_tokens", "_token")
+
+    def __init__(self, text):
+        self._tokens = _tokenize(text)
+        self._token = next(self._tokens)
+
+    def _next(self):
+        token = self._token
+        self._token = next(self._tokens)
+        return token
+
+    def _expect(self, kind, value=None):
+        (tok_kind, tok_value, line_num) = self._token
+        if tok_kind != kind or (value is not None and tok_value != value):
+            expected = repr(value) if value is not None else kind
+            found = repr(tok_value) if tok_value is not None else "end of rules"
+            raise ValueError("line %d: expected %s, found %s" % (line_num, expected, found))
+        return self._next()
+
+    def parse_rules(self):
+        rules = []
+        while self._token[0] != "end":
+            rules.append(self._parse_rule(len(rules)))
+        return rules
+
+    def _parse_rule(self, rule_num):
+        (kind, value, line_num) = self._expect("name", "if")
+        conditions = [self._parse_condition()]
+        while self._token[:2] == ("op", "&&"):
+            self._next()
+            conditions.append(self._parse_condition())
+
+        self._expect("op", "{")
+        oom_score_adj = None
+        while self._token[:2] != ("op", "}"):
+            (field, value, action_line_num) = self._parse_action()
+            if oom_score_adj is not None:
+                raise ValueError("line %d: duplicate action: %s" % (action_line_num, field))
+            oom_score_adj = value
+        self._expect("op", "}")
+        if oom_score_adj is None:
+            raise ValueError("line %d: rule has no action" % line_num)
+
+        return Rule(rule_num, line_num, tuple(conditions), oom_score_adj)
+
+    def _parse_condition(self):
+        (kind, field, line_num) = self._expect("name")
+        try:
+            (field_name, valid_ops, value_type) = _CONDITION_FIELDS[field]
+        except KeyError:
+            raise ValueError("line %d: invalid condition field: %s" % (line_num, field))
+        (kind, op, line_num) = self._expect("op")
+        if op not in valid_ops:
+            raise ValueError("line %d: invalid operator for %s: %s" % (line_num, field, op))
+        (kind, value, line_num) = self._next()
+        if not isinstance(value, value_type) or kind not in ("string", "int"):
+            raise ValueError("line %d: invalid value for %s: %r" % (line_num, field, value))
+        return Condition(field, op, value)
+
+    def _parse_action(self):
+        (kind, field, line_num) = self._expect("name")
+        if field not in _ACTION_FIELDS:
+            raise ValueError("line %d: invalid action field: %s" % (line_num, field))
+        self._expect("op", "=")
+        (kind, value, value_line_num) = self._expect("int")
+        if not (OOM_SCORE_ADJ_MIN <= value <= OOM_SCORE_ADJ_MAX):
+            raise ValueError("line %d: invalid %s: %d" % (value_line_num, field, value))
+        if self._token[:2] == ("op", ";"):
+            self._next()
+        return (field, value, line_num)
+
+
+def parse_rules(text):
+    """Parse the rules in the string `text`; return a list of `Rule`.
+
+    If there is a syntax error, raise `ValueError` (with the line number).
+    """
+    return _Parser(text).parse_rules()
+
+
+def format_rules(rules):
+    """Format the `Rule`s in `rules` as text, in the syntax of `parse_rules`.
+
+    Parsing the text returns the same rules (except for their line numbers).
+    A string value that contains a newline can't be formatted (because a
+    string can't span lines), so it will raise `ValueError`.
+    """
+    lines = []
+    for rule in rules:
+        conditions = []
+        for cond in rule.conditions:
+            if isinstance(cond.value, str):
+                if "\n" in cond.value:
+                    raise ValueError("string contains a newline: %r" % cond.value)
+                value = '"%s"' % _STRING_UNESCAPED_REGEX.sub(r"\\\g<0>", cond.value)
+            else:
+                value = "%d" % cond.value
+            conditions.append("%s %s %s" % (cond.field, cond.op, value))
+        lines.append("if %s {" % " && ".join(conditions))
+        lines.append("    oom_score_adj = %d" % rule.oom_score_adj)
+        lines.append("}")
+    return "".join("%s\n" % line for line in lines)
+
+
+## Compile the rules into a decision table.
+
+def _cond_equals(value, cond_value):
+    return value == cond_value
+
+
+def _cond_starts_with(value, cond_value):
+    return value is not None and value.startswith(cond_value)
+
+
+_CONDITION_OPS = {
+        "==": _cond_equals,
+        "^=": _cond_starts_with,
+}
+
+
+class RuleTable(object):
+    """All the rules, compiled into a decision table.
+
+    Each rule is indexed by exactly one of its conditions (the one expected
+    to be the most selective), in one of these look-up tables:
+     - exe name ==: a `dict` of exe name -> rule numbers
+     - uid ==: a `dict` of UID -> rule numbers
+     - cmdline ==: a `dict` of command-line -> rule numbers
+     - cmdline ^=: per prefix length, a `dict` of prefix -> rule numbers
+     - exe name ^=: per prefix length, a `dict` of prefix -> rule numbers
+    The rules are looked-up by the values of each process; then any other
+    ("residual") conditions of those candidate rules are tested, in order
+    of rule number, until the first rule that matches.
+
+    Only the fields that are used by at least one condition are in attribute
+    `field_names` (so that, eg, the command-line is not read at all if no rule
+    has a `cmdline` condition).
+    """
+    __slots__ = ("rules", "field_names", "_get_values", "_by_exe", "_by_uid",
+            "_by_cmdline", "_by_cmdline_prefix", "_by_exe_prefix", "_wildcard",
+            "_residuals")
+
+    # The order of the values of each process, for `_get_values`.
+    _FIELDS = ("exe", "uid", "cmdline")
+
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+        used_fields = set(cond.field for rule in self.rules for cond in rule.conditions)
+        self.field_names = tuple(_CONDITION_FIELDS[f][0]
+                for f in self._FIELDS if f in used_fields)
+        # Un-used fields are `None` (& are never tested by any condition).
+        getters = tuple((attrgetter(_CONDITION_FIELDS[f][0]) if f in used_fields else None)
+                for f in self._FIELDS)
+        self._get_values = (lambda process:
+                tuple((g(process) if g is not None else None) for g in getters))
+
+        by_exe = {}
+        by_uid = {}
+        by_cmdline = {}
+        by_cmdline_prefix = {}
+        by_exe_prefix = {}
+        wildcard = []
+        residuals = []
+        for rule in self.rules:
+            index_cond = self._choose_index_condition(rule.conditions)
+            if index_cond is None:
+                wildcard.append(rule.rule_num)
+            elif index_cond.op == "==":
+                table = {"exe": by_exe, "uid": by_uid, "cmdline": by_cmdline}[index_cond.field]
+                table.setdefault(index_cond.value, []).append(rule.rule_num)
+            else:
+                tables = {"cmdline": by_cmdline_prefix, "exe": by_exe_prefix}[index_cond.field]
+                table = tables.setdefault(len(index_cond.value), {})
+                table.setdefault(index_cond.value, []).append(rule.rule_num)
+
+            residuals.append(tuple(
+                    (self._FIELDS.index(cond.field), _CONDITION_OPS[cond.op], cond.value)
+                    for cond in rule.conditions
+                    if cond is not index_cond))
+
+        self._by_exe = by_exe
+        self._by_uid = by_uid
+        self._by_cmdline = by_cmdline
+        # Sequences of `(prefix length, dict)`, in ascending prefix length.
+        self._by_cmdline_prefix = tuple(sorted(by_cmdline_prefix.items()))
+        self._by_exe_prefix = tuple(sorted(by_exe_prefix.items()))
+        self._wildcard = wildcard
+        self._residuals = tuple(residuals)
+
+    @staticmethod
+    def _choose_index_condition(conditions):
+        # Prefer equality (a single `dict` look-up) over prefixes; and prefer
+        # longer prefixes (which are more selective) over shorter prefixes.
+        def _priority(cond):
+            if cond.op == "==":
+                return (0, ("exe", "uid", "cmdline").index(cond.field))
+            else:
+                return (1, ("cmdline", "exe").index(cond.field), -len(cond.value))
+        if not conditions:
+            return None
+        return min(conditions, key=_priority)
+
+    def match(self, process):
+        """Return the first `Rule` that matches `process`, or `None`.
+
+        The `process` must have attributes for each field in `field_names`
+        (eg, a `QueriedProcess` or `SelectionFields`).
+        """
+        values = self._get_values(process)
+        (exe, uid, cmdline) = values
+
+        candidates = []
+        if self._by_exe:
+            candidates.extend(self._by_exe.get(exe, ()))
+        if self._by_uid:
+            candidates.extend(self._by_uid.get(uid, ()))
+        if self._by_cmdline:
+            candidates.extend(self._by_cmdline.get(cmdline, ()))
+        if cmdline is not None:
+            for length, table in self._by_cmdline_prefix:
+                if length > len(cmdline):
+                    break
+                candidates.extend(table.get(cmdline[:length], ()))
+        if exe is not None:
+            for length, table in self._by_exe_prefix:
+                if length > len(exe):
+                    break
+                candidates.extend(table.get(exe[:length], ()))
+        candidates.extend(self._wildcard)
+        if not candidates:
+            return None
+
+        # The first matching rule (ie, the lowest rule number) wins.
+        candidates.sort()
+        residuals = self._residuals
+        for rule_num in candidates:
+            for field_idx, op_func, cond_value in residuals[rule_num]:
+                if not op_func(values[field_idx], cond_value):
+                    break
+            else:
+                return self.rules[rule_num]
+        return None
+
+
+def compile_rules(text):
+    """Parse & compile the rules in the string `text`; return a `RuleTable`."""
+    return RuleTable(parse_rules(text))
+
+
+## Match processes, and apply the rules.
+
+class ProcessMatchesRuleTable(api.ProcessSelectionCriterion):
+    """Match processes that match any rule in the `RuleTable` `rule_table`."""
+    __slots__ = ("_rule_table",)
+
+    def __init__(self, rule_table):
+        super().__init__(rule_table)
+        self._rule_table = rule_table
+
+    def field_names(self):
+        return self._rule_table.field_names
+
+    def get_func(self):
+        match = self._rule_table.match
+        return (lambda process: match(process) is not None)
+
+
+# A process that matched a rule.
+RuleMatch = namedtuple("RuleMatch", ("pid", "exe", "old_oom_score_adj", "rule"))
+
+
+def match_processes(rule_table, backend=api.BACKEND_PROC, pids=None):
+    """Match all the running processes against `rule_table`, in a single pass.
+
+    Return a list of `RuleMatch` (one for each process that matched a rule),
+    in order of PID.
+
+    If `pids` is not `None`, only the processes with those PIDs are matched.
+    """
+    fields = ["pid", "exe", "adj"]
+    fields.extend(f for f in rule_table.field_names if f not in fields)
+    selected_processes = api.iter_fields(fields,
+            selection_criteria=(ProcessMatchesRuleTable(rule_table),),
+            backend=backend, pids=pids)
+
+    matches = []
+    for process in selected_processes:
+        # The process was selected because it matched a rule, so this will
+        # find the same rule again.
+        rule = rule_table.match(process)
+        matches.append(RuleMatch(process.pid, process.exe, process.adj, rule))
+    return matches
+
+
+def apply_matches(matches, dry_run=False, writer=None):
+    """Write the `oom_score_adj` of the rule of each `RuleMatch` in `matches`.
+
+    The write is skipped for each process that already has that value (as read
+    by `match_processes`).  If `dry_run` is true, nothing is written; see method
+    `OomScoreAdjWriter.write` in `_procio`.
+
+    The writes are made by `writer` (an `OomScoreAdjWriter`) if not `None`;
+    otherwise, by a new writer for just these writes.
+
+    Return `(report, errors)`, where `report` is an `OomScoreAdjWriteReport`
+    and `errors` is a list of `(match, error)` for each write that was not
+    permitted (`PermissionError`).  A process that exited before it could be
+    written is counted in `report.num_vanished`, but is not an error.
+    """
+    desired_adjs = {m.pid: m.rule.oom_score_adj for m in matches}
+    current_adjs = {m.pid: m.old_oom_score_adj for m in matches}
+    if writer is None:
+        # Nothing will be written twice, so don't keep any files open.
+        with OomScoreAdjWriter(max_open_fds=0) as writer:
+            report = writer.write(desired_adjs, current_adjs, dry_run)
+    else:
+        report = writer.write(desired_adjs, current_adjs, dry_run)
+
+    matches_by_pid = {m.pid: m for m in matches}
+    errors = [(matches_by_pid[pid], e) for pid, e in report.failures
+            if isinstance(e, PermissionError)]
+    return (report, errors)
+
+
+## Apply the rules to new processes, as they are started (or exec'd).
+
+class DaemonStats(object):
+    """Statistics about the work done by `run_daemon`."""
+    __slots__ = ("event_source", "num_events", "num_events_lost", "num_pids_matched",
+            "num_applied", "num_skipped", "num_vanished", "num_denied", "rule_match_counts",
+            "num_latencies", "sum_latency_secs", "max_latency_secs")
+
+    def __init__(self, rule_table, event_source):
+        # The name of the event source (eg, "netlink" or "poll").
+        self.event_source = event_source.name
+        # The number of events (ie, new or exec'd PIDs) reported.
+        self.num_events = 0
+        # The number of times that events were lost by the event source (after
+        # each of which, all the running processes were re-scanned).
+        self.num_events_lost = 0
+        # The number of processes that matched a rule, & the outcomes of their
+        # writes (as counted by `OomScoreAdjWriteReport`).
+        self.num_pids_matched = 0
+        self.num_applied = 0
+        self.num_skipped = 0
+        self.num_vanished = 0
+        self.num_denied = 0
+        # The number of processes that matched each rule (by rule number).
+        self.rule_match_counts = [0 for rule in rule_table.rules]
+        # The latency from each event until its process was matched & written.
+        self.num_latencies = 0
+        self.sum_latency_secs = 0.0
+        self.max_latency_secs = 0.0
+
+    @property
+    def mean_latency_secs(self):
+        return (self.sum_latency_secs / self.num_latencies) if self.num_latencies else 0.0
+
+    def __repr__(self):
+        return "%s(%s, mean_latency_secs=%r)" % (__class__.__name__,
+                ", ".join("%s=%r" % (a, getattr(self, a)) for a in self.__slots__),
+                self.mean_latency_secs)
+
+
+def apply_rules_to_events(rule_table, events, daemon_stats, dry_run=False, writer=None):
+    """Match & apply `rule_table` to the processes in the list `events`.
+
+    The `events` are `(pid, event_time_ns)`, as returned by the method
+    `wait_for_pids` of an event source from `_procevents`.
+
+    The writes are made by `writer`, as by `apply_matches`.
+
+    Return `(matches, errors)`, as from `match_processes` & `apply_matches`.
+    """
+    # The same PID may be reported more than once (eg, `fork` then `exec`),
+    # so measure the latency from its earliest event.
+    event_times = {}
+    for pid, event_time_ns in events:
+        if pid not in event_times or event_time_ns < event_times[pid]:
+            event_times[pid] = event_time_ns
+
+    matches = match_processes(rule_table, pids=event_times.keys())
+    (report, errors) = apply_matches(matches, dry_run, writer)
+
+    now_ns = monotonic_ns()
+    daemon_stats.num_events += len(events)
+    _add_matches_to_stats(matches, report, daemon_stats)
+    for event_time_ns in event_times.values():
+        latency_secs = max(now_ns - event_time_ns, 0) * 1e-9
+        daemon_stats.num_latencies += 1
+        daemon_stats.sum_latency_secs += latency_secs
+        if latency_secs > daemon_stats.max_latency_secs:
+            daemon_stats.max_latency_secs = latency_secs
+    return (matches, errors)
+
+
+def apply_rules_after_events_lost(rule_table, daemon_stats, dry_run=False, writer=None):
+    """Match & apply `rule_table` to ALL the running processes.
+
+    This is for when the event source has lost some events, so the processes
+    of those events are unknown.  (A process that already has the adjustment
+    of its rule is not written again.)
+
+    Return `(matches, errors)`, as from `match_processes` & `apply_matches`.
+    """
+    matches = match_processes(rule_table)
+    (report, errors) = apply_matches(matches, dry_run, writer)
+    daemon_stats.num_events_lost += 1
+    _add_matches_to_stats(matches, report, daemon_stats)
+    return (matches, errors)
+
+
+def _add_matches_to_stats(matches, report, daemon_stats):
+    daemon_stats.num_pids_matched += len(matches)
+    daemon_stats.num_applied += report.num_applied
+    daemon_stats.num_skipped += report.num_skipped
+    daemon_stats.num_vanished += report.num_vanished
+    daemon_stats.num_denied += report.num_denied
+    for m in matches:
+        daemon_stats.rule_match_counts[m.rule.rule_num] += 1
+
+
+def run_daemon(rule_table, event_source, daemon_stats, dry_run=False, on_applied=None):
+    """Apply `rule_table` to each new or exec'd process, forever.
+
+    The new processes are reported by `event_source` (from `_procevents`).
+    Only those processes are matched against the rules (rather than re-scanning
+    all the running processes); unless the event source lost some events (eg,
+    in a burst of `fork`s), in which case all the running processes are
+    re-scanned, so that no new process is missed.
+
+    After each batch of events, `on_applied(matches, errors)` is called (if not
+    `None`), with the results of `apply_rules_to_events`.
+
+    A single `OomScoreAdjWriter` is used for all the writes, so that the file
+    of a process that is written more than once (eg, after `fork` & `exec`) is
+    opened only once.
+    """
+    with OomScoreAdjWriter() as writer:
+        while True:
+            events = event_source.wait_for_pids(None)
+            if events is None:
+                (matches, errors) = apply_rules_after_events_lost(rule_table,
+                        daemon_stats, dry_run, writer)
+            elif events:
+                (matches, errors) = apply_rules_to_events(rule_table, events,
+                        daemon_stats, dry_run, writer)
+            else:
+                continue
+            if on_applied is not None:
+                on_applied(matches, errors)
@@ -0,0 +1,10 @@
+# Copyright (c) 2020 James Boyden <jboy@jboy.me>. All rights reserved.
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import os
+import sys
+
+# Allow the tests to be run from anywhere, without installing `psquery`.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
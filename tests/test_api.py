@@ -0,0 +1,84 @@
+# Copyright (c) 2020 James Boyden <jboy@jboy.me>. All rights reserved.
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Tests of the public query functions in `psquery.api`."""
+
+import asyncio
+import os
+from inspect import signature
+
+import pytest
+
+from psquery import _procio, api
+
+
+# The parameters of `query_fields` before any keyword parameters were added,
+# which may be passed positionally.
+_BASELINE_QUERY_FIELDS_PARAMS = ("fields_to_query", "selection_criteria",
+        "filtering_criteria", "sort_by_fields", "return_field_types",
+        "return_header_info", "use_base10_human_size")
+
+
+def test_query_fields_positional_params_are_unchanged():
+    param_names = tuple(signature(api.query_fields).parameters)
+    num_params = len(_BASELINE_QUERY_FIELDS_PARAMS)
+    assert param_names[:num_params] == _BASELINE_QUERY_FIELDS_PARAMS
+
+
+
+# A PID that is greater than the maximum `pid_max` (2**22), so that no
+# process can have it.
+_NONEXISTENT_PID = 2**22 + 1
+
+
+def test_pushed_down_pid_with_other_criteria():
+    fields_to_query = ("pid", "uid", "rszh", "cmds")
+    own_pid = api.ProcessPidEquals(os.getpid())
+    (expected,) = api.query_fields(fields_to_query, selection_criteria=(own_pid,))
+    # No process is owned by this UID, so only the pushed-down PID is selected.
+    nonexistent_uid = api.ProcessUidEquals(2**31 - 3)
+    (queried_proc,) = api.query_fields(fields_to_query,
+            selection_criteria=(nonexistent_uid, own_pid))
+    assert queried_proc._replace(rszh=None) == expected._replace(rszh=None)
+    assert queried_proc.rszh is not None
+
+
+def test_nonexistent_pids_are_skipped():
+    selection_criteria = (api.ProcessPidEquals(_NONEXISTENT_PID),)
+    for fields_to_query in (("pid",), ("pid", "adj"), ("pid", "rszk")):
+        assert api.query_fields(fields_to_query,
+                selection_criteria=selection_criteria) == []
+        assert list(api.iter_fields(fields_to_query,
+                pids=[-1, 0, _NONEXISTENT_PID])) == []
+        assert [p.pid for p in api.iter_fields(fields_to_query,
+                pids=[_NONEXISTENT_PID, os.getpid()])] == [os.getpid()]
+
+
+async def _collect(queried_processes):
+    return [queried_process async for queried_process in queried_processes]
+
+
+def test_aiter_fields_returns_query_stats(monkeypatch):
+    # Count the look-ups of the boot-time (a system-wide value).
+    num_lookups = []
+    read_boot_time = _procio._read_boot_time
+    monkeypatch.setattr(_procio, "_read_boot_time",
+            lambda: num_lookups.append(1) or read_boot_time())
+
+    (queried_processes, query_stats) = api.aiter_fields(("pid", "start"),
+            return_query_stats=True, batch_size=2)
+    pids = [p.pid for p in asyncio.run(_collect(queried_processes))]
+    assert os.getpid() in pids
+    assert query_stats.num_processes_selected == len(pids)
+    assert query_stats.num_files_opened >= len(pids)
+    # Many batches, but the boot-time is shared by all of them.
+    assert len(num_lookups) == 1
+
+
+def test_aiter_fields_validates_arguments():
+    with pytest.raises(ValueError):
+        api.aiter_fields(("pid",), batch_size=0)
+    with pytest.raises(ValueError):
+        api.aiter_fields(("pid",), limit=-1)
@@ -0,0 +1,54 @@
+# Copyright (c) 2020 James Boyden <jboy@jboy.me>. All rights reserved.
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Tests of the field functions & their memo caches in `psquery._fields`."""
+
+from psquery import api
+from psquery._fields import _format_date_time, _format_human_size, \
+        _format_time_delta, get_post_proc_settings, with_new_format_caches
+
+
+def test_human_size():
+    pps = get_post_proc_settings()
+    assert _format_human_size(0, None, pps) == "0.0 B "
+    assert _format_human_size(1536, None, pps) == "1.5 Ki"
+    assert _format_human_size(5 << 40, None, pps) == "5.0 Ti"
+    pps = get_post_proc_settings(use_base10_human_size=True)
+    assert _format_human_size(1500, None, pps) == "1.5 K"
+
+
+def test_time_caches_are_keyed_by_whole_seconds():
+    pps = get_post_proc_settings()
+    assert _format_time_delta(3661.2, None, pps) == "+01:01:01"
+    assert _format_time_delta(3661.7, None, pps) == "+01:01:01"
+    assert _format_date_time(1600000000.1, None, pps) == \
+            _format_date_time(1600000000.9, None, pps)
+    assert pps.format_caches.get_hits_and_misses() == (2, 2)
+
+
+def test_with_new_format_caches():
+    pps = get_post_proc_settings()
+    _format_time_delta(60.0, None, pps)
+    pps_copy = with_new_format_caches(pps)
+    assert pps_copy.format_caches is not pps.format_caches
+    assert pps_copy._replace(format_caches=None) == pps._replace(format_caches=None)
+    assert _format_time_delta(60.0, None, pps_copy) == _format_time_delta(60.0, None, pps)
+    assert pps_copy.format_caches.get_hits_and_misses() == (0, 1)
+    assert pps.format_caches.get_hits_and_misses() == (1, 1)
+
+
+def test_unreadable_smaps_fields_are_none():
+    # Eg, the "smaps_rollup" of another user's process can't be read.
+    smaps_field_names = ("pssk", "pssh", "ussk", "ussh", "swapk", "swaph")
+    (field_accessors, field_types, attr_names) = \
+            api._get_field_accessors(smaps_field_names)
+    assert attr_names == {"memory_full_info"}
+    pps = get_post_proc_settings()
+    for field_accessor in field_accessors:
+        value = api._get_field_value(field_accessor, {"memory_full_info": None}, 1, pps)
+        format_func = field_accessor[5]
+        if format_func is not None:
+            value = format_func(value, 1, pps)
+        assert value is None
@@ -0,0 +1,123 @@
+# Copyright (c) 2020 James Boyden <jboy@jboy.me>. All rights reserved.
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Tests of the static-attribute cache of `LiveQuery` in `psquery.api`."""
+
+import os
+import subprocess
+
+from psquery import api
+
+
+class _FakeSnapshot(object):
+    """A backend snapshot of the attributes in a `dict`; count each read."""
+
+    def __init__(self, attrs, num_reads):
+        self._attrs = attrs
+        self._num_reads = num_reads
+
+    def get_attrs(self, attr_names, oom_attr_names=()):
+        for a in attr_names:
+            self._num_reads[a] = self._num_reads.get(a, 0) + 1
+        return {a: self._attrs[a] for a in attr_names}
+
+
+def _make_iter_backend(procs, num_reads):
+    def _iter_backend(query_stats, pids=None):
+        for pid, attrs in sorted(procs.items()):
+            yield (pid, _FakeSnapshot(attrs, num_reads))
+    return _iter_backend
+
+
+def _refresh(iter_backend, attr_names):
+    return {pid: snapshot.get_attrs(attr_names)
+            for pid, snapshot in iter_backend(api.QueryStats())}
+
+
+def test_static_attrs_are_cached():
+    attrs = {"pid": 10, "create_time": 1.0, "comm": "app", "name": "app", "exe": "/usr/bin/app",
+            "cmdline": ["app", "--start"], "uids": (0, 0, 0), "rss": 100}
+    procs = {10: dict(attrs)}
+    num_reads = {}
+    cache = {}
+    iter_backend = api._iter_cached_backend(_make_iter_backend(procs, num_reads), cache)
+    attr_names = ("exe", "cmdline", "uids", "rss")
+    assert _refresh(iter_backend, attr_names) == {10: {a: attrs[a] for a in attr_names}}
+
+    # The process rewrites its command-line & drops its privileges.
+    procs[10].update(cmdline=["app: worker"], uids=(1000, 1000, 1000), rss=200)
+    assert _refresh(iter_backend, attr_names) == {10: {"exe": "/usr/bin/app",
+            "cmdline": ["app: worker"], "uids": (1000, 1000, 1000), "rss": 200}}
+    assert num_reads["exe"] == 1
+    assert num_reads["cmdline"] == 2
+    assert num_reads["uids"] == 2
+
+
+def test_cache_is_reset_by_new_identity():
+    procs = {10: {"pid": 10, "create_time": 1.0, "comm": "app", "exe": "/usr/bin/app"}}
+    cache = {}
+    iter_backend = api._iter_cached_backend(_make_iter_backend(procs, {}), cache)
+    assert _refresh(iter_backend, ("exe",)) == {10: {"exe": "/usr/bin/app"}}
+
+    # The process calls `execve`.
+    procs[10] = {"pid": 10, "create_time": 1.0, "comm": "exec", "exe": "/usr/bin/exec"}
+    assert _refresh(iter_backend, ("exe",)) == {10: {"exe": "/usr/bin/exec"}}
+
+    # The PID is re-used by a new process.
+    procs[10] = {"pid": 10, "create_time": 2.0, "comm": "exec", "exe": "/usr/bin/other"}
+    assert _refresh(iter_backend, ("exe",)) == {10: {"exe": "/usr/bin/other"}}
+
+    # The process exits.
+    del procs[10]
+    assert _refresh(iter_backend, ("exe",)) == {}
+    assert cache == {}
+
+
+def test_live_query_refresh():
+    live_query = api.LiveQuery(("pid", "exe", "cmds", "user", "rszk"),
+            selection_criteria=(api.ProcessPidEquals(os.getpid()),))
+    for i in range(2):
+        (queried_proc,) = live_query.refresh()
+        assert queried_proc.pid == os.getpid()
+        assert queried_proc.rszk > 0
+    assert live_query.num_cached_processes == 1
+
+
+def _get_num_files_opened(live_query, fields_to_query, selection_criteria):
+    # Refresh once to fill the cache.
+    live_query.refresh()
+    (live_procs, live_stats) = live_query.refresh(return_query_stats=True)
+    (procs, stats) = api.query_fields(fields_to_query,
+            selection_criteria=selection_criteria, return_query_stats=True)
+    assert [p.pid for p in live_procs] == [p.pid for p in procs]
+    return (live_stats.num_files_opened, stats.num_files_opened)
+
+
+def test_refresh_opens_no_more_files_than_query(tmp_path):
+    # The kernel truncates the "comm" of this process to 15 characters, so
+    # its `name` must be recovered from its command-line.
+    long_name = tmp_path / "a_very_long_executable_name"
+    long_name.symlink_to("/bin/sleep")
+    proc = subprocess.Popen([str(long_name), "60"])
+    try:
+        selection_criteria = (api.ProcessPidEquals(os.getpid()),
+                api.ProcessPidEquals(proc.pid))
+        for fields_to_query in (("pid", "rszk"),
+                ("user", "pid", "ppid", "start", "dtime", "vszh", "adj", "ooms", "cmds"),
+                ("pid", "exe", "exep", "rszk")):
+            live_query = api.LiveQuery(fields_to_query,
+                    selection_criteria=selection_criteria)
+            (num_live, num_query) = _get_num_files_opened(live_query,
+                    fields_to_query, selection_criteria)
+            assert num_live <= num_query
+            if "exe" in fields_to_query:
+                # The "cmdline" of the long-named process is not re-read.
+                assert num_live < num_query
+            if fields_to_query == ("pid", "rszk"):
+                # Nothing to cache, so the identity attributes aren't read.
+                assert live_query.num_cached_processes == 0
+    finally:
+        proc.kill()
+        proc.wait()
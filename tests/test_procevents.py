@@ -0,0 +1,143 @@
+# Copyright (c) 2020 James Boyden <jboy@jboy.me>. All rights reserved.
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Tests of the process event sources in `psquery._procevents`, and the daemon."""
+
+import errno
+import os
+import socket
+
+import pytest
+
+from psquery import _procevents, rules
+from psquery._procevents import ProcConnectorEvents
+
+
+class _FailingSocket(socket.socket):
+    """A readable socket, the `recv` of which raises `OSError(recv_errno)`."""
+
+    recv_errno = errno.ENOBUFS
+
+    def recv(self, bufsize, flags=0):
+        raise OSError(self.recv_errno, os.strerror(self.recv_errno))
+
+
+def _make_proc_connector_events(recv_errno):
+    (a, b) = socket.socketpair()
+    b.send(b"x")
+    sock = _FailingSocket(fileno=a.detach())
+    sock.recv_errno = recv_errno
+    # Don't subscribe to the real proc connector (which requires root).
+    event_source = ProcConnectorEvents.__new__(ProcConnectorEvents)
+    event_source.name = "netlink"
+    event_source.num_events = 0
+    event_source._sock = sock
+    event_source._pending_events = []
+    return (event_source, sock, b)
+
+
+def test_proc_connector_events_lost():
+    (event_source, sock, b) = _make_proc_connector_events(errno.ENOBUFS)
+    try:
+        assert event_source.wait_for_pids(0.0) is None
+    finally:
+        sock.close()
+        b.close()
+
+
+def test_proc_connector_other_errors_are_raised():
+    (event_source, sock, b) = _make_proc_connector_events(errno.EBADF)
+    try:
+        with pytest.raises(OSError):
+            event_source.wait_for_pids(0.0)
+    finally:
+        sock.close()
+        b.close()
+
+
+def _make_message(what, ack, event_data):
+    cn_data = _procevents._PROC_EVENT.pack(what, 0, 1000) + event_data
+    cn_msg = _procevents._CN_MSG.pack(_procevents.CN_IDX_PROC, _procevents.CN_VAL_PROC,
+            0, ack, len(cn_data), 0)
+    msg_len = _procevents._NLMSGHDR.size + len(cn_msg) + len(cn_data)
+    return _procevents._NLMSGHDR.pack(msg_len, 3, 0, 0, 0) + cn_msg + cn_data
+
+
+def _make_fork_message(child_pid):
+    return _make_message(_procevents.PROC_EVENT_FORK, 0,
+            _procevents._FORK_PROC_EVENT.pack(1, 1, child_pid, child_pid))
+
+
+def _make_ack_message(ack, err):
+    return _make_message(_procevents.PROC_EVENT_NONE, ack,
+            _procevents._ACK_PROC_EVENT.pack(err))
+
+
+def _make_ack_source(messages):
+    # A datagram socket (like netlink), into which the messages are sent.
+    (a, b) = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    for message in messages:
+        b.send(message)
+    event_source = ProcConnectorEvents.__new__(ProcConnectorEvents)
+    event_source.name = "netlink"
+    event_source.num_events = 0
+    event_source._sock = a
+    event_source._pending_events = []
+    return (event_source, a, b)
+
+
+def test_proc_connector_ack():
+    # The events that arrive before the acknowledgement are not lost; and
+    # the acknowledgement of another process's subscription is ignored.
+    (event_source, a, b) = _make_ack_source([_make_fork_message(100),
+            _make_ack_message(11, 0), _make_fork_message(101), _make_ack_message(43, 0)])
+    try:
+        event_source._wait_for_ack(42)
+        assert event_source.wait_for_pids(0.0) == [(100, 1000), (101, 1000)]
+        assert event_source.wait_for_pids(0.0) == []
+    finally:
+        a.close()
+        b.close()
+
+
+def test_proc_connector_ack_error():
+    (event_source, a, b) = _make_ack_source([_make_ack_message(43, errno.EPERM)])
+    try:
+        with pytest.raises(PermissionError):
+            event_source._wait_for_ack(42)
+    finally:
+        a.close()
+        b.close()
+
+
+def test_proc_connector_no_ack(monkeypatch):
+    # Eg, the caller is not in the initial PID & user namespaces.
+    monkeypatch.setattr(_procevents, "_ACK_TIMEOUT_SECS", 0.05)
+    (event_source, a, b) = _make_ack_source([_make_fork_message(100)])
+    try:
+        with pytest.raises(OSError) as exc_info:
+            event_source._wait_for_ack(42)
+        assert exc_info.value.errno == errno.ETIMEDOUT
+    finally:
+        a.close()
+        b.close()
+
+
+class _LostEvents(object):
+    name = "test"
+
+
+def test_apply_rules_after_events_lost():
+    rule_table = rules.compile_rules(
+            "if uid == %d { oom_score_adj = 0 }" % os.getuid())
+    daemon_stats = rules.DaemonStats(rule_table, _LostEvents())
+    (matches, errors) = rules.apply_rules_after_events_lost(rule_table, daemon_stats,
+            dry_run=True)
+    # At least this process was re-scanned & matched.
+    assert os.getpid() in [m.pid for m in matches]
+    assert daemon_stats.num_events_lost == 1
+    assert daemon_stats.num_events == 0
+    assert daemon_stats.num_pids_matched == len(matches)
+    assert daemon_stats.rule_match_counts == [len(matches)]
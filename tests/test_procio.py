@@ -0,0 +1,79 @@
+# Copyright (c) 2020 James Boyden <jboy@jboy.me>. All rights reserved.
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Tests of `psquery._procio`, using a synthetic proc-filesystem."""
+
+import pytest
+
+from psquery import _procio
+from psquery._procio import OomScoreAdjWriter, has_cap_sys_resource
+
+
+# `CapEff` with all capabilities, and without `CAP_SYS_RESOURCE` (bit 24).
+_ALL_CAPS = b"000001ffffffffff"
+_NO_SYS_RESOURCE = b"000001fffeffffff"
+_INITIAL_UID_MAP = b"         0          0 4294967295\n"
+_CONTAINER_UID_MAP = b"         0     100000      65536\n"
+
+
+@pytest.fixture
+def procfs(tmp_path, monkeypatch):
+    monkeypatch.setattr(_procio, "PROCFS_PATH", str(tmp_path))
+    (tmp_path / "self").mkdir()
+    for pid, oom_score_adj in ((100, 0), (101, 500)):
+        (tmp_path / str(pid)).mkdir()
+        (tmp_path / str(pid) / "oom_score_adj").write_bytes(b"%d\n" % oom_score_adj)
+    return tmp_path
+
+
+def _set_caps(procfs, cap_eff, uid_map=_INITIAL_UID_MAP):
+    (procfs / "self" / "status").write_bytes(b"Name:\ttest\nCapEff:\t%s\n" % cap_eff)
+    (procfs / "self" / "uid_map").write_bytes(uid_map)
+
+
+def test_has_cap_sys_resource(procfs):
+    _set_caps(procfs, _ALL_CAPS)
+    assert has_cap_sys_resource()
+    _set_caps(procfs, _NO_SYS_RESOURCE)
+    assert not has_cap_sys_resource()
+    # The capabilities of a user namespace don't count.
+    _set_caps(procfs, _ALL_CAPS, _CONTAINER_UID_MAP)
+    assert not has_cap_sys_resource()
+
+
+def test_dry_run_predicts_denied_lowering(procfs):
+    _set_caps(procfs, _NO_SYS_RESOURCE)
+    with OomScoreAdjWriter() as writer:
+        # Raise PID 100 (allowed); lower PID 101 (denied); PID 102 has vanished.
+        report = writer.write({100: 100, 101: -100, 102: 0}, {100: 0}, dry_run=True)
+    assert (report.num_applied, report.num_skipped, report.num_vanished,
+            report.num_denied) == (1, 0, 1, 1)
+    assert [pid for pid, e in report.failures if isinstance(e, PermissionError)] == [101]
+    # Nothing was written.
+    assert (procfs / "101" / "oom_score_adj").read_bytes() == b"500\n"
+
+
+def test_dry_run_allows_lowering_with_capability(procfs):
+    _set_caps(procfs, _ALL_CAPS)
+    with OomScoreAdjWriter() as writer:
+        report = writer.write({100: -1000, 101: -100}, dry_run=True)
+    assert (report.num_applied, report.num_denied) == (2, 0)
+
+
+def test_write_skips_unchanged_values(procfs):
+    with OomScoreAdjWriter() as writer:
+        report = writer.write({100: 0, 101: 300}, {100: 0, 101: 500})
+        assert (report.num_applied, report.num_skipped) == (1, 1)
+        # The kept file descriptor is re-used.
+        writer.write({101: 200})
+        assert writer.num_files_opened == 1
+    # (A regular file, unlike a "/proc" file, is appended by each write.)
+    assert (procfs / "101" / "oom_score_adj").read_bytes() == b"300\n200\n"
+
+
+def test_write_rejects_invalid_values(procfs):
+    with OomScoreAdjWriter() as writer:
+        with pytest.raises(ValueError):
+            writer.write({100: 1001})
@@ -0,0 +1,175 @@
+# Copyright (c) 2020 James Boyden <jboy@jboy.me>. All rights reserved.
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Tests of the rule parser & the `RuleTable` in `psquery.rules`."""
+
+import random
+from collections import namedtuple
+
+import pytest
+
+from psquery.rules import (Condition, Rule, RuleTable, compile_rules,
+        format_rules, parse_rules)
+
+
+# The fields of a process that are read by `RuleTable.match`.
+_Process = namedtuple("_Process", ("exe", "uid", "cmds"))
+
+_RULES_TEXT = r'''
+# Protect the shells.
+if exe == "bash" { oom_score_adj = -500 }
+
+if uid == 1000 && cmdline ^= "/usr/lib/chromium/chromium --type=renderer" {
+    oom_score_adj = 1000;
+}
+
+if exe ^= "py" && cmdline == "python3 \"quoted\" C:\\dir" {  # Trailing comment.
+    oom_score_adj = +300
+}
+'''
+
+_RULES = [
+    Rule(0, 3, (Condition("exe", "==", "bash"),), -500),
+    Rule(1, 5, (Condition("uid", "==", 1000),
+            Condition("cmdline", "^=", "/usr/lib/chromium/chromium --type=renderer")), 1000),
+    Rule(2, 9, (Condition("exe", "^=", "py"),
+            Condition("cmdline", "==", 'python3 "quoted" C:\\dir')), 300),
+]
+
+
+def _without_line_nums(rules):
+    return [rule._replace(line_num=None) for rule in rules]
+
+
+def test_parse_rules():
+    assert parse_rules(_RULES_TEXT) == _RULES
+    assert parse_rules("") == []
+    assert parse_rules("# Only a comment.\n\n") == []
+
+
+def test_format_rules_round_trip():
+    text = format_rules(_RULES)
+    assert _without_line_nums(parse_rules(text)) == _without_line_nums(_RULES)
+    assert format_rules(parse_rules(text)) == text
+
+
+def test_format_rules_rejects_newline():
+    rule = Rule(0, 1, (Condition("exe", "==", "a\nb"),), 0)
+    with pytest.raises(ValueError):
+        format_rules([rule])
+
+
+@pytest.mark.parametrize(("text", "message"), [
+    ('if exe == "bash" { oom_score_adj = 0 } $', "line 1: invalid syntax"),
+    ('if exe == "bash\n" { oom_score_adj = 0 }', "line 1: invalid syntax"),
+    ('\nexe == "bash" { oom_score_adj = 0 }', "line 2: expected 'if', found 'exe'"),
+    ('if exe == "bash" oom_score_adj = 0 }', "line 1: expected '{', found 'oom_score_adj'"),
+    ('if exe == "bash" { oom_score_adj = 0', "line 1: expected name, found end of rules"),
+    ('if exe == "bash" {\noom_score_adj = 0\noom_score_adj = 1\n}',
+            "line 3: duplicate action: oom_score_adj"),
+    ('if exe == "bash" {\n}', "line 1: rule has no action"),
+    ('if pid == 1 { oom_score_adj = 0 }', "line 1: invalid condition field: pid"),
+    ('if uid ^= 1 { oom_score_adj = 0 }', "line 1: invalid operator for uid: ^="),
+    ('if exe = "bash" { oom_score_adj = 0 }', "line 1: invalid operator for exe: ="),
+    ('if uid == "root" { oom_score_adj = 0 }', "line 1: invalid value for uid: 'root'"),
+    ('if exe == 1 { oom_score_adj = 0 }', "line 1: invalid value for exe: 1"),
+    ('if exe == bash { oom_score_adj = 0 }', "line 1: invalid value for exe: 'bash'"),
+    ('if exe == "bash" { nice = 0 }', "line 1: invalid action field: nice"),
+    ('if exe == "bash" { oom_score_adj = "0" }', "line 1: expected int, found '0'"),
+    ('if exe == "bash" {\noom_score_adj =\n1001 }', "line 3: invalid oom_score_adj: 1001"),
+    ('if exe == "bash" { oom_score_adj = -1001 }', "line 1: invalid oom_score_adj: -1001"),
+])
+def test_parse_errors(text, message):
+    with pytest.raises(ValueError) as exc_info:
+        parse_rules(text)
+    assert str(exc_info.value).startswith(message)
+
+
+def test_field_names():
+    assert compile_rules("").field_names == ()
+    assert compile_rules('if uid == 0 { oom_score_adj = 0 }').field_names == ("uid",)
+    assert compile_rules(_RULES_TEXT).field_names == ("exe", "uid", "cmds")
+
+
+def test_first_rule_wins_across_indexes():
+    # Each rule is indexed in a different look-up table; the lowest rule
+    # number must win, regardless of which table a rule was found in.
+    table = compile_rules('''
+        if exe ^= "chr" { oom_score_adj = 1 }
+        if cmdline ^= "chromium --type" { oom_score_adj = 2 }
+        if uid == 1000 { oom_score_adj = 3 }
+        if exe == "chromium" { oom_score_adj = 4 }
+        if cmdline == "chromium --type=renderer" { oom_score_adj = 5 }
+    ''')
+    process = _Process("chromium", 1000, "chromium --type=renderer")
+    assert table.match(process).rule_num == 0
+    assert table.match(process._replace(exe="chromium-browser")).rule_num == 0
+    assert table.match(process._replace(exe="x")).rule_num == 1
+    assert table.match(_Process("x", 1000, "chromium --type=renderer")).rule_num == 1
+    assert table.match(_Process("x", 1000, "x")).rule_num == 2
+    assert table.match(_Process("chromium", 0, "x")).rule_num == 0
+    assert table.match(_Process("xchromium", 0, "x")) is None
+    assert table.match(_Process("x", 0, "chromium --type=renderer")).rule_num == 1
+    assert table.match(_Process("x", 0, "x")) is None
+
+
+def test_residual_conditions():
+    table = compile_rules('''
+        if exe == "python3" && uid == 0 { oom_score_adj = -100 }
+        if exe == "python3" && cmdline ^= "python3 -m http.server" { oom_score_adj = 500 }
+        if exe ^= "python" { oom_score_adj = 100 }
+    ''')
+    assert table.match(_Process("python3", 0, "python3 -m http.server")).rule_num == 0
+    assert table.match(_Process("python3", 1000, "python3 -m http.server")).rule_num == 1
+    assert table.match(_Process("python3", 1000, "python3 x.py")).rule_num == 2
+    assert table.match(_Process("python3", 1000, None)).rule_num == 2
+    assert table.match(_Process("python2", 0, "python2")).rule_num == 2
+    assert table.match(_Process("pytho", 0, "python3")) is None
+    assert table.match(_Process(None, 0, None)) is None
+
+
+def test_longest_prefix_is_indexed():
+    # Both prefixes must match; the shorter one is tested as a residual.
+    table = compile_rules('if exe ^= "a" && exe ^= "abc" { oom_score_adj = 0 }')
+    assert table.match(_Process("abcd", 0, None)).rule_num == 0
+    assert table.match(_Process("abx", 0, None)) is None
+
+
+def _naive_match(rules, process):
+    values = {"exe": process.exe, "uid": process.uid, "cmdline": process.cmds}
+    for rule in rules:
+        for cond in rule.conditions:
+            value = values[cond.field]
+            if cond.op == "==" and value != cond.value:
+                break
+            if cond.op == "^=" and (value is None or not value.startswith(cond.value)):
+                break
+        else:
+            return rule
+    return None
+
+
+def test_match_is_equivalent_to_testing_each_rule_in_order():
+    rng = random.Random(1)
+    strings = ["", "a", "ab", "abc", "b", "ba"]
+    uids = [0, 1, 2]
+
+    def random_condition():
+        field = rng.choice(("exe", "uid", "cmdline"))
+        if field == "uid":
+            return Condition(field, "==", rng.choice(uids))
+        return Condition(field, rng.choice(("==", "^=")), rng.choice(strings))
+
+    for _ in range(50):
+        rules = [Rule(rule_num, rule_num + 1,
+                        tuple(random_condition() for _ in range(rng.randint(1, 3))),
+                        rule_num)
+                for rule_num in range(rng.randint(1, 10))]
+        table = RuleTable(rules)
+        for exe in strings + [None]:
+            for uid in uids:
+                for cmdline in strings + [None]:
+                    process = _Process(exe, uid, cmdline)
+                    assert table.match(process) == _naive_match(rules, process)
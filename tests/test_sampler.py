@@ -0,0 +1,134 @@
+# Copyright (c) 2020 James Boyden <jboy@jboy.me>. All rights reserved.
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Tests of `psquery._sampler.MemorySampler` & its ring buffers."""
+
+from collections import namedtuple
+
+import pytest
+
+from psquery._sampler import MemorySampler
+
+
+Proc = namedtuple("Proc", ("pid", "starts", "rszk", "ooms"))
+
+
+def _samples(sampler, pid, field_name="rszk"):
+    ring = sampler._rings[pid]
+    value_idx = sampler.fields_to_sample.index(field_name)
+    return list(reversed(list(ring.iter_samples_backwards(value_idx))))
+
+
+def test_ring_reconstructs_samples():
+    sampler = MemorySampler(max_samples_per_pid=100)
+    for t in range(20):
+        sampler.add_samples([Proc(10, 1.0, 1000 + t * t, 500 - t)], sample_time=t)
+    assert _samples(sampler, 10) == [(t * 1000, 1000 + t * t) for t in range(20)]
+    assert _samples(sampler, 10, "ooms") == [(t * 1000, 500 - t) for t in range(20)]
+    assert sampler.num_samples == 20
+
+
+def test_ring_evicts_oldest_after_wrapping():
+    sampler = MemorySampler(max_samples_per_pid=5)
+    for t in range(23):
+        sampler.add_samples([Proc(10, 1.0, t * 7, 0)], sample_time=t)
+    assert _samples(sampler, 10) == [(t * 1000, t * 7) for t in range(18, 23)]
+    assert sampler.num_samples == 5
+
+
+def test_sample_times_are_bounded():
+    sampler = MemorySampler(max_samples_per_pid=10)
+    for t in range(1000):
+        sampler.add_samples([Proc(10, 1.0, t, t)], sample_time=t)
+    assert sampler.num_samples == 10
+    assert len(sampler._sample_times) <= 10
+
+
+def test_memory_budget_evicts_oldest_round():
+    # 3 fields of 4 bytes per sample (time, rszk, ooms); 2 processes.
+    sampler = MemorySampler(memory_budget_bytes=(12 * 8), max_samples_per_pid=100)
+    for t in range(10):
+        sampler.add_samples([Proc(10, 1.0, t, 0), Proc(11, 1.0, t, 0)], sample_time=t)
+    assert sampler.num_samples <= 8
+    assert _samples(sampler, 10) == [(t * 1000, t) for t in range(6, 10)]
+    assert _samples(sampler, 11) == [(t * 1000, t) for t in range(6, 10)]
+
+
+def test_memory_budget_counts_allocated_storage():
+    # A single process: its buffer can't grow beyond the budget.
+    sampler = MemorySampler(memory_budget_bytes=800)
+    for t in range(200):
+        sampler.add_samples([Proc(10, 1.0, t, 0)], sample_time=t)
+        assert sampler.num_bytes <= 800
+    assert _samples(sampler, 10)[-1] == (199000, 199)
+
+    # A long-lived process, then many later processes: the buffer of the
+    # long-lived process must be shrunk after its oldest samples are evicted.
+    budget = 80000
+    sampler = MemorySampler(memory_budget_bytes=budget)
+    for t in range(3000):
+        sampler.add_samples([Proc(10, 1.0, t, 0)], sample_time=t)
+        assert sampler.num_bytes <= budget
+    for t in range(3000, 3100):
+        sampler.add_samples([Proc(10, 1.0, t, 0)] +
+                [Proc(pid, 2.0, t, 0) for pid in range(11, 209)], sample_time=t)
+        assert sampler.num_bytes <= budget
+    assert len(sampler) == 199
+    assert _samples(sampler, 10)[-1] == (3099000, 3099)
+    assert _samples(sampler, 11)[-1] == (3099000, 3099)
+
+
+def test_exited_and_reused_pids_are_discarded():
+    sampler = MemorySampler()
+    sampler.add_samples([Proc(10, 1.0, 100, 0), Proc(11, 1.0, 100, 0)], sample_time=0)
+    sampler.add_samples([Proc(10, 2.0, 200, 0)], sample_time=1)
+    assert len(sampler) == 1
+    # PID 10 was re-used (by a process with a different start time).
+    assert _samples(sampler, 10) == [(1000, 200)]
+    assert sampler.num_samples == 1
+
+
+def test_none_is_stored_as_previous_value():
+    sampler = MemorySampler()
+    sampler.add_samples([Proc(10, 1.0, 100, 5)], sample_time=0)
+    sampler.add_samples([Proc(10, 1.0, None, 6)], sample_time=1)
+    assert _samples(sampler, 10) == [(0, 100), (1000, 100)]
+
+
+def test_overflowing_delta_restarts_ring():
+    sampler = MemorySampler()
+    sampler.add_samples([Proc(10, 1.0, 0, 0)], sample_time=0)
+    sampler.add_samples([Proc(10, 1.0, 1 << 40, 0)], sample_time=1)
+    assert _samples(sampler, 10) == [(1000, 1 << 40)]
+    assert sampler.num_samples == 1
+
+
+def test_slopes():
+    sampler = MemorySampler()
+    for t in range(10):
+        sampler.add_samples([Proc(10, 1.0, 1000 + 50 * t, 0), Proc(11, 1.0, 7, 0)],
+                sample_time=(100.0 + t))
+    assert sampler.get_slope(10, "rszk", 60.0) == pytest.approx(50.0)
+    # Only the samples in the window (the last 3 seconds, ie 4 samples).
+    assert sampler.get_slope(10, "rszk", 3.0) == pytest.approx(50.0)
+    assert sampler.get_slopes("rszk", 60.0) == pytest.approx({10: 50.0, 11: 0.0})
+    assert sampler.get_slope(12, "rszk", 60.0) is None
+    with pytest.raises(ValueError):
+        sampler.get_slope(10, "vszk", 60.0)
+
+
+def test_slope_needs_two_samples():
+    sampler = MemorySampler()
+    sampler.add_samples([Proc(10, 1.0, 1000, 0)], sample_time=0)
+    assert sampler.get_slope(10, "rszk", 60.0) is None
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        MemorySampler(())
+    with pytest.raises(ValueError):
+        MemorySampler(("exe",))
+    with pytest.raises(ValueError):
+        MemorySampler(max_samples_per_pid=1)
@@ -0,0 +1,135 @@
+# Copyright (c) 2020 James Boyden <jboy@jboy.me>. All rights reserved.
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Tests of the snapshot file format in `psquery._snapshots`."""
+
+import os
+
+import pytest
+
+from psquery import api
+from psquery._procio import OvercommitSettings
+from psquery._snapshots import SnapshotReader, SnapshotWriter
+
+
+_FIELD_NAMES = ("pid", "exe", "rszk", "memp")
+_TYPECODES = (b"q", b"I", b"q", b"d")
+_MEMORY_INFO = (1000, 200, 300, 400, 40.0, 500, 600, 700, 800)
+_OVERCOMMIT_SETTINGS = OvercommitSettings(0, "heuristic overcommit (default)", 50)
+
+
+def _make_rows(snapshot_num):
+    return [
+        (1, "init", 100 + snapshot_num, 0.5),
+        (2, None, None, None),
+        (3, "bash", 300 + snapshot_num, 1.5),
+        (4, "bash", 400 + snapshot_num, 2.5),
+    ]
+
+
+def _write_snapshots(path, snapshot_nums):
+    with SnapshotWriter(path, _FIELD_NAMES, _TYPECODES) as writer:
+        for snapshot_num in snapshot_nums:
+            writer.write_snapshot(_make_rows(snapshot_num), _MEMORY_INFO,
+                    _OVERCOMMIT_SETTINGS, 1600000000.0 + snapshot_num)
+
+
+def _read_all_rows(path):
+    with SnapshotReader(path) as reader:
+        return [[tuple(row) for row in reader.iter_rows(idx)]
+                for idx in range(len(reader))]
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "test.snap")
+    _write_snapshots(path, (0, 1))
+    assert _read_all_rows(path) == [_make_rows(0), _make_rows(1)]
+
+    with SnapshotReader(path) as reader:
+        assert reader.field_names == _FIELD_NAMES
+        header = reader.read_header(1)
+        assert header.snapshot_time == 1600000001.0
+        assert header.memory_info == _MEMORY_INFO
+        assert header.overcommit_settings == _OVERCOMMIT_SETTINGS
+        assert header.num_rows == 4
+        with pytest.raises(IndexError):
+            reader.read_header(2)
+
+
+def test_append_to_existing_file(tmp_path):
+    path = str(tmp_path / "test.snap")
+    _write_snapshots(path, (0,))
+    _write_snapshots(path, (1, 2))
+    assert _read_all_rows(path) == [_make_rows(0), _make_rows(1), _make_rows(2)]
+
+
+def test_incomplete_last_record_is_ignored(tmp_path):
+    path = str(tmp_path / "test.snap")
+    _write_snapshots(path, (0, 1))
+    os.truncate(path, os.path.getsize(path) - 50)
+    assert _read_all_rows(path) == [_make_rows(0)]
+
+
+def test_append_after_incomplete_last_record(tmp_path):
+    # A writer that was interrupted leaves an incomplete last record; the next
+    # writer must truncate it, so that the new records are framed correctly.
+    path = str(tmp_path / "test.snap")
+    _write_snapshots(path, (0, 1))
+    os.truncate(path, os.path.getsize(path) - 50)
+    _write_snapshots(path, (2, 3))
+    assert _read_all_rows(path) == [_make_rows(0), _make_rows(2), _make_rows(3)]
+
+
+def test_append_after_incomplete_length_prefix(tmp_path):
+    path = str(tmp_path / "test.snap")
+    _write_snapshots(path, (0,))
+    with open(path, "ab") as f:
+        # Less than a whole length prefix.
+        f.write(b"\x10\x00")
+    _write_snapshots(path, (1,))
+    assert _read_all_rows(path) == [_make_rows(0), _make_rows(1)]
+
+
+def test_recorder_after_incomplete_last_record(tmp_path):
+    path = str(tmp_path / "test.snap")
+    fields_to_record = ("pid", "exe", "rszk")
+    selection_criteria = (api.ProcessPidEquals(os.getpid()),)
+    for i in range(2):
+        with api.SnapshotRecorder(path, fields_to_record, selection_criteria) as recorder:
+            recorder.record()
+    os.truncate(path, os.path.getsize(path) - 10)
+    with api.SnapshotRecorder(path, fields_to_record, selection_criteria) as recorder:
+        recorder.record()
+
+    with api.SnapshotFile(path) as snapshot_file:
+        assert len(snapshot_file) == 2
+        (queried_proc,) = snapshot_file.query(-1)
+        assert queried_proc.pid == os.getpid()
+
+
+def test_different_fields_are_rejected(tmp_path):
+    path = str(tmp_path / "test.snap")
+    _write_snapshots(path, (0,))
+    with pytest.raises(ValueError):
+        SnapshotWriter(path, _FIELD_NAMES[:2], _TYPECODES[:2])
+
+
+def test_not_a_snapshot_file(tmp_path):
+    path = str(tmp_path / "test.snap")
+    with open(path, "wb") as f:
+        f.write(b"this is not a snapshot file")
+    with pytest.raises(ValueError):
+        SnapshotReader(path)
+    with pytest.raises(ValueError):
+        SnapshotWriter(path, _FIELD_NAMES, _TYPECODES)
+
+
+def test_close_after_partial_iteration(tmp_path):
+    path = str(tmp_path / "test.snap")
+    _write_snapshots(path, (0,))
+    reader = SnapshotReader(path)
+    rows = reader.iter_rows(0)
+    assert tuple(next(rows)) == _make_rows(0)[0]
+    reader.close()
@@ -0,0 +1,89 @@
+# Copyright (c) 2020 James Boyden <jboy@jboy.me>. All rights reserved.
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Tests of the top-N query mode (`limit`) in `psquery.api`."""
+
+import random
+from collections import namedtuple
+from itertools import product
+
+import pytest
+
+from psquery import api
+
+
+# Field `idx` is the original position of each row (to test stability).
+_Row = namedtuple("_Row", ("idx", "a", "b", "c"))
+
+
+def _make_rows(rng, num_rows):
+    # Few distinct values, so that there are many ties.
+    return [_Row(idx, rng.randrange(3), rng.choice("xyz"), rng.random() < 0.5)
+            for idx in range(num_rows)]
+
+
+def _sort_then_truncate(sort_by_fields, rows, limit):
+    rows = list(rows)
+    api._sort_selected_processes(sort_by_fields, rows, None)
+    return rows[:limit]
+
+
+@pytest.mark.parametrize("reverses", [
+    reverses
+    for num_fields in (1, 2, 3)
+    for reverses in product((False, True), repeat=num_fields)
+])
+def test_select_top_n_is_sort_then_truncate(reverses):
+    rng = random.Random(len(reverses))
+    sort_by_fields = tuple(api.SortByField(field_name, reverse)
+            for field_name, reverse in zip(("a", "b", "c"), reverses))
+    for num_rows in (0, 1, 5, 50):
+        rows = _make_rows(rng, num_rows)
+        for limit in (0, 1, 3, 50, 100):
+            assert (api._select_top_n(iter(rows), limit, sort_by_fields) ==
+                    _sort_then_truncate(sort_by_fields, rows, limit))
+
+
+def test_select_top_n_without_sort_by_fields():
+    rows = _make_rows(random.Random(0), 10)
+    consumed = []
+
+    def iter_rows():
+        for row in rows:
+            consumed.append(row)
+            yield row
+
+    assert api._select_top_n(iter_rows(), 3, ()) == rows[:3]
+    # Stop iterating after the first `limit` rows.
+    assert len(consumed) == 3
+
+
+def test_mixed_sort_key():
+    MixedSortKey = api._get_mixed_sort_key(("a", "b"), (False, True))
+    rows = [_Row(0, 1, "x", False), _Row(1, 1, "y", False), _Row(2, 0, "x", False),
+            _Row(3, 1, "y", True)]
+    keys = [MixedSortKey(row) for row in rows]
+    assert keys[1] < keys[0]
+    assert not keys[0] < keys[1]
+    assert keys[2] < keys[1]
+    assert keys[1] == keys[3]
+    assert not keys[1] < keys[3] and not keys[3] < keys[1]
+    assert sorted(rows, key=MixedSortKey) == [rows[2], rows[1], rows[3], rows[0]]
+
+
+def test_query_with_limit():
+    fields_to_query = ("pid", "ppid", "uid")
+    sort_by_fields = (api.SortByField("uid", reverse=True), api.SortByField("ppid"),
+            api.SortByField("pid", reverse=True))
+    all_processes = api.query_fields(fields_to_query, sort_by_fields=sort_by_fields)
+    top_processes = api.query_fields(fields_to_query, sort_by_fields=sort_by_fields,
+            limit=5)
+    # Processes might start or exit between the 2 queries, so only compare
+    # the processes that are in both.
+    pids = set(proc.pid for proc in all_processes)
+    top_processes = [proc for proc in top_processes if proc.pid in pids]
+    top_pids = set(proc.pid for proc in top_processes)
+    assert len(top_processes) <= 5
+    assert [proc for proc in all_processes if proc.pid in top_pids] == top_processes
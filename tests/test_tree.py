@@ -0,0 +1,100 @@
+# Copyright (c) 2020 James Boyden <jboy@jboy.me>. All rights reserved.
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Tests of the `ProcessTree` in `psquery._tree`."""
+
+import os
+from collections import namedtuple
+
+from psquery import api
+from psquery._tree import ProcessTree
+
+
+_Row = namedtuple("_Row", ("pid", "ppid", "rszk"))
+
+# 1 -> (10 -> (100, 101), 11); 50 (whose parent 5 is not in the rows).
+_ROWS = [
+    _Row(10, 1, 1000),
+    _Row(100, 10, 10),
+    _Row(1, 0, 1),
+    _Row(50, 5, None),
+    _Row(101, 10, None),
+    _Row(11, 1, 100),
+]
+
+
+def test_roots_and_children():
+    tree = ProcessTree(_ROWS)
+    assert len(tree) == 6
+    assert tree.roots == [2, 3]
+    assert tree.get_children(2) == (0, 5)
+    assert tree.get_children(0) == (1, 4)
+    assert tree.get_children(1) == ()
+    assert tree.get_parent(1) == 0
+    assert tree.get_parent(2) is None
+    assert tree.get_parent(3) is None
+
+
+def test_iter_depth_first():
+    tree = ProcessTree(_ROWS)
+    assert list(tree.iter_depth_first()) == [
+            (0, 2), (1, 0), (2, 1), (2, 4), (1, 5), (0, 3)]
+
+
+def test_sum_and_max_subtrees():
+    tree = ProcessTree(_ROWS)
+    assert tree.sum_subtrees("rszk") == [1010, 10, 1111, None, None, 100]
+    assert tree.max_subtrees("rszk") == [1000, 10, 1000, None, None, 100]
+
+
+def test_sum_subtrees_of_none_root():
+    rows = [_Row(1, 0, None), _Row(2, 1, None), _Row(3, 1, 5)]
+    assert ProcessTree(rows).sum_subtrees("rszk") == [5, None, 5]
+
+
+def test_process_is_its_own_parent():
+    rows = [_Row(0, 0, 1), _Row(1, 0, 2)]
+    tree = ProcessTree(rows)
+    assert tree.roots == [0]
+    assert tree.get_children(0) == (1,)
+    assert tree.sum_subtrees("rszk") == [3, 2]
+
+
+def test_cycle_is_broken():
+    # 1 -> 2 -> 3 -> 1 is a cycle; 4 is a descendant of the cycle, & 5 is a
+    # descendant of 4; 6 is a separate tree.
+    rows = [_Row(4, 1, 4), _Row(5, 4, 5), _Row(1, 3, 1), _Row(2, 1, 2),
+            _Row(3, 2, 3), _Row(6, 0, 6)]
+    tree = ProcessTree(rows)
+    assert tree.roots == [5, 2]
+    # Only the link between 2 processes in the cycle is broken.
+    assert tree.get_parent(0) == 2
+    assert tree.get_parent(1) == 0
+    assert tree.get_children(2) == (0, 3)
+    assert sorted(idx for depth, idx in tree.iter_depth_first()) == list(range(6))
+    assert tree.sum_subtrees("rszk") == [9, 5, 15, 5, 3, 6]
+
+
+def test_deep_tree():
+    # Deeper than Python's recursion limit.
+    num_rows = 10000
+    rows = [_Row(pid, pid - 1, 1) for pid in range(1, num_rows + 1)]
+    tree = ProcessTree(rows)
+    assert tree.roots == [0]
+    assert list(tree.iter_depth_first())[-1] == (num_rows - 1, num_rows - 1)
+    assert tree.sum_subtrees("rszk")[0] == num_rows
+
+
+def test_query_returns_process_tree():
+    (queried_processes, tree) = api.query_fields(("pid", "rszk"),
+            return_process_tree=True)
+    # The rows of the tree are in the same order as the queried processes.
+    pids = [proc.pid for proc in queried_processes]
+    assert [row.pid for row in tree.rows] == pids
+    own_idx = pids.index(os.getpid())
+    parent_idx = tree.get_parent(own_idx)
+    if parent_idx is not None:
+        assert pids[parent_idx] == os.getppid()
+        assert own_idx in tree.get_children(parent_idx)